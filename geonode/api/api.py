@@ -1,4 +1,5 @@
 import json
+import operator
 import time
 
 from django.conf.urls import url
@@ -6,18 +7,19 @@ from django.contrib.auth import get_user_model
 from django.core.urlresolvers import reverse
 from django.contrib.contenttypes.models import ContentType
 from django.conf import settings
-from django.db.models import Count
+from django.db.models import Count, F, Q
 
 from avatar.templatetags.avatar_tags import avatar_url
 from guardian.shortcuts import get_objects_for_user
 
-from geonode.base.models import ResourceBase
 from geonode.base.models import TopicCategory
 from geonode.base.models import Region
 from geonode.layers.models import Layer
 from geonode.maps.models import Map
 from geonode.documents.models import Document
 from geonode.groups.models import GroupProfile
+from geonode.utils import bbox_intervals
+from geonode.base.counts import cached_counts, get_viewable_resources
 
 from taggit.models import Tag
 from django.core.serializers.json import DjangoJSONEncoder
@@ -25,6 +27,7 @@ from tastypie.serializers import Serializer
 from tastypie import fields
 from tastypie.resources import ModelResource
 from tastypie.constants import ALL
+from tastypie.exceptions import BadRequest
 from tastypie.utils import trailing_slash
 
 
@@ -35,29 +38,68 @@ FILTER_TYPES = {
 }
 
 
+def parse_extent(extent):
+    """
+    Parses an extent parameter, 'west,south,east,north' in lat lon
+    """
+    try:
+        x0, y0, x1, y1 = [float(c) for c in extent.split(',')]
+    except ValueError:
+        raise BadRequest("Invalid extent '%s' provided." % extent)
+    return x0, y0, x1, y1
+
+
+def filter_bbox(queryset, extent):
+    """
+    Restricts the queryset to the resources whose bounding box intersects
+    the extent. Both the extent and the bounding boxes can cross the
+    antimeridian.
+    """
+    x0, y0, x1, y1 = parse_extent(extent)
+    intersects = Q(bbox_y0__lte=y1, bbox_y1__gte=y0)
+
+    intervals = bbox_intervals(x0, x1)
+    if intervals:
+        # a bounding box crossing the antimeridian has bbox_x0 > bbox_x1
+        regular = Q(bbox_x0__lte=F('bbox_x1'))
+        crossing = Q(bbox_x0__gt=F('bbox_x1'))
+        longitudes = [
+            (regular & Q(bbox_x0__lte=right, bbox_x1__gte=left)) |
+            (crossing & (Q(bbox_x0__lte=right) | Q(bbox_x1__gte=left)))
+            for left, right in intervals]
+        intersects &= reduce(operator.or_, longitudes)
+
+    return queryset.filter(intersects)
+
+
 class CountJSONSerializer(Serializer):
     """Custom serializer to post process the api and add counts"""
 
     def get_resources_counts(self, options):
-        if settings.SKIP_PERMS_FILTER:
-            resources = ResourceBase.objects.all()
-        else:
-            resources = get_objects_for_user(
-                options['user'],
-                'base.view_resourcebase'
-            )
-        if settings.RESOURCE_PUBLISHING:
-            resources = resources.filter(is_published=True)
+        def compute():
+            resources = get_viewable_resources(options['user'])
+
+            if options['title_filter']:
+                resources = resources.filter(title__icontains=options['title_filter'])
+
+            if options['type_filter']:
+                resources = resources.instance_of(options['type_filter'])
 
-        if options['title_filter']:
-            resources = resources.filter(title__icontains=options['title_filter'])
+            if options.get('extent_filter'):
+                resources = filter_bbox(resources, options['extent_filter'])
 
-        if options['type_filter']:
-            resources = resources.instance_of(options['type_filter'])
+            counts = list(resources.values(options['count_type']).annotate(count=Count(options['count_type'])))
 
-        counts = list(resources.values(options['count_type']).annotate(count=Count(options['count_type'])))
+            return dict([(c[options['count_type']], c['count']) for c in counts])
 
-        return dict([(c[options['count_type']], c['count']) for c in counts])
+        type_filter = options['type_filter']
+        return cached_counts(
+            options['user'],
+            options['count_type'],
+            compute,
+            options['title_filter'],
+            type_filter.__name__ if type_filter else None,
+            options.get('extent_filter'))
 
     def to_json(self, data, options=None):
         options = options or {}
@@ -82,6 +124,7 @@ class TypeFilteredResource(ModelResource):
     def build_filters(self, filters={}):
         self.type_filter = None
         self.title_filter = None
+        self.extent_filter = None
 
         orm_filters = super(TypeFilteredResource, self).build_filters(filters)
 
@@ -91,12 +134,15 @@ class TypeFilteredResource(ModelResource):
             self.type_filter = None
         if 'title__icontains' in filters:
             self.title_filter = filters['title__icontains']
+        if 'extent' in filters:
+            self.extent_filter = filters['extent']
 
         return orm_filters
 
     def serialize(self, request, data, format, options={}):
         options['title_filter'] = getattr(self, 'title_filter', None)
         options['type_filter'] = getattr(self, 'type_filter', None)
+        options['extent_filter'] = getattr(self, 'extent_filter', None)
         options['user'] = request.user
 
         return super(TypeFilteredResource, self).serialize(request, data, format, options)
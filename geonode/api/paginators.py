@@ -0,0 +1,106 @@
+import base64
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from tastypie.exceptions import BadRequest
+from tastypie.paginator import Paginator
+
+# orderings a cursor can walk, the id of the resources breaks the ties
+CURSOR_ORDERINGS = ('-date', 'date', '-title', 'title')
+
+
+class CursorPaginator(Paginator):
+
+    """
+    Keyset pagination: instead of an offset each page carries a cursor with
+    the ordering value and the id of its last resource, and the next page
+    starts right after it, so fetching any page costs the same.
+
+    The first page is requested with an empty ``cursor`` parameter, the
+    following ones with the cursor found in the ``next`` link. The results
+    are ordered by ``order_by``, one of CURSOR_ORDERINGS, defaulting to -date.
+    The total count is not computed, it would need to scan the whole set.
+    """
+
+    def __init__(self, request_data, objects, **kwargs):
+        super(CursorPaginator, self).__init__(request_data, objects, **kwargs)
+        self.cursor = request_data.get('cursor') or None
+
+    def get_ordering(self):
+        if self.cursor:
+            return self.decode_cursor(self.cursor)[0]
+
+        ordering = self.request_data.get('order_by', '-date')
+        if ordering not in CURSOR_ORDERINGS:
+            raise BadRequest(
+                "Invalid order_by '%s' provided, cursors support %s." % (ordering, ', '.join(CURSOR_ORDERINGS)))
+        return ordering
+
+    def encode_cursor(self, ordering, value, pk):
+        if hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        return base64.urlsafe_b64encode(json.dumps([ordering, value, pk]))
+
+    def decode_cursor(self, cursor):
+        try:
+            ordering, value, pk = json.loads(base64.urlsafe_b64decode(str(cursor)))
+            if ordering not in CURSOR_ORDERINGS:
+                raise ValueError(ordering)
+            if ordering.lstrip('-') == 'date':
+                value = parse_datetime(value)
+                if value is None:
+                    raise ValueError(cursor)
+            return ordering, value, int(pk)
+        except (TypeError, ValueError):
+            raise BadRequest("Invalid cursor '%s' provided." % cursor)
+
+    def get_slice(self, limit, ordering):
+        field = ordering.lstrip('-')
+        descending = ordering.startswith('-')
+        objects = self.objects.order_by(ordering, '-id' if descending else 'id')
+
+        if self.cursor:
+            value, pk = self.decode_cursor(self.cursor)[1:]
+            if descending:
+                after = Q(**{'%s__lt' % field: value}) | Q(**{field: value, 'id__lt': pk})
+            else:
+                after = Q(**{'%s__gt' % field: value}) | Q(**{field: value, 'id__gt': pk})
+            objects = objects.filter(after)
+
+        if limit == 0:
+            return objects, None
+
+        # one more key tells whether there is a next page
+        keys = list(objects.values_list(field, 'id')[:limit + 1])
+        if len(keys) <= limit:
+            return objects[:limit], None
+        value, pk = keys[limit - 1]
+        return objects[:limit], self.encode_cursor(ordering, value, pk)
+
+    def _generate_cursor_uri(self, limit, cursor):
+        if self.resource_uri is None:
+            return None
+
+        request_params = self.request_data.copy()
+        for param in ('limit', 'offset', 'cursor', 'order_by'):
+            if param in request_params:
+                del request_params[param]
+        request_params.update({'limit': limit, 'cursor': cursor})
+        return '%s?%s' % (self.resource_uri, request_params.urlencode())
+
+    def page(self):
+        limit = self.get_limit()
+        ordering = self.get_ordering()
+        objects, next_cursor = self.get_slice(limit, ordering)
+
+        return {
+            self.collection_name: objects,
+            'meta': {
+                'limit': limit,
+                'order_by': ordering,
+                'cursor': self.cursor,
+                'next': self._generate_cursor_uri(limit, next_cursor) if next_cursor else None,
+            },
+        }
@@ -1,5 +1,8 @@
 import re
-from django.db.models import Q
+import hashlib
+import json
+import operator
+from collections import defaultdict
 from django.http import HttpResponse
 from django.conf import settings
 
@@ -8,24 +11,27 @@ from tastypie.resources import ModelResource
 from tastypie import fields
 from tastypie.utils import trailing_slash
 
-from guardian.shortcuts import get_objects_for_user
-
 from django.conf.urls import url
-from django.core.paginator import Paginator, InvalidPage
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
 from django.http import Http404
 
 from tastypie.utils.mime import build_content_type
+from taggit.models import TaggedItem
 
 from geonode.layers.models import Layer
 from geonode.maps.models import Map
 from geonode.documents.models import Document
 from geonode.base.models import ResourceBase
+from geonode.security.models import get_user_principals
+from geonode.utils import bbox_intervals
 
 from .authorization import GeoNodeAuthorization
+from .paginators import CursorPaginator
 
 from .api import TagResource, RegionResource, ProfileResource, \
     TopicCategoryResource, \
-    FILTER_TYPES
+    FILTER_TYPES, filter_bbox, parse_extent
 
 if settings.HAYSTACK_SEARCH:
     from haystack.query import SearchQuerySet  # noqa
@@ -117,14 +123,7 @@ class CommonModelApi(ModelResource):
         northeast_lng,northeast_lat'
         returns the modified query
         """
-        bbox = bbox.split(
-            ',')  # TODO: Why is this different when done through haystack?
-        bbox = map(str, bbox)  # 2.6 compat - float to decimal conversion
-
-        intersects = ~(Q(bbox_x0__gt=bbox[2]) | Q(bbox_x1__lt=bbox[0]) |
-                       Q(bbox_y0__gt=bbox[3]) | Q(bbox_y1__lt=bbox[1]))
-
-        return queryset.filter(intersects)
+        return filter_bbox(queryset, bbox)
 
     def build_haystack_filters(self, parameters):
         from haystack.inputs import Raw
@@ -274,14 +273,14 @@ class CommonModelApi(ModelResource):
 
         # Filter by geographic bounding box
         if bbox:
-            left, bottom, right, top = bbox.split(',')
+            left, bottom, right, top = parse_extent(bbox)
+            intersects = SQ(bbox_bottom__lte=top) & SQ(bbox_top__gte=bottom)
+            intervals = bbox_intervals(left, right)
+            if intervals:
+                intersects &= reduce(operator.or_, [
+                    SQ(bbox_left__lte=east) & SQ(bbox_right__gte=west) for west, east in intervals])
             sqs = (
-                SearchQuerySet() if sqs is None else sqs).exclude(
-                SQ(
-                    bbox_top__lte=bottom) | SQ(
-                    bbox_bottom__gte=top) | SQ(
-                    bbox_left__gte=right) | SQ(
-                        bbox_right__lte=left))
+                SearchQuerySet() if sqs is None else sqs).filter(intersects)
 
         # Apply sort
         if sort.lower() == "-date":
@@ -314,58 +313,49 @@ class CommonModelApi(ModelResource):
         sqs = self.build_haystack_filters(request.GET)
 
         if not settings.SKIP_PERMS_FILTER:
-            # Get the list of objects the user has access to
-            filter_set = get_objects_for_user(
-                    request.user,
-                    'base.view_resourcebase'
-            )
+            # Only match the documents the user can view, the users and
+            # groups allowed to view each document are part of the index
+            if not request.user.is_superuser:
+                sqs = sqs.filter(principals__in=get_user_principals(request.user))
             if settings.RESOURCE_PUBLISHING:
-                filter_set = filter_set.filter(is_published=True)
-
-            filter_set_ids = filter_set.values_list('id')
-            # Do the query using the filterset and the query term. Facet the
-            # results
-            if len(filter_set) > 0:
-                sqs = sqs.filter(id__in=filter_set_ids).facet('type').facet('subtype').facet('owner')\
-                    .facet('keywords').facet('regions').facet('category')
-            else:
-                sqs = None
-        else:
-            sqs = sqs.facet('type').facet('subtype').facet(
-                'owner').facet('keywords').facet('regions').facet('category')
+                sqs = sqs.exclude(is_published=False)
+
+        cache_key = None
+        if settings.SEARCH_RESULTS_CACHE_TIME:
+            cache_key = self.get_search_cache_key(request)
+            object_list = cache.get(cache_key)
+            if object_list is not None:
+                self.log_throttled_access(request)
+                return self.create_response(request, object_list)
+
+        # Facet the results
+        sqs = sqs.facet('type').facet('subtype').facet(
+            'owner').facet('keywords').facet('regions').facet('category')
+
+        offset = int(request.GET.get('offset') or 0)
+        limit = int(request.GET.get('limit') or self._meta.limit or 0)
+
+        # Slicing the queryset runs a single backend query returning the
+        # page of hits together with the total count and the facet counts
+        objects = list(sqs[offset:offset + limit] if limit else sqs[offset:])
+        total_count = sqs.query.get_count()
 
-        if sqs:
+        if total_count:
             # Build the Facet dict
             facets = {}
-            for facet in sqs.facet_counts()['fields']:
-                facets[facet] = {}
-                for item in sqs.facet_counts()['fields'][facet]:
-                    facets[facet][item[0]] = item[1]
-
-            # Paginate the results
-            paginator = Paginator(sqs, request.GET.get('limit'))
-
-            try:
-                page = paginator.page(
-                    int(request.GET.get('offset')) /
-                    int(request.GET.get('limit'), 0) + 1)
-            except InvalidPage:
+            for facet, items in sqs.query.get_facet_counts().get('fields', {}).items():
+                facets[facet] = dict(items)
+
+            page = offset / limit + 1 if limit else 1
+            num_pages = (total_count + limit - 1) / limit if limit else 1
+            if page > num_pages and page != 1:
                 raise Http404("Sorry, no results on that page.")
 
-            if page.has_previous():
-                previous_page = page.previous_page_number()
-            else:
-                previous_page = 1
-            if page.has_next():
-                next_page = page.next_page_number()
-            else:
-                next_page = 1
-            total_count = sqs.count()
-            objects = page.object_list
+            previous_page = page - 1 if page > 1 else 1
+            next_page = page + 1 if page < num_pages else 1
         else:
             next_page = 0
             previous_page = 0
-            total_count = 0
             facets = {}
             objects = []
 
@@ -379,9 +369,24 @@ class CommonModelApi(ModelResource):
                     },
             'objects': map(lambda x: self.get_haystack_api_fields(x), objects),
         }
+        if cache_key:
+            cache.set(cache_key, object_list, settings.SEARCH_RESULTS_CACHE_TIME)
         self.log_throttled_access(request)
         return self.create_response(request, object_list)
 
+    def get_search_cache_key(self, request):
+        """
+        Builds the cache key of a search from the normalized query
+        parameters and the permission principals of the user
+        """
+        params = sorted((key, sorted(values)) for key, values in request.GET.lists())
+        if settings.SKIP_PERMS_FILTER or request.user.is_superuser:
+            principals = ['superuser']
+        else:
+            principals = sorted(get_user_principals(request.user))
+        digest = hashlib.md5(json.dumps([params, principals])).hexdigest()
+        return 'search_results_%s' % digest
+
     def get_haystack_api_fields(self, haystack_object):
         object_fields = dict((k, v) for k, v in haystack_object.get_stored_fields().items()
                              if not re.search('_exact$|_sortable$', k))
@@ -404,7 +409,9 @@ class CommonModelApi(ModelResource):
             **self.remove_api_resource_names(kwargs))
         sorted_objects = self.apply_sorting(objects, options=request.GET)
 
-        paginator = self._meta.paginator_class(
+        # harvesters walking the whole catalogue page with a cursor
+        paginator_class = CursorPaginator if 'cursor' in request.GET else self._meta.paginator_class
+        paginator = paginator_class(
             request.GET,
             sorted_objects,
             resource_uri=self.get_resource_uri(),
@@ -449,6 +456,8 @@ class CommonModelApi(ModelResource):
             'thumbnail_url',
             'detail_url',
             'rating',
+            'category__identifier',
+            'polymorphic_ctype',
         ]
 
         if isinstance(
@@ -456,7 +465,7 @@ class CommonModelApi(ModelResource):
                 dict) and 'objects' in data and not isinstance(
                 data['objects'],
                 list):
-            data['objects'] = list(data['objects'].values(*VALUES))
+            data['objects'] = self.flatten_objects(data['objects'].values(*VALUES))
 
         desired_format = self.determine_format(request)
         serialized = self.serialize(request, data, desired_format)
@@ -466,6 +475,48 @@ class CommonModelApi(ModelResource):
             content_type=build_content_type(desired_format),
             **response_kwargs)
 
+    def flatten_objects(self, values):
+        """
+        Turns a page of resource values into flat listing records with their
+        type, subtype and keyword slugs. The relations of the whole page are
+        read at once, so a listing runs the same number of queries whatever
+        its size, and the resources are never downcast.
+        """
+        objects = list(values)
+        ids = [obj['id'] for obj in objects]
+        if not ids:
+            return objects
+
+        content_types = {}
+        layer_ids = []
+        for obj in objects:
+            ctype_id = obj.pop('polymorphic_ctype')
+            if ctype_id not in content_types:
+                content_types[ctype_id] = ContentType.objects.get_for_id(ctype_id)
+            obj['type'] = content_types[ctype_id].model
+            if obj['type'] == 'layer':
+                layer_ids.append(obj['id'])
+
+        subtypes = dict((store_type, subtype) for subtype, store_type in LAYER_SUBTYPES.items())
+        store_types = {}
+        if layer_ids:
+            store_types = dict(Layer.objects.filter(id__in=layer_ids).values_list('id', 'storeType'))
+
+        # keywords are tagged with the content type of the instance they were added to
+        ctype_ids = set(content_types.keys())
+        ctype_ids.add(ContentType.objects.get_for_model(ResourceBase).id)
+        keywords = defaultdict(list)
+        tagged_items = TaggedItem.objects.filter(
+            content_type__in=ctype_ids,
+            object_id__in=ids).order_by('tag__slug').values_list('object_id', 'tag__slug')
+        for object_id, slug in tagged_items:
+            keywords[object_id].append(slug)
+
+        for obj in objects:
+            obj['subtype'] = subtypes.get(store_types.get(obj['id']))
+            obj['keywords'] = keywords.get(obj['id'], [])
+        return objects
+
     def prepend_urls(self):
         if settings.HAYSTACK_SEARCH:
             return [
@@ -3,6 +3,7 @@ from tastypie.test import ResourceTestCase
 
 from geonode.base.populate_test_data import create_models, all_public
 from geonode.layers.models import Layer
+from geonode.api.resourcebase_api import LAYER_SUBTYPES
 
 
 class PermissionsApiTests(ResourceTestCase):
@@ -206,3 +207,110 @@ class SearchApiTests(ResourceTestCase):
         resp = self.api_client.get(filter_url)
         self.assertValidJSONResponse(resp)
         self.assertEquals(len(self.deserialize(resp)['objects']), 4)
+
+    def test_search_cache_key(self):
+        """Test the search results cache key normalization"""
+
+        from django.contrib.auth import get_user_model
+        from django.contrib.auth.models import AnonymousUser
+        from django.test.client import RequestFactory
+        from geonode.api.resourcebase_api import LayerResource
+
+        factory = RequestFactory()
+        resource = LayerResource()
+
+        def cache_key(query, user):
+            request = factory.get('/api/base/search/', query)
+            request.user = user
+            return resource.get_search_cache_key(request)
+
+        anonymous = AnonymousUser()
+        bobby = get_user_model().objects.get(username='bobby')
+        self.assertEquals(
+            cache_key([('q', 'a'), ('limit', '10')], anonymous),
+            cache_key([('limit', '10'), ('q', 'a')], anonymous))
+        self.assertNotEquals(
+            cache_key({'q': 'a'}, anonymous),
+            cache_key({'q': 'b'}, anonymous))
+        self.assertNotEquals(
+            cache_key({'q': 'a'}, anonymous),
+            cache_key({'q': 'a'}, bobby))
+
+    def test_cursor_pagination(self):
+        """Test walking the layers with a cursor"""
+
+        expected = list(Layer.objects.order_by('title', 'id').values_list('id', flat=True))
+
+        ids = []
+        url = self.list_url + '?cursor=&order_by=title&limit=3'
+        while url:
+            resp = self.api_client.get(url)
+            self.assertValidJSONResponse(resp)
+            data = self.deserialize(resp)
+            self.assertTrue(len(data['objects']) <= 3)
+            ids.extend(obj['id'] for obj in data['objects'])
+            url = data['meta']['next']
+        self.assertEquals(ids, expected)
+
+        resp = self.api_client.get(self.list_url + '?cursor=garbage')
+        self.assertHttpBadRequest(resp)
+        resp = self.api_client.get(self.list_url + '?cursor=&order_by=popular_count')
+        self.assertHttpBadRequest(resp)
+
+    def test_listing_queries(self):
+        """Test the listing runs a fixed number of queries"""
+
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        base_url = reverse(
+            'api_dispatch_list',
+            kwargs={
+                'api_name': 'api',
+                'resource_name': 'base'})
+
+        counts = []
+        for limit in (2, 8):
+            with CaptureQueriesContext(connection) as queries:
+                resp = self.api_client.get(base_url + '?limit=%s' % limit)
+            self.assertValidJSONResponse(resp)
+            counts.append(len(queries))
+        self.assertEquals(counts[0], counts[1])
+
+        layer_ids = set(Layer.objects.values_list('id', flat=True))
+        layers = [obj for obj in self.deserialize(resp)['objects'] if obj['id'] in layer_ids]
+        self.assertTrue(layers)
+        for obj in layers:
+            layer = Layer.objects.get(id=obj['id'])
+            self.assertEquals(obj['type'], 'layer')
+            self.assertEquals(LAYER_SUBTYPES[obj['subtype']], layer.storeType)
+            self.assertEquals(sorted(obj['keywords']), sorted(layer.keyword_slug_list()))
+
+    def test_extent_filter(self):
+        """Test the extent filter across the antimeridian"""
+
+        from geonode.utils import bbox_intervals
+
+        self.assertEquals(bbox_intervals(-10, 10), [(-10, 10)])
+        self.assertEquals(bbox_intervals(170, -170), [(170, 180), (-180, -170)])
+        self.assertEquals(bbox_intervals(170, 190), [(170, 180), (-180, -170)])
+        self.assertEquals(bbox_intervals(-180, 180), [])
+
+        layers = list(Layer.objects.all()[:3])
+        for layer, (x0, x1, y0, y1) in zip(layers, [(-10, 10, -10, 10), (175, -175, 0, 10), (100, 120, 0, 10)]):
+            Layer.objects.filter(id=layer.id).update(bbox_x0=x0, bbox_x1=x1, bbox_y0=y0, bbox_y1=y1)
+        Layer.objects.exclude(id__in=[layer.id for layer in layers]).update(
+            bbox_x0=-100, bbox_x1=-90, bbox_y0=-80, bbox_y1=-70)
+
+        def filtered_ids(extent):
+            resp = self.api_client.get(self.list_url + '?extent=%s' % extent)
+            self.assertValidJSONResponse(resp)
+            return sorted(obj['id'] for obj in self.deserialize(resp)['objects'])
+
+        self.assertEquals(filtered_ids('-5,-5,5,5'), [layers[0].id])
+        # the extent crosses the antimeridian
+        self.assertEquals(filtered_ids('170,0,-170,5'), [layers[1].id])
+        # the bounding box of the layer crosses the antimeridian
+        self.assertEquals(filtered_ids('-179,0,-170,5'), [layers[1].id])
+        self.assertEquals(filtered_ids('110,0,178,5'), sorted([layers[1].id, layers[2].id]))
+        self.assertHttpBadRequest(self.api_client.get(self.list_url + '?extent=1,2,3'))
@@ -0,0 +1,125 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db.models import Count
+
+from geonode.utils import get_cache_version, invalidate_cache_version
+
+
+def get_principals_key(user):
+    """
+    Returns what the counts of the resources a user can view depend on:
+    the users and groups the view permissions are granted to
+    """
+    from geonode.security.models import get_user_principals
+
+    if settings.SKIP_PERMS_FILTER:
+        return ['all']
+    if user.is_superuser:
+        return ['superuser']
+    return sorted(get_user_principals(user))
+
+
+def get_viewable_resources(user):
+    """
+    Returns the resources the user can view
+    """
+    from guardian.shortcuts import get_objects_for_user
+    from geonode.base.models import ResourceBase
+
+    if settings.SKIP_PERMS_FILTER:
+        resources = ResourceBase.objects.all()
+    else:
+        resources = get_objects_for_user(user, 'base.view_resourcebase')
+    if settings.RESOURCE_PUBLISHING:
+        resources = resources.filter(is_published=True)
+    return resources
+
+
+def cached_counts(user, name, compute, *params):
+    """
+    Returns the counts computed by compute(), cached for the principals of
+    the user (None for the counts that don't depend on the permissions) and
+    the given parameters until a resource or a permission changes, see
+    invalidate_resource_counts
+    """
+    if not settings.RESOURCE_COUNTS_CACHE_TIME:
+        return compute()
+
+    key = 'resource_counts_%s' % hashlib.md5(json.dumps([
+        name,
+        params,
+        get_principals_key(user) if user is not None else None,
+        get_cache_version('resource_counts')])).hexdigest()
+    counts = cache.get(key)
+    if counts is None:
+        counts = compute()
+        cache.set(key, counts, settings.RESOURCE_COUNTS_CACHE_TIME)
+    return counts
+
+
+def get_resource_counts(user, title_filter=None):
+    """
+    Counts the resources the user can view by type, layer store type and
+    document type, all in one grouped query:
+
+        {'types': {'layer': 3, 'map': 1, 'document': 2},
+         'store_types': {'dataStore': 2, 'coverageStore': 1},
+         'doc_types': {'pdf': 1, 'image': 1}}
+    """
+    def compute():
+        resources = get_viewable_resources(user)
+        if title_filter:
+            resources = resources.filter(title__icontains=title_filter)
+
+        rows = resources.order_by().values(
+            'polymorphic_ctype', 'layer__storeType', 'document__doc_type').annotate(count=Count('id'))
+
+        counts = {'types': {}, 'store_types': {}, 'doc_types': {}}
+        for row in rows:
+            resource_type = ContentType.objects.get_for_id(row['polymorphic_ctype']).model
+            counts['types'][resource_type] = counts['types'].get(resource_type, 0) + row['count']
+            if row['layer__storeType'] is not None:
+                store_types = counts['store_types']
+                store_types[row['layer__storeType']] = store_types.get(row['layer__storeType'], 0) + row['count']
+            if row['document__doc_type'] is not None:
+                doc_types = counts['doc_types']
+                doc_types[row['document__doc_type']] = doc_types.get(row['document__doc_type'], 0) + row['count']
+        return counts
+
+    return cached_counts(user, 'resources', compute, title_filter)
+
+
+def get_site_counts():
+    """
+    Counts the users and the public groups of the site
+    """
+    from geonode.groups.models import GroupProfile
+
+    def compute():
+        return {
+            'user': get_user_model().objects.exclude(username='AnonymousUser').count(),
+            'group': GroupProfile.objects.exclude(access="private").count(),
+        }
+
+    return cached_counts(None, 'site', compute)
+
+
+def invalidate_resource_counts(*args, **kwargs):
+    """
+    Drops the cached counts, connected to the signals of the
+    resources, their keywords and regions, the users and groups
+    """
+    invalidate_cache_version('resource_counts')
+
+
+def invalidate_site_counts(sender, created=True, **kwargs):
+    """
+    Drops the cached counts when a user is added or removed
+    """
+    if created:
+        invalidate_resource_counts()
@@ -0,0 +1,272 @@
+import datetime
+import logging
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Avg, Count
+
+logger = logging.getLogger(__name__)
+
+SEARCH_UPDATE_SCHEDULED = 'search_update_scheduled'
+
+_batch = threading.local()
+
+
+def get_search_index(model):
+    """
+    Returns the search index of a model, None when it is not indexed
+    """
+    from haystack import connections
+    from haystack.exceptions import NotHandled
+
+    try:
+        return connections['default'].get_unified_index().get_index(model)
+    except NotHandled:
+        return None
+
+
+def queue_search_update(instance, removed=False):
+    """
+    Records that the search index entry of an object is outdated and
+    schedules the update of the index
+    """
+    content_type = ContentType.objects.get_for_model(instance)
+    now = datetime.datetime.now()
+
+    from geonode.base.models import PendingSearchUpdate
+
+    queued = PendingSearchUpdate.objects.filter(
+        content_type=content_type,
+        object_id=instance.pk).update(removed=removed, queued=now)
+    if not queued:
+        try:
+            with transaction.atomic():
+                PendingSearchUpdate.objects.create(
+                    content_type=content_type,
+                    object_id=instance.pk,
+                    removed=removed,
+                    queued=now)
+        except IntegrityError:
+            # queued meanwhile by another process
+            PendingSearchUpdate.objects.filter(
+                content_type=content_type,
+                object_id=instance.pk).update(removed=removed, queued=now)
+
+    schedule_search_update()
+
+
+def schedule_search_update():
+    """
+    Queues the task flushing the pending updates, unless it is already
+    queued: the updates of the next SEARCH_INDEX_FLUSH_DELAY seconds
+    are indexed together.
+    """
+    from geonode.tasks.update import update_search_index
+
+    delay = settings.SEARCH_INDEX_FLUSH_DELAY
+    if cache.add(SEARCH_UPDATE_SCHEDULED, True, delay + 60):
+        update_search_index.apply_async(countdown=delay)
+
+
+def flush_search_updates(batch_size=None):
+    """
+    Indexes the objects of the queue, batch_size at a time, and removes
+    the deleted ones from the index. Returns the number of updates.
+    """
+    from haystack import connections
+    from geonode.base.models import PendingSearchUpdate
+
+    batch_size = batch_size or settings.SEARCH_INDEX_BATCH_SIZE
+    backend = connections['default'].get_backend()
+    cache.delete(SEARCH_UPDATE_SCHEDULED)
+
+    flushed = 0
+    last_id = 0
+    while True:
+        started = datetime.datetime.now()
+        pending = list(PendingSearchUpdate.objects.filter(id__gt=last_id).order_by('id')[:batch_size])
+        if not pending:
+            return flushed
+        last_id = pending[-1].id
+
+        updated = defaultdict(set)
+        removed = defaultdict(set)
+        for update in pending:
+            (removed if update.removed else updated)[update.content_type_id].add(update.object_id)
+
+        done = []
+        for content_type_id in set(updated.keys()) | set(removed.keys()):
+            model = ContentType.objects.get_for_id(content_type_id).model_class()
+            index = get_search_index(model) if model else None
+            if index is not None:
+                try:
+                    indexed = index_objects(index, index.index_queryset().filter(pk__in=updated[content_type_id]))
+                    # the objects left out by the index queryset are dropped too
+                    for pk in (updated[content_type_id] - indexed) | removed[content_type_id]:
+                        backend.remove('%s.%s.%s' % (model._meta.app_label, model._meta.module_name, pk))
+                except Exception:
+                    # left in the queue for the next flush
+                    logger.exception('Could not update the search index of %s', model.__name__)
+                    continue
+            done.extend(update.id for update in pending if update.content_type_id == content_type_id)
+
+        # the objects queued again meanwhile stay in the queue
+        PendingSearchUpdate.objects.filter(id__in=done, queued__lte=started).delete()
+        flushed += len(done)
+
+
+@contextmanager
+def prepared_batch(values):
+    """
+    Makes the values prefetched for a batch of objects
+    available to the prepare methods of the indexes
+    """
+    previous = getattr(_batch, 'values', None)
+    _batch.values = values
+    try:
+        yield
+    finally:
+        _batch.values = previous
+
+
+def index_objects(index, objects):
+    """
+    Updates the search index entries of the objects at once, returns their ids
+    """
+    from haystack import connections
+
+    if hasattr(index, 'prefetch_queryset'):
+        objects = index.prefetch_queryset(objects)
+    objects = list(objects)
+    if not objects:
+        return set()
+
+    values = index.prefetch_values(objects) if hasattr(index, 'prefetch_values') else {}
+    with prepared_batch(values):
+        connections['default'].get_backend().update(index, objects)
+    return set(obj.pk for obj in objects)
+
+
+def get_batch_values(obj):
+    """
+    Returns the values prefetched for an object
+    by prefetch_resource_values, None outside a batch
+    """
+    values = getattr(_batch, 'values', None)
+    if values:
+        return values.get(obj.pk)
+    return None
+
+
+def prefetch_resource_values(resources):
+    """
+    Fetches the ratings, comments, keywords, regions and view principals of
+    a batch of resources of the same type in a fixed number of queries
+    """
+    from agon_ratings.models import OverallRating
+    from dialogos.models import Comment
+    from guardian.models import UserObjectPermission, GroupObjectPermission
+    from taggit.models import TaggedItem
+    from geonode.base.models import ResourceBase
+
+    ids = [resource.pk for resource in resources]
+    content_type = ContentType.objects.get_for_model(resources[0])
+    base_content_type = ContentType.objects.get_for_model(ResourceBase)
+
+    values = dict((pk, {
+        'rating': 0.0,
+        'num_ratings': 0,
+        'num_comments': 0,
+        'keywords': [],
+        'regions': [],
+        'principals': [],
+    }) for pk in ids)
+
+    ratings = OverallRating.objects.filter(content_type=content_type, object_id__in=ids).values(
+        'object_id').annotate(rating=Avg('rating'), count=Count('id'))
+    for rating in ratings:
+        values[rating['object_id']]['rating'] = float(str(rating['rating'] or '0'))
+        values[rating['object_id']]['num_ratings'] = rating['count']
+
+    comments = Comment.objects.filter(content_type=content_type, object_id__in=ids).values(
+        'object_id').annotate(count=Count('id'))
+    for comment in comments:
+        values[comment['object_id']]['num_comments'] = comment['count']
+
+    keywords = TaggedItem.objects.filter(
+        content_type__in=[content_type, base_content_type],
+        object_id__in=ids).values_list('object_id', 'tag__slug')
+    for object_id, slug in keywords:
+        values[object_id]['keywords'].append(slug)
+
+    regions = ResourceBase.regions.through.objects.filter(
+        resourcebase_id__in=ids).order_by('region__name').values_list('resourcebase_id', 'region__name')
+    for resource_id, name in regions:
+        values[resource_id]['regions'].append(name)
+
+    object_pks = [str(pk) for pk in ids]
+    user_permissions = UserObjectPermission.objects.filter(
+        content_type=base_content_type,
+        object_pk__in=object_pks,
+        permission__codename='view_resourcebase').values_list('object_pk', 'user_id')
+    for object_pk, user_id in user_permissions:
+        values[int(object_pk)]['principals'].append('user:%s' % user_id)
+    group_permissions = GroupObjectPermission.objects.filter(
+        content_type=base_content_type,
+        object_pk__in=object_pks,
+        permission__codename='view_resourcebase').values_list('object_pk', 'group_id')
+    for object_pk, group_id in group_permissions:
+        values[int(object_pk)]['principals'].append('group:%s' % group_id)
+
+    return values
+
+
+class ResourceIndexMixin(object):
+
+    """
+    Prepares the fields of the resources that need their related objects
+    from values fetched for the whole batch, see index_objects
+    """
+
+    def prefetch_queryset(self, queryset):
+        return queryset.select_related('owner', 'category')
+
+    def prefetch_values(self, objects):
+        return prefetch_resource_values(objects)
+
+    def full_prepare(self, obj):
+        if get_batch_values(obj) is not None:
+            return super(ResourceIndexMixin, self).full_prepare(obj)
+        # indexed on its own, the values are fetched once for all the fields
+        with prepared_batch(self.prefetch_values([obj])):
+            return super(ResourceIndexMixin, self).full_prepare(obj)
+
+    def get_batch_values(self, obj):
+        values = get_batch_values(obj)
+        if values is None:
+            # indexed on its own
+            values = prefetch_resource_values([obj])[obj.pk]
+        return values
+
+    def prepare_rating(self, obj):
+        return self.get_batch_values(obj)['rating']
+
+    def prepare_num_ratings(self, obj):
+        return self.get_batch_values(obj)['num_ratings']
+
+    def prepare_num_comments(self, obj):
+        return self.get_batch_values(obj)['num_comments']
+
+    def prepare_keywords(self, obj):
+        return self.get_batch_values(obj)['keywords']
+
+    def prepare_regions(self, obj):
+        return self.get_batch_values(obj)['regions']
+
+    def prepare_principals(self, obj):
+        return self.get_batch_values(obj)['principals']
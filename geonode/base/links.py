@@ -0,0 +1,64 @@
+from urlparse import urlsplit
+
+from django.db import transaction
+
+LINK_FIELDS = ('url', 'name', 'extension', 'mime', 'link_type')
+
+
+def reconcile_links(resource, links, keep_hosts=None):
+    """
+    Makes the links of a resource match the wanted ones, given as dicts
+    of the Link fields: the existing links are read in one query, the
+    missing ones are inserted at once and the outdated ones deleted at once.
+
+    An existing link is outdated when it differs from the wanted links having
+    the same name and type, or the same url. The other links (thumbnails,
+    metadata, uploaded files...) are kept, unless keep_hosts is given and
+    their url is on another host. Returns the number of created and
+    deleted links.
+    """
+    from geonode.base.models import Link
+
+    wanted = dict((tuple(link[field] for field in LINK_FIELDS), link) for link in links)
+    names = set((link['name'], link['link_type']) for link in links)
+    urls = set(link['url'] for link in links)
+
+    existing = set()
+    outdated = []
+    for row in Link.objects.filter(resource=resource).values_list('id', *LINK_FIELDS):
+        link_id, key = row[0], row[1:]
+        url, name, link_type = key[0], key[1], key[4]
+        if key in wanted and key not in existing:
+            existing.add(key)
+        elif key in wanted or (name, link_type) in names or url in urls:
+            # superseded or duplicated
+            outdated.append(link_id)
+        elif keep_hosts is not None and urlsplit(url).hostname not in keep_hosts:
+            outdated.append(link_id)
+
+    missing = []
+    for link in links:
+        key = tuple(link[field] for field in LINK_FIELDS)
+        if key not in existing:
+            existing.add(key)
+            missing.append(Link(resource_id=resource.id, **link))
+    with transaction.atomic():
+        if outdated:
+            Link.objects.filter(id__in=outdated).delete()
+        if missing:
+            Link.objects.bulk_create(missing)
+    return len(missing), len(outdated)
+
+
+def delete_stale_links(resource, is_stale):
+    """
+    Deletes in one query the links of a resource for which
+    is_stale(name, url) is true, returns their number
+    """
+    from geonode.base.models import Link
+
+    stale = [link_id for link_id, name, url in Link.objects.filter(
+        resource=resource).values_list('id', 'name', 'url') if is_stale(name, url)]
+    if stale:
+        Link.objects.filter(id__in=stale).delete()
+    return len(stale)
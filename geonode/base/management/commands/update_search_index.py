@@ -0,0 +1,52 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    """Indexes the objects queued for the search index,
+       or all the indexed objects with --all
+    """
+    can_import_settings = True
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--all',
+            action='store_true',
+            dest='all',
+            default=False,
+            help='Index all the objects instead of the queued ones'),
+        make_option(
+            '-b',
+            '--batch-size',
+            dest='batch_size',
+            type='int',
+            default=None,
+            help='Number of objects indexed at once'),
+    )
+
+    def handle(self, *args, **options):
+        from django.conf import settings
+        from haystack import connections
+        from geonode.base.indexing import flush_search_updates, index_objects
+
+        batch_size = options['batch_size'] or settings.SEARCH_INDEX_BATCH_SIZE
+
+        if not options['all']:
+            flushed = flush_search_updates(batch_size)
+            print 'Flushed %s search index updates' % flushed
+            return
+
+        unified_index = connections['default'].get_unified_index()
+        for model in unified_index.get_indexed_models():
+            index = unified_index.get_index(model)
+            queryset = index.index_queryset().order_by('pk')
+            indexed = 0
+            last_pk = 0
+            while True:
+                pks = list(queryset.filter(pk__gt=last_pk).values_list('pk', flat=True)[:batch_size])
+                if not pks:
+                    break
+                indexed += len(index_objects(index, queryset.filter(pk__in=pks)))
+                last_pk = pks[-1]
+            print 'Indexed %s %s' % (indexed, model._meta.verbose_name_plural)
@@ -27,8 +27,11 @@ from geonode.base.enumerations import ALL_LANGUAGES, \
     DEFAULT_SUPPLEMENTAL_INFORMATION, LINK_TYPES
 from geonode.utils import bbox_to_wkt
 from geonode.utils import forward_mercator
+from geonode.base.counts import invalidate_resource_counts
+from geonode.base.links import delete_stale_links
 from geonode.security.models import PermissionLevelMixin
 from taggit.managers import TaggableManager
+from taggit.models import TaggedItem
 
 from geonode.people.enumerations import ROLE_VALUES
 
@@ -657,6 +660,8 @@ class ResourceBase(PolymorphicModel, PermissionLevelMixin):
             ('publish_resourcebase', 'Can publish resource'),
             ('change_resourcebase_metadata', 'Can change resource metadata'),
         )
+        # the keys of the cursor pagination, see CursorPaginator
+        index_together = [('date', 'id'), ('title', 'id')]
 
 
 class LinkManager(models.Manager):
@@ -713,6 +718,20 @@ class Link(models.Model):
         return '%s link' % self.link_type
 
 
+class PendingSearchUpdate(models.Model):
+    """
+    An object whose entry in the search index is outdated, the queue is
+    flushed in batches by the update_search_index task.
+    """
+    content_type = models.ForeignKey(ContentType)
+    object_id = models.PositiveIntegerField()
+    removed = models.BooleanField(default=False)
+    queued = models.DateTimeField(default=datetime.datetime.now)
+
+    class Meta:
+        unique_together = (('content_type', 'object_id'),)
+
+
 def resourcebase_post_save(instance, *args, **kwargs):
     """
     Used to fill any additional fields after the save.
@@ -725,13 +744,14 @@ def resourcebase_post_save(instance, *args, **kwargs):
     instance.set_missing_info()
 
     # we need to remove stale links
-    for link in instance.link_set.all():
-        if link.name == "External Document":
-            if link.resource.doc_url != link.url:
-                link.delete()
-        else:
-            if urlsplit(settings.SITEURL).hostname not in link.url:
-                link.delete()
+    site_hostname = urlsplit(settings.SITEURL).hostname
+
+    def is_stale(name, url):
+        if name == "External Document":
+            return getattr(instance, 'doc_url', None) != url
+        return site_hostname not in url
+
+    delete_stale_links(instance, is_stale)
 
 
 def rating_post_save(instance, *args, **kwargs):
@@ -741,3 +761,6 @@ def rating_post_save(instance, *args, **kwargs):
     ResourceBase.objects.filter(id=instance.object_id).update(rating=instance.rating)
 
 signals.post_save.connect(rating_post_save, sender=OverallRating)
+signals.post_save.connect(invalidate_resource_counts, sender=TaggedItem)
+signals.post_delete.connect(invalidate_resource_counts, sender=TaggedItem)
+signals.m2m_changed.connect(invalidate_resource_counts, sender=ResourceBase.regions.through)
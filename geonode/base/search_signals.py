@@ -0,0 +1,32 @@
+from django.db.models import signals
+
+from haystack.signals import BaseSignalProcessor
+
+from geonode.base.indexing import get_search_index, queue_search_update
+
+
+class QueuedSignalProcessor(BaseSignalProcessor):
+
+    """
+    Queues the saved and deleted objects instead of indexing them right
+    away, the queue is flushed in batches by the update_search_index task.
+
+    Enable it with:
+    HAYSTACK_SIGNAL_PROCESSOR = 'geonode.base.search_signals.QueuedSignalProcessor'
+    """
+
+    def setup(self):
+        signals.post_save.connect(self.handle_save)
+        signals.post_delete.connect(self.handle_delete)
+
+    def teardown(self):
+        signals.post_save.disconnect(self.handle_save)
+        signals.post_delete.disconnect(self.handle_delete)
+
+    def handle_save(self, sender, instance, **kwargs):
+        if get_search_index(sender) is not None:
+            queue_search_update(instance)
+
+    def handle_delete(self, sender, instance, **kwargs):
+        if get_search_index(sender) is not None:
+            queue_search_update(instance, removed=True)
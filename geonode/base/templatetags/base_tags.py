@@ -2,16 +2,8 @@ from django import template
 
 from agon_ratings.models import Rating
 from django.contrib.contenttypes.models import ContentType
-from django.contrib.auth import get_user_model
-from django.db.models import Count
 
-from guardian.shortcuts import get_objects_for_user
-from geonode import settings
-
-from geonode.layers.models import Layer
-from geonode.maps.models import Map
-from geonode.documents.models import Document
-from geonode.groups.models import GroupProfile
+from geonode.base.counts import get_resource_counts, get_site_counts
 
 register = template.Library()
 
@@ -29,66 +21,29 @@ def facets(context):
 
     facet_type = context['facet_type'] if 'facet_type' in context else 'all'
 
-    if not settings.SKIP_PERMS_FILTER:
-        authorized = get_objects_for_user(
-            request.user, 'base.view_resourcebase').values('id')
+    counts = get_resource_counts(request.user, title_filter)
 
     if facet_type == 'documents':
+        return dict(counts['doc_types'])
 
-        documents = Document.objects.filter(title__icontains=title_filter)
-
-        if settings.RESOURCE_PUBLISHING:
-            documents = documents.filter(is_published=True)
-
-        if not settings.SKIP_PERMS_FILTER:
-            documents = documents.filter(id__in=authorized)
-
-        counts = documents.values('doc_type').annotate(count=Count('doc_type'))
-        facets = dict([(count['doc_type'], count['count']) for count in counts])
+    store_types = counts['store_types']
+    facets = {
+        'raster': store_types.get('coverageStore', 0),
+        'vector': store_types.get('dataStore', 0),
+        'remote': store_types.get('remoteStore', 0),
+    }
 
+    # Break early if only_layers is set.
+    if facet_type == 'layers':
         return facets
 
-    else:
-
-        layers = Layer.objects.filter(title__icontains=title_filter)
-
-        if settings.RESOURCE_PUBLISHING:
-            layers = layers.filter(is_published=True)
-
-        if not settings.SKIP_PERMS_FILTER:
-            layers = layers.filter(id__in=authorized)
-
-        counts = layers.values('storeType').annotate(count=Count('storeType'))
-        count_dict = dict([(count['storeType'], count['count']) for count in counts])
-
-        facets = {
-            'raster': count_dict.get('coverageStore', 0),
-            'vector': count_dict.get('dataStore', 0),
-            'remote': count_dict.get('remoteStore', 0),
-        }
-
-        # Break early if only_layers is set.
-        if facet_type == 'layers':
-            return facets
-
-        maps = Map.objects.filter(title__icontains=title_filter)
-        documents = Document.objects.filter(title__icontains=title_filter)
-
-        if not settings.SKIP_PERMS_FILTER:
-            maps = maps.filter(id__in=authorized)
-            documents = documents.filter(id__in=authorized)
-
-        facets['map'] = maps.count()
-        facets['document'] = documents.count()
-
-        if facet_type == 'home':
-            facets['user'] = get_user_model().objects.exclude(
-                username='AnonymousUser').count()
+    facets['map'] = counts['types'].get('map', 0)
+    facets['document'] = counts['types'].get('document', 0)
 
-            facets['group'] = GroupProfile.objects.exclude(
-                access="private").count()
+    if facet_type == 'home':
+        facets.update(get_site_counts())
 
-            facets['layer'] = facets['raster'] + \
-                facets['vector'] + facets['remote']
+        facets['layer'] = facets['raster'] + \
+            facets['vector'] + facets['remote']
 
     return facets
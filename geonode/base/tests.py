@@ -11,3 +11,147 @@ class ThumbnailTests(TestCase):
         self.assertFalse(self.rb.has_thumbnail())
         missing = self.rb.get_thumbnail_url()
         self.assertEquals('/static/geonode/img/missing_thumb.png', missing)
+
+
+class LinksTests(TestCase):
+
+    def setUp(self):
+        self.rb = ResourceBase.objects.create()
+
+    def test_reconcile_links(self):
+        from geonode.base.links import reconcile_links
+        from geonode.base.models import Link
+
+        def link(url, name):
+            return dict(url=url, name=name, extension='png', mime='image/png', link_type='image')
+
+        thumbnail = Link.objects.create(resource=self.rb, **link('http://localhost/thumb.png', 'Thumbnail'))
+        legend = Link.objects.create(resource=self.rb, **link('http://geoserver/legend?old', 'Legend'))
+        tiles = Link.objects.create(resource=self.rb, **link('http://geoserver/tiles', 'Tiles'))
+        Link.objects.create(resource=self.rb, **link('http://oldhost/wms', 'WMS'))
+
+        wanted = [link('http://geoserver/legend?new', 'Legend'), link('http://geoserver/tiles', 'Tiles')]
+        self.assertEquals(reconcile_links(self.rb, wanted, keep_hosts=('localhost', 'geoserver')), (1, 2))
+
+        links = dict((l.name, l) for l in self.rb.link_set.all())
+        self.assertEquals(sorted(links.keys()), ['Legend', 'Thumbnail', 'Tiles'])
+        self.assertEquals(links['Thumbnail'].id, thumbnail.id)
+        self.assertEquals(links['Tiles'].id, tiles.id)
+        self.assertNotEquals(links['Legend'].id, legend.id)
+        self.assertEquals(links['Legend'].url, 'http://geoserver/legend?new')
+
+        # nothing to do the second time
+        self.assertEquals(reconcile_links(self.rb, wanted), (0, 0))
+
+
+class ResourceCountsTests(TestCase):
+
+    fixtures = ['initial_data.json', 'bobby']
+
+    def setUp(self):
+        from geonode.base.populate_test_data import create_models
+        create_models()
+
+    def test_resource_counts(self):
+        from django.contrib.auth import get_user_model
+        from django.db.models import Count
+        from geonode.base.counts import get_resource_counts
+        from geonode.layers.models import Layer
+        from geonode.maps.models import Map
+        from geonode.documents.models import Document
+
+        admin = get_user_model().objects.get(username='admin')
+        counts = get_resource_counts(admin)
+
+        self.assertEquals(counts['types'].get('layer', 0), Layer.objects.count())
+        self.assertEquals(counts['types'].get('map', 0), Map.objects.count())
+        self.assertEquals(counts['types'].get('document', 0), Document.objects.count())
+        store_types = Layer.objects.values('storeType').annotate(count=Count('storeType'))
+        self.assertEquals(counts['store_types'], dict((c['storeType'], c['count']) for c in store_types))
+
+        title = Layer.objects.all()[0].title
+        counts = get_resource_counts(admin, title)
+        self.assertEquals(counts['types'].get('layer', 0), Layer.objects.filter(title__icontains=title).count())
+
+
+class SearchIndexingTests(TestCase):
+
+    fixtures = ['initial_data.json', 'bobby']
+
+    def setUp(self):
+        from geonode.base.populate_test_data import create_models
+        create_models(type='layer')
+
+    def test_prefetch_resource_values(self):
+        from geonode.base.indexing import prefetch_resource_values
+        from geonode.layers.models import Layer
+        from geonode.security.models import get_view_principals
+
+        layers = list(Layer.objects.all())
+        values = prefetch_resource_values(layers)
+
+        self.assertEquals(sorted(values.keys()), sorted(layer.pk for layer in layers))
+        for layer in layers:
+            self.assertEquals(sorted(values[layer.pk]['keywords']), sorted(layer.keyword_slug_list()))
+            self.assertEquals(sorted(values[layer.pk]['regions']), sorted(layer.region_name_list()))
+            self.assertEquals(sorted(values[layer.pk]['principals']), sorted(get_view_principals(layer)))
+            self.assertEquals(values[layer.pk]['num_comments'], 0)
+
+    def test_full_prepare_queries(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from geonode.base.indexing import get_search_index, prefetch_resource_values, prepared_batch
+        from geonode.layers.models import Layer
+
+        index = get_search_index(Layer)
+        layer = index.prefetch_queryset(Layer.objects.filter(pk=Layer.objects.all()[0].pk))[0]
+        index.full_prepare(layer)
+
+        with CaptureQueriesContext(connection) as prefetch:
+            values = prefetch_resource_values([layer])
+        with CaptureQueriesContext(connection) as batch:
+            with prepared_batch(values):
+                index.full_prepare(layer)
+
+        # indexed on its own, the values are fetched once and not once per field
+        self.assertNumQueries(len(prefetch) + len(batch), index.full_prepare, layer)
+
+
+class TypeaheadTests(TestCase):
+
+    fixtures = ['initial_data.json', 'bobby']
+
+    def setUp(self):
+        from geonode.base.populate_test_data import create_models
+        from geonode.base.typeahead import typeahead_index
+        create_models(type='map')
+        # built from the content of the test database
+        typeahead_index.built = None
+
+    def test_typeahead(self):
+        import json
+        from django.core.urlresolvers import reverse
+        from geonode.maps.models import Map
+
+        def labels(query):
+            response = self.client.get(reverse('typeahead'), {'q': query})
+            self.assertEquals(response.status_code, 200)
+            return [obj['label'] for obj in json.loads(response.content)['objects']]
+
+        self.assertTrue(self.client.login(username='admin', password='admin'))
+        self.assertIn('quux', labels('qu'))
+        self.assertIn('titledupe something else ', labels('titled'))
+        self.assertIn('titledupe something else ', labels('somet'))
+        self.assertIn('populartag', labels('popular'))
+
+        # the index follows the changes of the titles
+        quux = Map.objects.get(title='quux')
+        quux.title = 'quuz'
+        quux.save()
+        self.assertEquals(labels('quux'), [])
+        self.assertIn('quuz', labels('quu'))
+
+        # and filters the resources by permissions
+        self.client.logout()
+        quux.set_permissions({'users': {}, 'groups': {}})
+        self.assertNotIn('quuz', labels('quu'))
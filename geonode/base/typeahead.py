@@ -0,0 +1,243 @@
+import re
+import time
+from bisect import bisect_left, insort
+from threading import RLock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import signals
+
+from taggit.models import Tag
+
+from geonode.base.counts import get_viewable_resources
+from geonode.base.models import ResourceBase, Region
+from geonode.documents.models import Document
+from geonode.layers.models import Layer
+from geonode.maps.models import Map
+
+RESOURCE_TYPES = ('layer', 'map', 'document')
+
+# number of matching entries ranked before the permissions are checked
+MAX_CANDIDATES = 1000
+
+WORD_SEPARATORS = re.compile(r'[\W_]+', re.UNICODE)
+
+
+def get_terms(*texts):
+    """
+    Returns the lowercased texts and their words, the prefixes they are found with
+    """
+    terms = set()
+    for text in texts:
+        if not text:
+            continue
+        text = text.strip().lower()
+        terms.add(text)
+        terms.update(word for word in WORD_SEPARATORS.split(text) if word)
+    return terms
+
+
+class PrefixIndex(object):
+
+    """
+    A compact prefix index: the (term, key) pairs of all the entries are kept
+    in one sorted list, the entries matching a prefix are found with a
+    binary search and are contiguous.
+    """
+
+    def __init__(self):
+        self.built = None
+        self._terms = []
+        self._entries = {}
+        self._lock = RLock()
+
+    def add(self, key, data, terms, score=0):
+        with self._lock:
+            self.remove(key)
+            self._entries[key] = (data, score, terms)
+            for term in terms:
+                insort(self._terms, (term, key))
+
+    def remove(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return
+            for term in entry[2]:
+                position = bisect_left(self._terms, (term, key))
+                if position < len(self._terms) and self._terms[position] == (term, key):
+                    del self._terms[position]
+
+    def load(self, entries):
+        """
+        Replaces the content of the index with (key, data, terms, score) entries
+        """
+        terms = []
+        loaded = {}
+        for key, data, entry_terms, score in entries:
+            loaded[key] = (data, score, entry_terms)
+            terms.extend((term, key) for term in entry_terms)
+        terms.sort()
+        with self._lock:
+            self._terms = terms
+            self._entries = loaded
+            self.built = time.time()
+
+    def search(self, prefix, limit=10, allowed=None):
+        """
+        Returns the data of the best entries having a term starting with
+        the prefix, allowed(keys) returns the keys the requester can see
+        """
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return []
+
+        candidates = {}
+        with self._lock:
+            position = bisect_left(self._terms, (prefix,))
+            while position < len(self._terms) and len(candidates) < MAX_CANDIDATES:
+                term, key = self._terms[position]
+                if not term.startswith(prefix):
+                    break
+                if key not in candidates:
+                    data, score, _ = self._entries[key]
+                    # the entries whose whole text starts with the prefix come first
+                    candidates[key] = (term != prefix and not data['label'].lower().startswith(prefix), -score,
+                                       data['label'].lower(), data)
+                position += 1
+
+        ranked = sorted(candidates, key=lambda candidate: candidates[candidate][:3])
+        if allowed is None:
+            return [candidates[candidate][3] for candidate in ranked[:limit]]
+
+        # the permissions are checked for the best candidates first
+        results = []
+        chunk_size = max(limit * 2, 20)
+        for start in range(0, len(ranked), chunk_size):
+            chunk = ranked[start:start + chunk_size]
+            visible = allowed(chunk)
+            results.extend(candidates[candidate][3] for candidate in chunk if candidate in visible)
+            if len(results) >= limit:
+                break
+        return results[:limit]
+
+
+def resource_entry(resource_type, resource_id, title, detail_url, popular_count):
+    data = {
+        'type': resource_type,
+        'id': resource_id,
+        'label': title,
+        'detail_url': detail_url,
+    }
+    return (resource_type, resource_id), data, get_terms(title), popular_count or 0
+
+
+def keyword_entry(tag_id, name, slug):
+    data = {'type': 'keyword', 'id': tag_id, 'label': name, 'slug': slug}
+    return ('keyword', tag_id), data, get_terms(name), 0
+
+
+def region_entry(region_id, name, code):
+    data = {'type': 'region', 'id': region_id, 'label': name, 'code': code}
+    return ('region', region_id), data, get_terms(name), 0
+
+
+def user_entry(user_id, username, first_name, last_name):
+    data = {'type': 'user', 'id': user_id, 'label': username}
+    return ('user', user_id), data, get_terms(username, first_name, last_name), 0
+
+
+def get_entries():
+    """
+    Yields the entries of all the titles, keywords, regions and usernames
+    """
+    resources = ResourceBase.objects.values_list(
+        'id', 'polymorphic_ctype', 'title', 'detail_url', 'popular_count')
+    for resource_id, ctype_id, title, detail_url, popular_count in resources:
+        resource_type = ContentType.objects.get_for_id(ctype_id).model
+        if resource_type in RESOURCE_TYPES:
+            yield resource_entry(resource_type, resource_id, title, detail_url, popular_count)
+
+    for tag_id, name, slug in Tag.objects.values_list('id', 'name', 'slug'):
+        yield keyword_entry(tag_id, name, slug)
+
+    for region_id, name, code in Region.objects.values_list('id', 'name', 'code'):
+        yield region_entry(region_id, name, code)
+
+    users = get_user_model().objects.exclude(username='AnonymousUser').values_list(
+        'id', 'username', 'first_name', 'last_name')
+    for user_id, username, first_name, last_name in users:
+        yield user_entry(user_id, username, first_name, last_name)
+
+
+typeahead_index = PrefixIndex()
+
+
+def get_typeahead_index():
+    """
+    Returns the index, built on first use and rebuilt every
+    TYPEAHEAD_INDEX_MAX_AGE seconds to catch up with the changes
+    made by the other processes
+    """
+    built = typeahead_index.built
+    if built is None or time.time() - built > settings.TYPEAHEAD_INDEX_MAX_AGE:
+        typeahead_index.load(get_entries())
+    return typeahead_index
+
+
+def search_typeahead(user, prefix, limit=10):
+    """
+    Returns the resources the user can view, keywords, regions and
+    users having a title, name or word starting with the prefix
+    """
+    def allowed(keys):
+        resource_ids = [key[1] for key in keys if key[0] in RESOURCE_TYPES]
+        visible = set(key for key in keys if key[0] not in RESOURCE_TYPES)
+        if resource_ids:
+            viewable = get_viewable_resources(user).filter(id__in=resource_ids)
+            for resource_id, ctype_id in viewable.values_list('id', 'polymorphic_ctype'):
+                visible.add((ContentType.objects.get_for_id(ctype_id).model, resource_id))
+        return visible
+
+    return get_typeahead_index().search(prefix, limit, allowed)
+
+
+def update_resource_entry(instance, sender, **kwargs):
+    if typeahead_index.built is not None:
+        typeahead_index.add(*resource_entry(
+            sender.__name__.lower(), instance.id, instance.title, instance.get_absolute_url(),
+            instance.popular_count))
+
+
+def update_keyword_entry(instance, sender, **kwargs):
+    if typeahead_index.built is not None:
+        typeahead_index.add(*keyword_entry(instance.id, instance.name, instance.slug))
+
+
+def update_region_entry(instance, sender, **kwargs):
+    if typeahead_index.built is not None:
+        typeahead_index.add(*region_entry(instance.id, instance.name, instance.code))
+
+
+def update_user_entry(instance, sender, **kwargs):
+    if typeahead_index.built is not None and instance.username != 'AnonymousUser':
+        typeahead_index.add(*user_entry(instance.id, instance.username, instance.first_name, instance.last_name))
+
+
+def remove_entry(entry_type):
+    def remove(instance, sender, **kwargs):
+        typeahead_index.remove((entry_type, instance.id))
+    return remove
+
+
+for resource_model in (Layer, Map, Document):
+    signals.post_save.connect(update_resource_entry, sender=resource_model)
+    signals.post_delete.connect(
+        remove_entry(resource_model.__name__.lower()), sender=resource_model, weak=False)
+signals.post_save.connect(update_keyword_entry, sender=Tag)
+signals.post_delete.connect(remove_entry('keyword'), sender=Tag, weak=False)
+signals.post_save.connect(update_region_entry, sender=Region)
+signals.post_delete.connect(remove_entry('region'), sender=Region, weak=False)
+signals.post_save.connect(update_user_entry, sender=get_user_model())
+signals.post_delete.connect(remove_entry('user'), sender=get_user_model(), weak=False)
@@ -18,6 +18,7 @@
 #########################################################################
 
 import os
+import threading
 from lxml import etree
 from django.conf import settings
 from ConfigParser import SafeConfigParser
@@ -50,6 +51,58 @@ CONFIGURATION = {
 }
 
 
+ISO_METADATA = '{http://www.isotc211.org/2005/gmd}MD_Metadata'
+
+_servers = threading.local()
+
+
+def get_pycsw_configuration():
+    """
+    Returns the pycsw configuration, the settings of PYCSW
+    overriding the system defaults of CONFIGURATION
+    """
+    mdict = dict(settings.PYCSW['CONFIGURATION'], **CONFIGURATION)
+    # override server system defaults with user specified directives
+    mdict['server'] = dict(CONFIGURATION['server'], **settings.PYCSW['CONFIGURATION'].get('server', {}))
+
+    config = SafeConfigParser()
+    for section, options in mdict.iteritems():
+        config.add_section(section)
+        for option, value in options.iteritems():
+            config.set(section, option, value)
+    return config
+
+
+def get_csw_server(env):
+    """
+    Returns the pycsw server of the current thread, ready to handle a
+    request with the given environment. Loading the configuration,
+    the profiles, the output schemas and the repository is done once,
+    when the server of a thread is created.
+    """
+    csw = getattr(_servers, 'csw', None)
+    if csw is None:
+        csw = server.Csw(get_pycsw_configuration(), env)
+        if hasattr(csw, 'response'):
+            # the configuration or the repository could not be loaded
+            return csw
+        _servers.csw = csw
+
+    # forget the previous request
+    csw.environ = env
+    csw.kvp = {}
+    csw.mode = 'csw'
+    csw.async = False
+    csw.soap = False
+    csw.request = None
+    csw.requesttype = None
+    csw.exception = False
+    for attribute in ('response', 'contenttype'):
+        if hasattr(csw, attribute):
+            delattr(csw, attribute)
+    return csw
+
+
 class CatalogueBackend(GenericCatalogueBackend):
     def __init__(self, *args, **kwargs):
         super(CatalogueBackend, self).__init__(*args, **kwargs)
@@ -63,11 +116,15 @@ class CatalogueBackend(GenericCatalogueBackend):
         pass
 
     def get_record(self, uuid):
-        results = self._csw_local_dispatch(identifier=uuid)
-        if len(results) < 1:
-            return None
+        result = self._get_stored_record(uuid)
+
+        if result is None:
+            # pycsw converts the records of the other types to ISO
+            results = self._csw_local_dispatch(identifier=uuid)
+            if len(results) < 1:
+                return None
 
-        result = etree.fromstring(results).find('{http://www.isotc211.org/2005/gmd}MD_Metadata')
+            result = etree.fromstring(results).find(ISO_METADATA)
 
         if result is None:
             return None
@@ -83,6 +140,30 @@ class CatalogueBackend(GenericCatalogueBackend):
         record.links['download'] = self.catalogue.extract_links(record)
         return record
 
+    def _get_stored_record(self, uuid):
+        """
+        Returns the ISO document of a record straight from the database, as
+        GetRecordById would, None when it is not stored as ISO metadata
+        """
+        from geonode.base.models import ResourceBase
+
+        rows = ResourceBase.objects.filter(uuid=uuid).values_list('csw_typename', 'metadata_xml')[:1]
+        if not rows:
+            return None
+
+        typename, metadata_xml = rows[0]
+        if typename != 'gmd:MD_Metadata' or not metadata_xml:
+            return None
+
+        try:
+            result = etree.fromstring(metadata_xml.encode('utf-8'))
+        except (etree.XMLSyntaxError, ValueError):
+            return None
+
+        if result.tag != ISO_METADATA:
+            return None
+        return result
+
     def search_records(self, keywords, start, limit, bbox):
         with self.catalogue:
             lresults = self._csw_local_dispatch(keywords, keywords, start+1, limit, bbox)
@@ -109,24 +190,7 @@ class CatalogueBackend(GenericCatalogueBackend):
         HTTP-less CSW
         """
 
-        # serialize pycsw settings into SafeConfigParser
-        # object for interaction with pycsw
-        mdict = dict(settings.PYCSW['CONFIGURATION'], **CONFIGURATION)
-        if 'server' in settings.PYCSW['CONFIGURATION']:
-            # override server system defaults with user specified directives
-            mdict['server'].update(settings.PYCSW['CONFIGURATION']['server'])
-        config = SafeConfigParser()
-
-        for section, options in mdict.iteritems():
-            config.add_section(section)
-            for option, value in options.iteritems():
-                config.set(section, option, value)
-
-        # fake HTTP environment variable
-        os.environ['QUERY_STRING'] = ''
-
-        # init pycsw
-        csw = server.Csw(config)
+        csw = get_csw_server({'QUERY_STRING': ''})
 
         # fake HTTP method
         csw.requesttype = 'POST'
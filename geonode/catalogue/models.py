@@ -18,18 +18,26 @@
 #########################################################################
 
 import errno
+import hashlib
 import logging
+import re
 
 from django.conf import settings
+from django.core.cache import cache
 from django.db.models import signals
 from geonode.layers.models import Layer
 from geonode.documents.models import Document
 from geonode.catalogue import get_catalogue
-from geonode.base.models import Link, ResourceBase
+from geonode.base.links import reconcile_links
+from geonode.base.models import ResourceBase
 
 
 LOGGER = logging.getLogger(__name__)
 
+CATALOGUE_SYNC_SCHEDULED = 'catalogue_sync_scheduled_%s'
+
+DATE_STAMP = re.compile(r'<gmd:dateStamp>.*?</gmd:dateStamp>', re.DOTALL)
+
 
 def catalogue_pre_delete(instance, sender, **kwargs):
     """Removes the layer from the catalogue
@@ -39,14 +47,67 @@ def catalogue_pre_delete(instance, sender, **kwargs):
 
 
 def catalogue_post_save(instance, sender, **kwargs):
-    """Get information from catalogue
+    """Updates the catalogue record of a resource, right away or, when
+       CATALOGUE_SYNC_DELAY is set, with all the other changes of the
+       next seconds in the sync_catalogue_record task
     """
+    if settings.CATALOGUE_SYNC_DELAY is None:
+        sync_catalogue_record(instance)
+        return
+
+    from geonode.tasks.update import sync_catalogue_record as sync_catalogue_record_task
+
+    if cache.add(CATALOGUE_SYNC_SCHEDULED % instance.id, True, settings.CATALOGUE_SYNC_DELAY + 60):
+        sync_catalogue_record_task.apply_async(args=(instance.id,), countdown=settings.CATALOGUE_SYNC_DELAY)
+
+
+def get_metadata_hash(md_doc):
+    """Returns the hash of a metadata document, leaving out its date stamp
+       which changes every time the resource is saved
+    """
+    return hashlib.md5(DATE_STAMP.sub('', md_doc).encode('utf-8')).hexdigest()
+
+
+def get_distribution(instance, record):
+    """Returns the distribution url and description of a resource,
+       from the online link of its catalogue record when there is one
+    """
+    if hasattr(record.distribution, 'online'):
+        onlineresources = [r for r in record.distribution.online if r.protocol == "WWW:LINK-1.0-http--link"]
+        if len(onlineresources) == 1:
+            res = onlineresources[0]
+            return res.url, res.description
+        return instance.distribution_url, instance.distribution_description
+
+    durl = settings.SITEURL
+    if durl[-1] == '/':  # strip trailing slash
+        durl = durl[:-1]
+
+    durl = '%s%s' % (durl, instance.get_absolute_url())
+    return durl, 'Online link to the \'%s\' description on GeoNode ' % instance.title
+
+
+def sync_catalogue_record(instance):
+    """Renders the metadata document of a resource and, if it changed,
+       sends it to the catalogue and stores the document, its text,
+       geometry, metadata links and distribution url at once
+    """
+    catalogue = get_catalogue()
+
+    # generate an XML document (GeoNode's default is ISO)
+    md_doc = catalogue.catalogue.csw_gen_xml(instance, 'catalogue/full_metadata.xml')
+    csw_wkt_geometry = instance.geographic_bounding_box.split(';')[-1]
+
+    stored = ResourceBase.objects.filter(id=instance.id).values('metadata_xml', 'csw_wkt_geometry')[0]
+    if stored['csw_wkt_geometry'] == csw_wkt_geometry and stored['metadata_xml'] and \
+            get_metadata_hash(stored['metadata_xml']) == get_metadata_hash(md_doc):
+        return
+
     try:
-        catalogue = get_catalogue()
         catalogue.create_record(instance)
         record = catalogue.get_record(instance.uuid)
     except EnvironmentError, err:
-        msg = 'Could not connect to catalogue to save information for layer "%s"' % instance.name
+        msg = 'Could not connect to catalogue to save information for "%s"' % instance.title
         if err.reason.errno == errno.ECONNREFUSED:
             LOGGER.warn(msg, err)
             return
@@ -61,68 +122,21 @@ def catalogue_post_save(instance, sender, **kwargs):
     assert hasattr(record, 'links'), msg
 
     # Create the different metadata links with the available formats
-    for mime, name, metadata_url in record.links['metadata']:
-        Link.objects.get_or_create(resource=instance.resourcebase_ptr,
-                                   url=metadata_url,
-                                   defaults=dict(name=name,
-                                                 extension='xml',
-                                                 mime=mime,
-                                                 link_type='metadata')
-                                   )
-
-    # generate an XML document (GeoNode's default is ISO)
-    md_doc = catalogue.catalogue.csw_gen_xml(instance, 'catalogue/full_metadata.xml')
-
-    csw_anytext = catalogue.catalogue.csw_gen_anytext(md_doc)
-
-    csw_wkt_geometry = instance.geographic_bounding_box.split(';')[-1]
-
-    resources = ResourceBase.objects.filter(id=instance.resourcebase_ptr.id)
-
-    resources.update(metadata_xml=md_doc)
-    resources.update(csw_wkt_geometry=csw_wkt_geometry)
-    resources.update(csw_anytext=csw_anytext)
-
+    reconcile_links(instance, [dict(url=metadata_url, name=name, extension='xml', mime=mime, link_type='metadata')
+                               for mime, name, metadata_url in record.links['metadata']])
 
-def catalogue_pre_save(instance, sender, **kwargs):
-    """Send information to catalogue
-    """
-    record = None
-
-    # if the layer is in the catalogue, try to get the distribution urls
-    # that cannot be precalculated.
-    try:
-        catalogue = get_catalogue()
-        record = catalogue.get_record(instance.uuid)
-    except EnvironmentError, err:
-        msg = 'Could not connect to catalogue to save information for layer "%s"' % instance.name
-        LOGGER.warn(msg, err)
-        raise err
-
-    if record is None:
-        return
-
-    # Fill in the url for the catalogue
-    if hasattr(record.distribution, 'online'):
-        onlineresources = [r for r in record.distribution.online if r.protocol == "WWW:LINK-1.0-http--link"]
-        if len(onlineresources) == 1:
-            res = onlineresources[0]
-            instance.distribution_url = res.url
-            instance.distribution_description = res.description
-    else:
-            durl = settings.SITEURL
-            if durl[-1] == '/':  # strip trailing slash
-                durl = durl[:-1]
+    distribution_url, distribution_description = get_distribution(instance, record)
 
-            durl = '%s%s' % (durl, instance.get_absolute_url())
-            instance.distribution_url = durl
-            instance.distribution_description = 'Online link to the \'%s\' description on GeoNode ' % instance.title
+    ResourceBase.objects.filter(id=instance.id).update(
+        metadata_xml=md_doc,
+        csw_wkt_geometry=csw_wkt_geometry,
+        csw_anytext=catalogue.catalogue.csw_gen_anytext(md_doc),
+        distribution_url=distribution_url,
+        distribution_description=distribution_description)
 
 
 if 'geonode.catalogue' in settings.INSTALLED_APPS:
-    signals.pre_save.connect(catalogue_pre_save, sender=Layer)
     signals.post_save.connect(catalogue_post_save, sender=Layer)
     signals.pre_delete.connect(catalogue_pre_delete, sender=Layer)
-    signals.pre_save.connect(catalogue_pre_save, sender=Document)
     signals.post_save.connect(catalogue_post_save, sender=Document)
     signals.pre_delete.connect(catalogue_pre_delete, sender=Document)
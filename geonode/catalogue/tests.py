@@ -27,3 +27,49 @@ class CatalogueTest(TestCase):
         Tests the get_catalogue function works.
         """
         c = get_catalogue()  # noqa
+
+    def test_metadata_hash(self):
+        """
+        Tests that the metadata hash ignores the date stamp of the document.
+        """
+        from geonode.catalogue.models import get_metadata_hash
+
+        md_doc = ('<gmd:MD_Metadata><gmd:dateStamp>\n<gco:DateTime>%s</gco:DateTime>\n</gmd:dateStamp>'
+                  '<gmd:title>%s</gmd:title></gmd:MD_Metadata>')
+        self.assertEquals(get_metadata_hash(md_doc % ('2015-01-01T00:00:00Z', 'title')),
+                          get_metadata_hash(md_doc % ('2015-06-01T12:00:00Z', 'title')))
+        self.assertNotEquals(get_metadata_hash(md_doc % ('2015-01-01T00:00:00Z', 'title')),
+                             get_metadata_hash(md_doc % ('2015-01-01T00:00:00Z', 'other title')))
+
+    def test_csw_server_reused(self):
+        """
+        Tests that the pycsw server of a thread is reused without the state of the previous request.
+        """
+        from geonode.catalogue.backends.pycsw_local import get_csw_server
+
+        csw = get_csw_server({'QUERY_STRING': ''})
+        csw.kvp = {'id': ['previous']}
+        csw.response = 'previous response'
+
+        self.assertTrue(get_csw_server({'QUERY_STRING': ''}) is csw)
+        self.assertEquals(csw.kvp, {})
+        self.assertFalse(hasattr(csw, 'response'))
+
+    def test_get_stored_record(self):
+        """
+        Tests that get_record reads the ISO records straight from the database.
+        """
+        import uuid
+        from geonode.base.models import ResourceBase
+
+        metadata_xml = ('<gmd:MD_Metadata xmlns:gmd="http://www.isotc211.org/2005/gmd" '
+                        'xmlns:gco="http://www.isotc211.org/2005/gco"><gmd:fileIdentifier>'
+                        '<gco:CharacterString>%s</gco:CharacterString></gmd:fileIdentifier></gmd:MD_Metadata>')
+        resource = ResourceBase.objects.create(title='stored record', uuid=str(uuid.uuid4()))
+        ResourceBase.objects.filter(id=resource.id).update(
+            csw_typename='gmd:MD_Metadata', metadata_xml=metadata_xml % resource.uuid)
+
+        catalogue = get_catalogue()
+        record = catalogue.get_record(resource.uuid)
+        self.assertEquals(record.identifier, resource.uuid)
+        self.assertEquals(record.links['metadata'], catalogue.catalogue.urls_for_uuid(resource.uuid))
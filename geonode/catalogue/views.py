@@ -23,8 +23,7 @@ from django.conf import settings
 from django.http import HttpResponse, HttpResponseRedirect
 from django.shortcuts import render_to_response
 from django.views.decorators.csrf import csrf_exempt
-from pycsw import server
-from geonode.catalogue.backends.pycsw_local import CONFIGURATION
+from geonode.catalogue.backends.pycsw_local import get_csw_server
 
 
 @csrf_exempt
@@ -36,13 +35,11 @@ def csw_global_dispatch(request):
     if settings.CATALOGUE['default']['ENGINE'] != 'geonode.catalogue.backends.pycsw_local':
         return HttpResponseRedirect(settings.CATALOGUE['default']['URL'])
 
-    mdict = dict(settings.PYCSW['CONFIGURATION'], **CONFIGURATION)
-
     env = request.META.copy()
     env.update({'local.app_root': os.path.dirname(__file__),
                 'REQUEST_URI': request.build_absolute_uri()})
 
-    csw = server.Csw(mdict, env)
+    csw = get_csw_server(env)
 
     content = csw.dispatch_wsgi()
 
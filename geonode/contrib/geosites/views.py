@@ -1,23 +1,24 @@
+import hashlib
 import json
 
 from django.contrib.sites.models import get_current_site
-from django.http import Http404, HttpResponse
+from django.http import Http404, HttpResponse, HttpResponseNotModified
 from django.contrib.auth import authenticate, get_user_model, login
 from django.utils.translation import ugettext as _
 from django.conf import settings
 from django.shortcuts import redirect
 from django.db.models import Q
 
-from guardian.shortcuts import get_objects_for_user
 from account.views import LoginView
 
 from geonode.utils import _get_basic_auth_info
 from geonode.layers.views import _resolve_layer, layer_detail
 from geonode.documents.views import _resolve_document, document_detail
 from geonode.maps.views import _resolve_map, map_detail
-from geonode.base.models import ResourceBase
 from geonode.layers.models import Layer
 from geonode.geoserver.helpers import ogc_server_settings
+from geonode.geoserver.views import layer_acls_etag
+from geonode.security.models import get_layer_acls
 from geonode.groups.models import GroupProfile
 from geonode.views import AjaxLoginForm
 
@@ -107,19 +108,17 @@ def layer_acls(request):
                                 status=401,
                                 mimetype="text/plain")
 
-    # Include permissions on the anonymous user
-    # use of polymorphic selectors/functions to optimize performances
-    site_resources = resources_for_site()
-    resources_readable = get_objects_for_user(acl_user, 'view_resourcebase',
-                                              ResourceBase.objects.instance_of(Layer).filter(id__in=site_resources))
-    layer_writable = get_objects_for_user(acl_user, 'change_layer_data',
-                                          Layer.objects.filter(id__in=site_resources))
+    # Served from the materialized ACLs, restricted to the layers of the site
+    read_write, read_only, version = get_layer_acls(acl_user)
+    site_layers = sorted(Layer.objects.filter(id__in=resources_for_site()).values_list('typename', flat=True))
+    version = hashlib.md5(json.dumps([version, site_layers])).hexdigest()
+    etag = layer_acls_etag(acl_user, version)
+    if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+        return HttpResponseNotModified()
 
-    _read = set(Layer.objects.filter(id__in=resources_readable).values_list('typename', flat=True))
-    _write = set(layer_writable.values_list('typename', flat=True))
-
-    read_only = _read ^ _write
-    read_write = _read & _write
+    site_layers = set(site_layers)
+    read_write = read_write & site_layers
+    read_only = read_only & site_layers
 
     result = {
         'rw': list(read_write),
@@ -132,7 +131,9 @@ def layer_acls(request):
         result['fullname'] = acl_user.get_full_name()
         result['email'] = acl_user.email
 
-    return HttpResponse(json.dumps(result), mimetype="application/json")
+    response = HttpResponse(json.dumps(result), mimetype="application/json")
+    response['ETag'] = etag
+    return response
 
 
 def ajax_login(request):
@@ -13,11 +13,13 @@ from django.contrib.staticfiles import finders
 from django.utils.translation import ugettext_lazy as _
 
 from geonode.layers.models import Layer
-from geonode.base.models import ResourceBase, resourcebase_post_save, Link
+from geonode.base.models import ResourceBase, resourcebase_post_save
+from geonode.base.links import reconcile_links
 from geonode.documents.enumerations import DOCUMENT_TYPE_MAP, DOCUMENT_MIMETYPE_MAP
 from geonode.maps.signals import map_changed_signal
 from geonode.maps.models import Map
 from geonode.security.models import remove_object_permissions
+from geonode.base.counts import invalidate_resource_counts
 
 from icraf_dr.models import Main #^^
 from geonode.base.models import Region #^^
@@ -233,8 +235,10 @@ def pre_save_document(instance, sender, **kwargs):
         instance.bbox_y1 = 90
 
 
-def post_save_document(instance, *args, **kwargs):
-
+def get_document_links(instance):
+    """
+    Returns the download link of a document, to its file or its url
+    """
     name = None
     ext = instance.extension
     mime_type_map = DOCUMENT_MIMETYPE_MAP
@@ -252,15 +256,12 @@ def post_save_document(instance, *args, **kwargs):
         url = instance.doc_url
 
     if name and url:
-        Link.objects.get_or_create(
-            resource=instance.resourcebase_ptr,
-            url=url,
-            defaults=dict(
-                extension=ext,
-                name=name,
-                mime=mime,
-                url=url,
-                link_type='data',))
+        return [dict(url=url, name=name, extension=ext, mime=mime, link_type='data')]
+    return []
+
+
+def post_save_document(instance, *args, **kwargs):
+    reconcile_links(instance.resourcebase_ptr, get_document_links(instance))
 
 
 def create_thumbnail(sender, instance, created, **kwargs):
@@ -285,4 +286,6 @@ signals.post_save.connect(create_thumbnail, sender=Document)
 signals.post_save.connect(post_save_document, sender=Document)
 signals.post_save.connect(resourcebase_post_save, sender=Document)
 signals.pre_delete.connect(pre_delete_document, sender=Document)
+signals.post_save.connect(invalidate_resource_counts, sender=Document)
+signals.post_delete.connect(invalidate_resource_counts, sender=Document)
 map_changed_signal.connect(update_documents_extent)
@@ -27,26 +27,27 @@ import time
 import errno
 import uuid
 import datetime
+import hashlib
 from bs4 import BeautifulSoup
 import geoserver
-import httplib2
 
 
 from urlparse import urlparse
 from urlparse import urlsplit
 from threading import local
-from collections import namedtuple
+from collections import defaultdict, namedtuple
 from itertools import cycle, izip
+from multiprocessing.pool import ThreadPool
 from lxml import etree
 import xml.etree.ElementTree as ET
 from decimal import Decimal
 
 from owslib.wcs import WebCoverageService
-from owslib.util import http_post
 
 from django.core.exceptions import ImproperlyConfigured
 from django.contrib.contenttypes.models import ContentType
-from django.db.models.signals import pre_delete
+from django.db import router, transaction
+from django.db.models.deletion import Collector
 from django.template.loader import render_to_string
 from django.conf import settings
 from django.utils.translation import ugettext as _
@@ -66,6 +67,7 @@ from geoserver.resource import FeatureType, Coverage
 from geoserver.support import DimensionInfo
 
 from geonode import GeoNodeException
+from geonode.http_pool import PooledHttpClient
 from geonode.layers.utils import layer_type, get_files
 from geonode.layers.models import Layer, Attribute, Style
 from geonode.layers.enumerations import LAYER_ATTRIBUTE_NUMERIC_DATA_TYPES
@@ -73,6 +75,13 @@ from geonode.layers.enumerations import LAYER_ATTRIBUTE_NUMERIC_DATA_TYPES
 
 logger = logging.getLogger(__name__)
 
+# number of GeoServer resources gs_slurp processes and commits together
+SLURP_BATCH_SIZE = 50
+
+# unique values are only listed for attributes with fewer values than this
+# TODO: find way of figuring out threshold better
+STATISTICS_UNIQUE_VALUES_LIMIT = 10000
+
 if not hasattr(settings, 'OGC_SERVER'):
     msg = (
         'Please configure OGC_SERVER when enabling geonode.geoserver.'
@@ -360,11 +369,27 @@ def gs_slurp(
         filter=None,
         skip_unadvertised=False,
         skip_geonode_registered=False,
-        remove_deleted=False):
+        remove_deleted=False,
+        workers=1,
+        checkpoint=None,
+        skip_unchanged=False,
+        dry_run=False):
     """Configure the layers available in GeoServer in GeoNode.
 
        It returns a list of dictionaries with the name of the layer,
        the result of the operation and the errors and traceback if it failed.
+
+       Resources are processed in batches of SLURP_BATCH_SIZE: the GeoServer
+       and WPS requests needed to refresh the attributes are run by a pool of
+       ``workers`` threads and the database writes of a batch are committed
+       together. When ``checkpoint`` is the path of a file, the processed
+       layers are recorded there after every batch so that an interrupted run
+       resumes where it stopped. With ``skip_unchanged`` the attributes of a
+       layer are only refreshed when its GeoServer configuration changed since
+       the run that recorded it in the checkpoint file.
+
+       With ``remove_deleted`` the GeoNode layers whose resource is no longer
+       in GeoServer are deleted, ``dry_run`` only reports them.
     """
     if console is None:
         console = open(os.devnull, 'w')
@@ -433,75 +458,84 @@ def gs_slurp(
             'updated': 0,
             'created': 0,
             'deleted': 0,
+            'skipped': 0,
         },
         'layers': [],
         'deleted_layers': []
     }
+    state = _read_slurp_checkpoint(checkpoint)
+    pool = ThreadPool(workers) if workers > 1 else None
     start = datetime.datetime.now()
-    for i, resource in enumerate(resources):
-        name = resource.name
-        the_store = resource.store
-        workspace = the_store.workspace
-        try:
-            layer, created = Layer.objects.get_or_create(name=name, defaults={
-                "workspace": workspace.name,
-                "store": the_store.name,
-                "storeType": the_store.resource_type,
-                "typename": "%s:%s" % (workspace.name.encode('utf-8'), resource.name.encode('utf-8')),
-                "title": resource.title or 'No title provided',
-                "abstract": resource.abstract or 'No abstract provided',
-                "owner": owner,
-                "uuid": str(uuid.uuid4()),
-                "bbox_x0": Decimal(resource.latlon_bbox[0]),
-                "bbox_x1": Decimal(resource.latlon_bbox[1]),
-                "bbox_y0": Decimal(resource.latlon_bbox[2]),
-                "bbox_y1": Decimal(resource.latlon_bbox[3])
-            })
-
-            # recalculate the layer statistics
-            set_attributes(layer, overwrite=True)
-
-            # Fix metadata links if the ip has changed
-            if layer.link_set.metadata().count() > 0:
-                if not created and settings.SITEURL not in layer.link_set.metadata()[0].url:
-                    layer.link_set.metadata().delete()
-                    layer.save()
-                    metadata_links = []
-                    for link in layer.link_set.metadata():
-                        metadata_links.append((link.mime, link.name, link.url))
-                    resource.metadata_links = metadata_links
-                    cat.save(resource)
-
-        except Exception as e:
-            if ignore_errors:
-                status = 'failed'
-                exception_type, error, traceback = sys.exc_info()
+    try:
+        for offset in xrange(0, number, SLURP_BATCH_SIZE):
+            batch = []
+            for i, resource in enumerate(resources[offset:offset + SLURP_BATCH_SIZE], offset):
+                item = {
+                    'index': i,
+                    'name': resource.name,
+                    'resource': resource,
+                    'typename': '%s:%s' % (resource.store.workspace.name, resource.name),
+                }
+                if item['typename'] in state['processed']:
+                    item['status'] = 'skipped'
+                else:
+                    _slurp_get_or_create(item, owner, ignore_errors, verbosity)
+                batch.append(item)
+
+            # the GeoServer and WPS requests are the slow part, run them in parallel
+            to_fetch = [fetch for fetch in batch if 'layer' in fetch]
+            if skip_unchanged:
+                to_fetch = [fetch for fetch in to_fetch if fetch['created'] or
+                            state['fingerprints'].get(fetch['typename']) != fetch['fingerprint']]
+            # layers of the same store share a single DescribeFeatureType request
+            stores = {}
+            for fetch in to_fetch:
+                if fetch['layer'].storeType == 'dataStore':
+                    stores.setdefault((fetch['layer'].workspace, fetch['layer'].store), []).append(fetch)
+            stores = [group for group in stores.values() if len(group) > 1]
+            if pool is not None:
+                pool.map(_slurp_describe_store, stores)
+                pool.map(_slurp_fetch_attributes, to_fetch)
             else:
+                map(_slurp_describe_store, stores)
+                map(_slurp_fetch_attributes, to_fetch)
+
+            with transaction.atomic():
+                for item in batch:
+                    if 'layer' in item:
+                        _slurp_update(item, cat, ignore_errors, verbosity)
+
+            for item in batch:
+                if item.get('statistics') and item.get('status') != 'failed':
+                    queue_attributes_statistics(item['layer'], item['statistics'])
+
+            for item in batch:
+                name = item['name']
+                status = item.get('status')
+                if status is None:
+                    status = 'created' if item['created'] else 'updated'
+                    state['fingerprints'][item['typename']] = item['fingerprint']
+                if status != 'failed':
+                    state['processed'].add(item['typename'])
+                output['stats'][status] += 1
+
+                msg = "[%s] Layer %s (%d/%d)" % (status, name, item['index'] + 1, number)
+                info = {'name': name, 'status': status}
+                if status == 'failed':
+                    info['exception_type'], info['error'], info['traceback'] = item['exc_info']
+                output['layers'].append(info)
                 if verbosity > 0:
-                    msg = "Stopping process because --ignore-errors was not set and an error was found."
-                    print >> sys.stderr, msg
-                raise Exception(
-                    'Failed to process %s' %
-                    resource.name.encode('utf-8'), e), None, sys.exc_info()[2]
-        else:
-            if created:
-                layer.set_default_permissions()
-                status = 'created'
-                output['stats']['created'] += 1
-            else:
-                status = 'updated'
-                output['stats']['updated'] += 1
-
-        msg = "[%s] Layer %s (%d/%d)" % (status, name, i + 1, number)
-        info = {'name': name, 'status': status}
-        if status == 'failed':
-            output['stats']['failed'] += 1
-            info['traceback'] = traceback
-            info['exception_type'] = exception_type
-            info['error'] = error
-        output['layers'].append(info)
-        if verbosity > 0:
-            print >> console, msg
+                    print >> console, msg
+
+            _write_slurp_checkpoint(checkpoint, state)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    # the run is complete, the next one starts from scratch
+    state['processed'] = set()
+    _write_slurp_checkpoint(checkpoint, state)
 
     if remove_deleted:
         q = Layer.objects.filter()
@@ -527,30 +561,18 @@ def gs_slurp(
         # filtered per options passed to updatelayers: --workspace, --store, --skip-unadvertised
         # add any layers not found in GeoServer to deleted_layers (must match
         # workspace and store as well):
-        deleted_layers = []
-        for layer in q:
+        geoserver_keys = set((resource.workspace.name, resource.store.name, resource.name)
+                             for resource in resources_for_delete_compare)
+        deleted_ids = [layer_id for layer_id, layer_name, layer_workspace, layer_store
+                       in q.values_list('id', 'name', 'workspace', 'store')
+                       if (layer_workspace, layer_store, layer_name) not in geoserver_keys]
+        deleted_layers = list(Layer.objects.filter(id__in=deleted_ids).order_by('name'))
+        for layer in deleted_layers:
             logger.debug(
-                "GeoNode Layer info: name: %s, workspace: %s, store: %s",
+                "----- Layer %s (workspace: %s, store: %s) not matched, marked for deletion ---------------",
                 layer.name,
                 layer.workspace,
                 layer.store)
-            layer_found_in_geoserver = False
-            for resource in resources_for_delete_compare:
-                # if layer.name matches a GeoServer resource, check also that
-                # workspace and store match, mark valid:
-                if layer.name == resource.name:
-                    if layer.workspace == resource.workspace.name and layer.store == resource.store.name:
-                        logger.debug(
-                            "Matches GeoServer layer: name: %s, workspace: %s, store: %s",
-                            resource.name,
-                            resource.workspace.name,
-                            resource.store.name)
-                        layer_found_in_geoserver = True
-            if not layer_found_in_geoserver:
-                logger.debug(
-                    "----- Layer %s not matched, marked for deletion ---------------",
-                    layer.name)
-                deleted_layers.append(layer)
 
         number_deleted = len(deleted_layers)
         if verbosity > 1:
@@ -558,31 +580,15 @@ def gs_slurp(
                 "\nFound %d layers to delete" % number_deleted
             print >> console, msg
 
+        if dry_run:
+            statuses = dict((layer.id, ('delete_dry_run', None)) for layer in deleted_layers)
+        else:
+            statuses = _delete_orphan_layers(deleted_layers)
+
         for i, layer in enumerate(deleted_layers):
-            logger.debug(
-                "GeoNode Layer to delete: name: %s, workspace: %s, store: %s",
-                layer.name,
-                layer.workspace,
-                layer.store)
-            try:
-                # delete ratings, comments, and taggit tags:
-                ct = ContentType.objects.get_for_model(layer)
-                OverallRating.objects.filter(
-                    content_type=ct,
-                    object_id=layer.id).delete()
-                Comment.objects.filter(
-                    content_type=ct,
-                    object_id=layer.id).delete()
-                layer.keywords.clear()
-
-                layer.delete()
+            status, exc_info = statuses[layer.id]
+            if status == "delete_succeeded":
                 output['stats']['deleted'] += 1
-                status = "delete_succeeded"
-            except Exception as e:
-                status = "delete_failed"
-            finally:
-                from .signals import geoserver_pre_delete
-                pre_delete.connect(geoserver_pre_delete, sender=Layer)
 
             msg = "[%s] Layer %s (%d/%d)" % (status,
                                              layer.name,
@@ -590,10 +596,7 @@ def gs_slurp(
                                              number_deleted)
             info = {'name': layer.name, 'status': status}
             if status == "delete_failed":
-                exception_type, error, traceback = sys.exc_info()
-                info['traceback'] = traceback
-                info['exception_type'] = exception_type
-                info['error'] = error
+                info['exception_type'], info['error'], info['traceback'] = exc_info
             output['deleted_layers'].append(info)
             if verbosity > 0:
                 print >> console, msg
@@ -605,6 +608,203 @@ def gs_slurp(
     return output
 
 
+def _delete_orphan_layers(layers):
+    """
+    Deletes GeoNode layers whose resource no longer exists in GeoServer.
+
+    Ratings, comments and keywords are cleared with one query each and the
+    layers are deleted in bulk; if that fails they are deleted one by one
+    so that only the faulty ones are reported. Returns a dictionary mapping
+    each layer id to a (status, exc_info) tuple.
+    """
+    statuses = {}
+    if not layers:
+        return statuses
+
+    def clear_related(layer_ids):
+        # delete ratings, comments, and taggit tags:
+        ct = ContentType.objects.get_for_model(Layer)
+        OverallRating.objects.filter(content_type=ct, object_id__in=layer_ids).delete()
+        Comment.objects.filter(content_type=ct, object_id__in=layer_ids).delete()
+        Layer.keywords.through.objects.filter(content_type=ct, object_id__in=layer_ids).delete()
+
+    # there is nothing left to remove in GeoServer, see geoserver_pre_delete
+    for layer in layers:
+        layer._skip_geoserver_delete = True
+
+    layer_ids = [layer.id for layer in layers]
+    try:
+        with transaction.atomic():
+            clear_related(layer_ids)
+            # deletes these very instances at once, so that the
+            # delete signals receive them with their flag
+            collector = Collector(using=router.db_for_write(Layer))
+            collector.collect(layers)
+            collector.delete()
+    except Exception:
+        logger.exception('Bulk deletion of orphan layers failed, deleting them one by one')
+        for layer in layers:
+            try:
+                with transaction.atomic():
+                    clear_related([layer.id])
+                    layer.delete()
+            except Exception:
+                statuses[layer.id] = ("delete_failed", sys.exc_info())
+            else:
+                statuses[layer.id] = ("delete_succeeded", None)
+    else:
+        for layer_id in layer_ids:
+            statuses[layer_id] = ("delete_succeeded", None)
+
+    return statuses
+
+
+def _read_slurp_checkpoint(path):
+    """
+    Reads the gs_slurp checkpoint file: the typenames processed by the
+    current run and the fingerprints of the resources seen by previous runs.
+    """
+    state = {'processed': [], 'fingerprints': {}}
+    if path and os.path.exists(path):
+        with open(path) as f:
+            state.update(json.load(f))
+    state['processed'] = set(state['processed'])
+    return state
+
+
+def _write_slurp_checkpoint(path, state):
+    if not path:
+        return
+    # write to a temporary file first so that an interruption
+    # never leaves a truncated checkpoint behind
+    tmp_path = '%s.tmp' % path
+    with open(tmp_path, 'w') as f:
+        json.dump({'processed': sorted(state['processed']),
+                   'fingerprints': state['fingerprints']}, f)
+    os.rename(tmp_path, path)
+
+
+def _resource_fingerprint(resource):
+    """
+    Returns a string that changes whenever the GeoServer configuration
+    of the resource changes.
+    """
+    if resource.dom is None:
+        resource.fetch()
+    modified = resource.dom.find('dateModified')
+    if modified is not None and modified.text:
+        return modified.text
+    return hashlib.md5(ET.tostring(resource.dom)).hexdigest()
+
+
+def _slurp_failure(item, exc_info, ignore_errors, verbosity):
+    """
+    Records the error of a gs_slurp item, or stops the process
+    when errors are not ignored.
+    """
+    exception_type, error, traceback = exc_info
+    if not ignore_errors:
+        if verbosity > 0:
+            msg = "Stopping process because --ignore-errors was not set and an error was found."
+            print >> sys.stderr, msg
+        raise Exception(
+            'Failed to process %s' %
+            item['name'].encode('utf-8'), error), None, traceback
+    item['status'] = 'failed'
+    item['exc_info'] = exc_info
+    item.pop('layer', None)
+
+
+def _slurp_get_or_create(item, owner, ignore_errors, verbosity):
+    resource = item['resource']
+    the_store = resource.store
+    workspace = the_store.workspace
+    try:
+        with transaction.atomic():
+            layer, created = Layer.objects.get_or_create(name=resource.name, defaults={
+                "workspace": workspace.name,
+                "store": the_store.name,
+                "storeType": the_store.resource_type,
+                "typename": "%s:%s" % (workspace.name.encode('utf-8'), resource.name.encode('utf-8')),
+                "title": resource.title or 'No title provided',
+                "abstract": resource.abstract or 'No abstract provided',
+                "owner": owner,
+                "uuid": str(uuid.uuid4()),
+                "bbox_x0": Decimal(resource.latlon_bbox[0]),
+                "bbox_x1": Decimal(resource.latlon_bbox[1]),
+                "bbox_y0": Decimal(resource.latlon_bbox[2]),
+                "bbox_y1": Decimal(resource.latlon_bbox[3])
+            })
+            if created:
+                layer.set_default_permissions()
+        item['fingerprint'] = _resource_fingerprint(resource)
+    except Exception:
+        _slurp_failure(item, sys.exc_info(), ignore_errors, verbosity)
+    else:
+        item['layer'] = layer
+        item['created'] = created
+
+
+def _slurp_describe_store(group):
+    """
+    Runs a single DescribeFeatureType request for all the layers of
+    a store. Layers missing from the response fall back to their own
+    request in _slurp_fetch_attributes.
+    """
+    try:
+        feature_types = describe_feature_types([item['layer'].typename for item in group],
+                                               client=http_client)
+    except Exception:
+        logger.debug("DescribeFeatureType failed for store [%s]", group[0]['layer'].store)
+        return
+    for item in group:
+        item['feature_types'] = feature_types
+
+
+def _slurp_fetch_attributes(item):
+    """
+    Runs the GeoServer requests needed to refresh the attributes
+    of a layer. It is executed by the gs_slurp worker threads, so it must
+    not touch the database.
+    """
+    try:
+        layer = item['layer']
+        item['attribute_map'] = get_attribute_map(layer, client=http_client,
+                                                  feature_types=item.get('feature_types'))
+    except Exception:
+        item['fetch_exc_info'] = sys.exc_info()
+    return item
+
+
+def _slurp_update(item, cat, ignore_errors, verbosity):
+    layer = item['layer']
+    resource = item['resource']
+    try:
+        if 'fetch_exc_info' in item:
+            exception_type, error, traceback = item['fetch_exc_info']
+            raise exception_type, error, traceback
+
+        with transaction.atomic():
+            # the statistics are queued once the batch is committed
+            if 'attribute_map' in item:
+                item['statistics'] = set_attributes(layer, overwrite=True,
+                                                    attribute_map=item['attribute_map'],
+                                                    queue_statistics=False)
+
+            # Fix metadata links if the ip has changed
+            if layer.link_set.metadata().count() > 0:
+                if not item['created'] and settings.SITEURL not in layer.link_set.metadata()[0].url:
+                    layer.link_set.metadata().delete()
+                    layer.save()
+                    metadata_links = []
+                    for link in layer.link_set.metadata():
+                        metadata_links.append((link.mime, link.name, link.url))
+                    resource.metadata_links = metadata_links
+                    cat.save(resource)
+    except Exception:
+        _slurp_failure(item, sys.exc_info(), ignore_errors, verbosity)
+
+
 def get_stores(store_type=None):
     cat = Catalog(ogc_server_settings.internal_rest, _user, _password)
     stores = cat.get_stores()
@@ -619,19 +819,64 @@ def get_stores(store_type=None):
     return store_list
 
 
-def set_attributes(layer, overwrite=False):
+def describe_feature_types(typenames, client=None):
     """
-    Retrieve layer attribute names & types from Geoserver,
-    then store in GeoNode database using Attribute model
+    Retrieve the attribute names & types of several feature types
+    from Geoserver with a single DescribeFeatureType request,
+    returns a dictionary mapping the feature type names (without the
+    workspace prefix) to lists of [name, type] pairs
+    """
+    if client is None:
+        client = http_client
+    dft_url = re.sub("\/wms\/?$",
+                     "/",
+                     ogc_server_settings.LOCATION) + "wfs?" + urllib.urlencode({
+                         "service": "wfs",
+                         "version": "1.0.0",
+                         "request": "DescribeFeatureType",
+                         "typename": ','.join(typenames).encode('utf-8'),
+                     })
+    body = client.request(dft_url)[1]
+    doc = etree.fromstring(body)
+    xsd = "{http://www.w3.org/2001/XMLSchema}"
+
+    complex_types = {}
+    for complex_type in doc.findall("{xsd}complexType".format(xsd=xsd)):
+        path = ".//{xsd}extension/{xsd}sequence/{xsd}element".format(xsd=xsd)
+        complex_types[complex_type.attrib.get("name")] = [
+            [n.attrib["name"], n.attrib["type"]] for n in complex_type.findall(path)
+            if n.attrib.get("name") and n.attrib.get("type")]
+
+    feature_types = {}
+    for element in doc.findall("{xsd}element".format(xsd=xsd)):
+        name = element.attrib.get("name")
+        type_name = element.attrib.get("type", "").split(":")[-1]
+        if name and type_name in complex_types:
+            feature_types[name] = complex_types[type_name]
+    return feature_types
+
+
+def get_attribute_map(layer, client=None, feature_types=None):
+    """
+    Retrieve layer attribute names & types from Geoserver
+    as a list of [name, type] pairs
+
+    feature_types is an optional result of describe_feature_types
+    for the store of the layer, which avoids a request per layer.
     """
+    if client is None:
+        client = http_client
     attribute_map = []
     server_url = ogc_server_settings.LOCATION if layer.storeType != "remoteStore" else layer.service.base_url
 
-    if layer.storeType == "remoteStore" and layer.service.ptype == "gxp_arcrestsource":
+    if feature_types and layer.storeType == "dataStore" and layer.typename.split(':')[-1] in feature_types:
+        attribute_map = [list(attribute) for attribute in feature_types[layer.typename.split(':')[-1]]]
+
+    elif layer.storeType == "remoteStore" and layer.service.ptype == "gxp_arcrestsource":
         dft_url = server_url + ("%s?f=json" % layer.typename)
         try:
-            # The code below will fail if http_client cannot be imported
-            body = json.loads(http_client.request(dft_url)[1])
+            # The code below will fail if the client cannot be used
+            body = json.loads(client.request(dft_url)[1])
             attribute_map = [[n["name"], _esri_types[n["type"]]]
                              for n in body["fields"] if n.get("name") and n.get("type")]
         except Exception:
@@ -646,9 +891,9 @@ def set_attributes(layer, overwrite=False):
                                                                   "typename": layer.typename.encode('utf-8'),
                                                                   })
         try:
-            # The code below will fail if http_client cannot be imported  or
+            # The code below will fail if the client cannot be used or
             # WFS not supported
-            body = http_client.request(dft_url)[1]
+            body = client.request(dft_url)[1]
             doc = etree.fromstring(body)
             path = ".//{xsd}extension/{xsd}sequence/{xsd}element".format(
                 xsd="{http://www.w3.org/2001/XMLSchema}")
@@ -674,7 +919,7 @@ def set_attributes(layer, overwrite=False):
                 "y": 1
             })
             try:
-                body = http_client.request(dft_url)[1]
+                body = client.request(dft_url)[1]
                 soup = BeautifulSoup(body)
                 for field in soup.findAll('th'):
                     if(field.string is None):
@@ -693,7 +938,7 @@ def set_attributes(layer, overwrite=False):
             "identifiers": layer.typename.encode('utf-8')
         })
         try:
-            response, body = http_client.request(dc_url)
+            response, body = client.request(dc_url)
             doc = etree.fromstring(body)
             path = ".//{wcs}Axis/{wcs}AvailableKeys/{wcs}Key".format(
                 wcs="{http://www.opengis.net/wcs/1.1.1}")
@@ -701,74 +946,192 @@ def set_attributes(layer, overwrite=False):
         except Exception:
             attribute_map = []
 
-    # we need 3 more items for description, attribute_label and display_order
-    attribute_map_dict = {
-        'field': 0,
-        'ftype': 1,
-        'description': 2,
-        'label': 3,
-        'display_order': 4,
+    return attribute_map
+
+
+def get_attributes_statistics(layer, fields):
+    """
+    Generate the statistics of several attributes of a layer at once,
+    returns a dictionary keyed by attribute name
+    """
+    if not fields:
+        return {}
+
+    if datastore_statistics_enabled(layer):
+        try:
+            return get_datastore_attributes_statistics(layer.name, fields)
+        except Exception:
+            logger.exception('Error generating layer aggregate statistics from the datastore')
+
+    statistics = {}
+    for field in fields:
+        statistics[field] = get_attribute_statistics(layer.name, field)
+    return statistics
+
+
+def datastore_statistics_enabled(layer):
+    """
+    Whether the statistics of a layer can be computed directly
+    from the PostGIS datastore instead of the WPS processes
+    """
+    return bool(ogc_server_settings.ATTRIBUTE_STATISTICS_FROM_DATASTORE and
+                layer.storeType == 'dataStore' and
+                ogc_server_settings.DATASTORE and
+                layer.store == ogc_server_settings.DATASTORE and
+                'postgis' in ogc_server_settings.datastore_db.get('ENGINE', ''))
+
+
+def attribute_statistics_outdated(attribute):
+    """
+    Whether the statistics of an attribute are missing or older
+    than ATTRIBUTE_STATISTICS_MAX_AGE seconds
+    """
+    if attribute.last_stats_updated is None:
+        return True
+    max_age = datetime.timedelta(seconds=ogc_server_settings.ATTRIBUTE_STATISTICS_MAX_AGE)
+    return datetime.datetime.now() - attribute.last_stats_updated > max_age
+
+
+def _attribute_statistics_values(result):
+    """
+    Maps the result of a statistics request to Attribute fields
+    """
+    return {
+        'count': result['Count'],
+        'min': result['Min'],
+        'max': result['Max'],
+        'average': result['Average'],
+        'median': result['Median'],
+        'stddev': result['StandardDeviation'],
+        'sum': result['Sum'],
+        'unique_values': result['unique_values'],
+        'last_stats_updated': datetime.datetime.now(),
     }
-    for attribute in attribute_map:
-        attribute.extend((None, None, 0))
 
-    attributes = layer.attribute_set.all()
+
+def queue_attributes_statistics(layer, fields=None):
+    """
+    Queue the computation of the statistics of a layer, either for
+    the given attributes or for all the outdated ones
+    """
+    if not (ogc_server_settings.WPS_ENABLED or datastore_statistics_enabled(layer)):
+        return
+    from geonode.tasks.update import update_attributes_statistics as update_task
+    update_task.delay(layer.id, fields=fields)
+
+
+def update_attributes_statistics(layer, fields=None):
+    """
+    Compute and store the statistics of the aggregable attributes of a layer.
+    When no fields are given only the outdated statistics are refreshed.
+    """
+    attributes = [la for la in layer.attribute_set.all()
+                  if is_layer_attribute_aggregable(layer.storeType, la.attribute, la.attribute_type)]
+    if fields is None:
+        attributes = [la for la in attributes if attribute_statistics_outdated(la)]
+    else:
+        attributes = [la for la in attributes if la.attribute in fields]
+
+    statistics = get_attributes_statistics(layer, [la.attribute for la in attributes])
+    with transaction.atomic():
+        for la in attributes:
+            result = statistics.get(la.attribute)
+            if result is not None:
+                Attribute.objects.filter(id=la.id).update(**_attribute_statistics_values(result))
+    logger.debug(
+        "Updated the statistics of %d attributes for [%s]",
+        len(statistics),
+        layer.name.encode('utf-8'))
+
+
+def set_attributes(layer, overwrite=False, attribute_map=None, statistics=None, queue_statistics=True):
+    """
+    Retrieve layer attribute names & types from Geoserver,
+    then store in GeoNode database using Attribute model
+
+    The attributes and their statistics can be passed in when
+    they have already been retrieved, e.g. by gs_slurp workers.
+    Missing or outdated statistics are computed by a celery task,
+    returns the list of attributes whose statistics are pending.
+    """
+    if attribute_map is None:
+        attribute_map = get_attribute_map(layer)
+
+    # compare what GeoServer reports with the stored attributes in memory and
+    # write the differences at once, instead of one query per attribute
+    existing = {}
+    to_delete = []
+    for la in layer.attribute_set.all():
+        if la.attribute in existing:
+            to_delete.append(la.id)
+        else:
+            existing[la.attribute] = la
+
+    fields = set()
+    pending = []
+    to_create = []
+    updates = defaultdict(list)
+    names = set(field for field, ftype in attribute_map)
+    display_order = max([la.display_order for la in existing.values() if la.attribute in names] + [0]) + 1
+    for field, ftype in attribute_map:
+        if field is None or field in fields:
+            continue
+        fields.add(field)
+        la = existing.get(field)
+        if la is not None and not overwrite:
+            if la.attribute_type != ftype:
+                updates[(('attribute_type', ftype),)].append(la.id)
+            continue
+
+        # description, attribute_label, visible and display_order of
+        # existing attributes are kept, even when overwriting
+        values = {'attribute_type': ftype}
+        if la is None:
+            values['visible'] = ftype.find("gml:") != 0
+        if is_layer_attribute_aggregable(layer.storeType, field, ftype):
+            if statistics is not None and statistics.get(field) is not None:
+                values.update(_attribute_statistics_values(statistics[field]))
+            elif la is None or la.attribute_type != ftype or attribute_statistics_outdated(la):
+                pending.append(field)
+
+        if la is None:
+            to_create.append(Attribute(layer=layer, attribute=field, display_order=display_order, **values))
+            display_order += 1
+        else:
+            changes = tuple(sorted((key, value) for key, value in values.items() if getattr(la, key) != value))
+            if changes:
+                updates[changes].append(la.id)
+
     # Delete existing attributes if they no longer exist in an updated layer
-    for la in attributes:
-        lafound = False
-        for attribute in attribute_map:
-            field, ftype, description, label, display_order = attribute
-            if field == la.attribute:
-                lafound = True
-                # store description and attribute_label in attribute_map
-                attribute[attribute_map_dict['description']] = la.description
-                attribute[attribute_map_dict['label']] = la.attribute_label
-                attribute[attribute_map_dict['display_order']] = la.display_order
-        if overwrite or not lafound:
+    for name, la in existing.items():
+        if name not in fields:
             logger.debug(
                 "Going to delete [%s] for [%s]",
                 la.attribute,
                 layer.name.encode('utf-8'))
-            la.delete()
-
-    # Add new layer attributes if they don't already exist
-    if attribute_map is not None:
-        iter = len(Attribute.objects.filter(layer=layer)) + 1
-        for attribute in attribute_map:
-            field, ftype, description, label, display_order = attribute
-            if field is not None:
-                la, created = Attribute.objects.get_or_create(
-                    layer=layer, attribute=field, attribute_type=ftype,
-                    description=description, attribute_label=label,
-                    display_order=display_order)
-                if created:
-                    if is_layer_attribute_aggregable(
-                            layer.storeType,
-                            field,
-                            ftype):
-                        logger.debug("Generating layer attribute statistics")
-                        result = get_attribute_statistics(layer.name, field)
-                        if result is not None:
-                            la.count = result['Count']
-                            la.min = result['Min']
-                            la.max = result['Max']
-                            la.average = result['Average']
-                            la.median = result['Median']
-                            la.stddev = result['StandardDeviation']
-                            la.sum = result['Sum']
-                            la.unique_values = result['unique_values']
-                            la.last_stats_updated = datetime.datetime.now()
-                    la.visible = ftype.find("gml:") != 0
-                    la.display_order = iter
-                    la.save()
-                    iter += 1
-                    logger.debug(
-                        "Created [%s] attribute for [%s]",
-                        field,
-                        layer.name.encode('utf-8'))
-    else:
+            to_delete.append(la.id)
+
+    if not attribute_map:
         logger.debug("No attributes found")
 
+    with transaction.atomic():
+        if to_delete:
+            Attribute.objects.filter(id__in=to_delete).delete()
+        for changes, ids in updates.items():
+            Attribute.objects.filter(id__in=ids).update(**dict(changes))
+        if to_create:
+            Attribute.objects.bulk_create(to_create)
+    logger.debug(
+        "Created %d, updated %d and deleted %d attributes for [%s]",
+        len(to_create),
+        sum(len(ids) for ids in updates.values()),
+        len(to_delete),
+        layer.name.encode('utf-8'))
+
+    if pending and queue_statistics:
+        queue_attributes_statistics(layer, pending)
+    return pending
+
 
 def set_styles(layer, gs_catalog):
     style_set = []
@@ -831,7 +1194,13 @@ def get_attribute_statistics(layer_name, field):
 
 
 def get_wcs_record(instance, retry=True):
-    wcs = WebCoverageService(ogc_server_settings.LOCATION + 'wcs', '1.0.0')
+    wcs_url = ogc_server_settings.LOCATION + 'wcs'
+    body = http_client.request(wcs_url + '?' + urllib.urlencode({
+        'service': 'WCS',
+        'request': 'GetCapabilities',
+        'version': '1.0.0',
+    }))[1]
+    wcs = WebCoverageService(wcs_url, '1.0.0', xml=body)
     key = instance.workspace + ':' + instance.name
     logger.debug(wcs.contents)
     if key in wcs.contents:
@@ -1356,12 +1725,16 @@ class OGC_Servers_Handler(object):
         server.setdefault('PASSWORD', 'geoserver')
         server.setdefault('DATASTORE', str())
         server.setdefault('GEOGIG_DATASTORE_DIR', str())
+        server.setdefault('ATTRIBUTE_STATISTICS_MAX_AGE', 86400)
+        server.setdefault('SYNC_DELAY', 10)
+        server.setdefault('POOL_MAXSIZE', 10)
+        server.setdefault('MAX_RETRIES', 1)
 
         for option in ['MAPFISH_PRINT_ENABLED', 'PRINT_NG_ENABLED', 'GEONODE_SECURITY_ENABLED',
                        'BACKEND_WRITE_ENABLED']:
             server.setdefault(option, True)
 
-        for option in ['GEOGIG_ENABLED', 'WMST_ENABLED', 'WPS_ENABLED']:
+        for option in ['GEOGIG_ENABLED', 'WMST_ENABLED', 'WPS_ENABLED', 'ATTRIBUTE_STATISTICS_FROM_DATASTORE']:
             server.setdefault(option, False)
 
     def __getitem__(self, alias):
@@ -1388,25 +1761,63 @@ class OGC_Servers_Handler(object):
 def get_wms():
     wms_url = ogc_server_settings.internal_ows + \
         "?service=WMS&request=GetCapabilities&version=1.1.0"
-    netloc = urlparse(wms_url).netloc
-    http = httplib2.Http()
-    http.add_credentials(_user, _password)
-    http.authorizations.append(
-        httplib2.BasicAuthentication(
-            (_user, _password),
-            netloc,
-            wms_url,
-            {},
-            None,
-            None,
-            http
-        )
-    )
-    body = http.request(wms_url)[1]
+    body = http_client.request(wms_url)[1]
     _wms = WebMapService(wms_url, xml=body)
     return _wms
 
 
+def get_datastore_attributes_statistics(table_name, fields):
+    """Derive aggregate statistics of several attributes from the PostGIS datastore"""
+
+    from django.db import connections
+
+    connection = connections[ogc_server_settings.DATASTORE]
+    qn = connection.ops.quote_name
+    aggregates = []
+    for field in fields:
+        column = qn(field)
+        aggregates.extend([
+            'count(%s)' % column,
+            'min(%s)' % column,
+            'max(%s)' % column,
+            'avg(%s)' % column,
+            'percentile_cont(0.5) WITHIN GROUP (ORDER BY %s)' % column,
+            'stddev_pop(%s)' % column,
+            'sum(%s)' % column,
+        ])
+
+    cursor = connection.cursor()
+    try:
+        cursor.execute('SELECT %s FROM %s' % (', '.join(aggregates), qn(table_name)))
+        row = cursor.fetchone()
+
+        statistics = {}
+        for i, field in enumerate(fields):
+            values = ['NA' if value is None else str(value) for value in row[i * 7:i * 7 + 7]]
+            statistics[field] = {
+                'Count': int(row[i * 7]),
+                'Min': values[1],
+                'Max': values[2],
+                'Average': values[3],
+                'Median': values[4],
+                'StandardDeviation': values[5],
+                'Sum': values[6],
+                'unique_values': 'NA',
+            }
+
+        unique = [field for field in fields if statistics[field]['Count'] < STATISTICS_UNIQUE_VALUES_LIMIT]
+        if unique:
+            cursor.execute('SELECT %s FROM %s' % (
+                ', '.join(["string_agg(DISTINCT {0}::text, ', ')".format(qn(field)) for field in unique]),
+                qn(table_name)))
+            for field, values in zip(unique, cursor.fetchone()):
+                statistics[field]['unique_values'] = values or 'NA'
+    finally:
+        cursor.close()
+
+    return statistics
+
+
 def wps_execute_layer_attribute_statistics(layer_name, field):
     """Derive aggregate statistics from WPS endpoint"""
 
@@ -1422,7 +1833,7 @@ def wps_execute_layer_attribute_statistics(layer_name, field):
                                'field': field
                                })
 
-    response = http_post(url, request, timeout=ogc_server_settings.TIMEOUT)
+    response = http_client.request(url, 'POST', request.encode('utf-8'), {'Content-Type': 'text/xml'})[1]
 
     exml = etree.fromstring(response)
 
@@ -1443,16 +1854,21 @@ def wps_execute_layer_attribute_statistics(layer_name, field):
 
     result['unique_values'] = 'NA'
 
-    # TODO: find way of figuring out threshold better
-    if result['Count'] < 10000:
+    if result['Count'] < STATISTICS_UNIQUE_VALUES_LIMIT:
         request = render_to_string('layers/wps_execute_gs_unique.xml', {
                                    'layer_name': 'geonode:%s' % layer_name,
                                    'field': field
                                    })
 
-        response = http_post(url, request, timeout=ogc_server_settings.TIMEOUT)
+        response = http_client.request(url, 'POST', request.encode('utf-8'), {'Content-Type': 'text/xml'})[1]
 
         exml = etree.fromstring(response)
+        values = [v.text for v in exml.iter() if isinstance(v.tag, basestring) and
+                  v.tag.split('}')[-1] == 'value' and v.text]
+        if values:
+            result['unique_values'] = ', '.join(values)
+
+    return result
 
 
 def style_update(request, url):
@@ -1574,21 +1990,13 @@ _wms = None
 _csw = None
 _user, _password = ogc_server_settings.credentials
 
-http_client = httplib2.Http()
-http_client.add_credentials(_user, _password)
-http_client.add_credentials(_user, _password)
-_netloc = urlparse(ogc_server_settings.LOCATION).netloc
-http_client.authorizations.append(
-    httplib2.BasicAuthentication(
-        (_user, _password),
-        _netloc,
-        ogc_server_settings.LOCATION,
-        {},
-        None,
-        None,
-        http_client
-    )
-)
+
+# thread safe client with a pool of keep-alive connections to GeoServer,
+# used for the OGC (WMS, WFS, WCS, WPS) and REST requests
+http_client = PooledHttpClient(maxsize=ogc_server_settings.POOL_MAXSIZE,
+                               timeout=ogc_server_settings.TIMEOUT,
+                               retries=ogc_server_settings.MAX_RETRIES)
+http_client.add_credentials(_user, _password, urlparse(ogc_server_settings.LOCATION).netloc)
 
 
 url = ogc_server_settings.rest
@@ -0,0 +1,74 @@
+#########################################################################
+#
+# Copyright (C) 2012 OpenPlans
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = ('Regenerate the links of the layers and documents, for instance after '
+            'a change of SITEURL or of the public location of GeoServer')
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '-i',
+            '--ignore-errors',
+            action='store_true',
+            dest='ignore_errors',
+            default=False,
+            help='Go on with the next layer when the links of a layer can\'t be regenerated.'),
+    )
+
+    def handle(self, **options):
+        from geonode.base.links import reconcile_links
+        from geonode.documents.models import Document, get_document_links
+        from geonode.geoserver.helpers import gs_catalog
+        from geonode.geoserver.signals import get_layer_links, get_link_hosts
+        from geonode.layers.models import Layer
+
+        verbosity = int(options['verbosity'])
+        keep_hosts = get_link_hosts()
+        created = deleted = 0
+
+        layers = Layer.objects.filter(service__isnull=True).exclude(storeType='remoteStore').order_by('id')
+        for layer in layers.iterator():
+            try:
+                gs_resource = gs_catalog.get_resource(layer.name, store=layer.store, workspace=layer.workspace)
+                if gs_resource is None:
+                    if verbosity > 0:
+                        print 'Skipping %s, it is not in GeoServer' % layer.typename
+                    continue
+                counts = reconcile_links(layer.resourcebase_ptr, get_layer_links(layer, gs_resource),
+                                         keep_hosts=keep_hosts)
+            except Exception:
+                if not options['ignore_errors']:
+                    raise
+                print 'Could not regenerate the links of %s' % layer.typename
+                continue
+            created += counts[0]
+            deleted += counts[1]
+            if verbosity > 1:
+                print '%s: %s links created, %s deleted' % (layer.typename, counts[0], counts[1])
+
+        for document in Document.objects.order_by('id').iterator():
+            counts = reconcile_links(document.resourcebase_ptr, get_document_links(document))
+            created += counts[0]
+            deleted += counts[1]
+
+        print '%s links created, %s deleted' % (created, deleted)
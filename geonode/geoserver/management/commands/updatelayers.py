@@ -53,6 +53,12 @@ class Command(BaseCommand):
             dest='remove_deleted',
             default=False,
             help='Remove GeoNode layers that have been deleted from GeoSever.'),
+        make_option(
+            '--dry-run',
+            action='store_true',
+            dest='dry_run',
+            default=False,
+            help='With --remove-deleted, only report the GeoNode layers that would be removed.'),
         make_option(
             '-u',
             '--user',
@@ -76,19 +82,42 @@ class Command(BaseCommand):
             '--workspace',
             dest="workspace",
             default=None,
-            help="Only update data on specified workspace"))
+            help="Only update data on specified workspace"),
+        make_option(
+            '--workers',
+            dest="workers",
+            type="int",
+            default=1,
+            help="Number of threads running the GeoServer and WPS requests"),
+        make_option(
+            '-c',
+            '--checkpoint',
+            dest="checkpoint",
+            default=None,
+            help="File recording the progress, an interrupted run resumes from it"),
+        make_option(
+            '--skip-unchanged',
+            action='store_true',
+            dest='skip_unchanged',
+            default=False,
+            help='Do not refresh the attributes of layers unchanged in GeoServer since the last run '
+                 'recorded in the checkpoint file.'))
 
     def handle(self, **options):
         ignore_errors = options.get('ignore_errors')
         skip_unadvertised = options.get('skip_unadvertised')
         skip_geonode_registered = options.get('skip_geonode_registered')
         remove_deleted = options.get('remove_deleted')
+        dry_run = options.get('dry_run')
         verbosity = int(options.get('verbosity'))
         user = options.get('user')
         owner = get_valid_user(user)
         workspace = options.get('workspace')
         filter = options.get('filter')
         store = options.get('store')
+        workers = options.get('workers')
+        checkpoint = options.get('checkpoint')
+        skip_unchanged = options.get('skip_unchanged')
 
         if verbosity > 0:
             console = sys.stdout
@@ -105,7 +134,11 @@ class Command(BaseCommand):
             filter=filter,
             skip_unadvertised=skip_unadvertised,
             skip_geonode_registered=skip_geonode_registered,
-            remove_deleted=remove_deleted)
+            remove_deleted=remove_deleted,
+            workers=workers,
+            checkpoint=checkpoint,
+            skip_unchanged=skip_unchanged,
+            dry_run=dry_run)
 
         if verbosity > 1:
             print "\nDetailed report of failures:"
@@ -130,6 +163,8 @@ class Command(BaseCommand):
             print "%d Created layers" % output['stats']['created']
             print "%d Updated layers" % output['stats']['updated']
             print "%d Failed layers" % output['stats']['failed']
+            if checkpoint:
+                print "%d Skipped layers, already processed" % output['stats']['skipped']
             try:
                 duration_layer = round(
                     output['stats']['duration_sec'] * 1.0 / len(output['layers']), 2)
@@ -137,5 +172,9 @@ class Command(BaseCommand):
                 duration_layer = 0
             if len(output) > 0:
                 print "%f seconds per layer" % duration_layer
-            if remove_deleted:
+            if remove_deleted and dry_run:
+                print "\n%d Layers to delete:" % len(output['deleted_layers'])
+                for dict_ in output['deleted_layers']:
+                    print dict_['name']
+            elif remove_deleted:
                 print "\n%d Deleted layers" % output['stats']['deleted']
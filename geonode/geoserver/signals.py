@@ -8,6 +8,7 @@ from socket import error as socket_error
 
 from django.utils.translation import ugettext, ugettext_lazy as _
 from django.conf import settings
+from django.core.cache import cache
 
 from geonode import GeoNodeException
 from geonode.geoserver.ows import wcs_links, wfs_links, wms_links
@@ -16,7 +17,7 @@ from geonode.geoserver.helpers import set_styles, gs_catalog, get_coverage_grid_
 from geonode.geoserver.helpers import ogc_server_settings
 from geonode.geoserver.helpers import geoserver_upload, http_client
 from geonode.base.models import ResourceBase
-from geonode.base.models import Link
+from geonode.base.links import reconcile_links
 from geonode.layers.utils import create_thumbnail
 from geonode.people.models import Profile
 
@@ -24,10 +25,16 @@ from geoserver.layer import Layer as GsLayer
 
 logger = logging.getLogger("geonode.geoserver.signals")
 
+LAYER_SYNC_SCHEDULED = 'layer_sync_scheduled_%s'
+
 
 def geoserver_pre_delete(instance, sender, **kwargs):
     """Removes the layer from GeoServer
     """
+    # set on the layers whose resource is already gone, see gs_slurp
+    if getattr(instance, '_skip_geoserver_delete', False):
+        return
+
     # cascading_delete should only be called if
     # ogc_server_settings.BACKEND_WRITE_ENABLED == True
     if getattr(ogc_server_settings, "BACKEND_WRITE_ENABLED", True):
@@ -78,12 +85,34 @@ def geoserver_pre_save(instance, sender, **kwargs):
         for key in ['typename', 'store', 'storeType']:
             setattr(instance, key, values[key])
 
+    elif ogc_server_settings.SYNC_DELAY is not None:
+        # the changes of the existing layers are sent to GeoServer
+        # later on by the sync_layer task, see geoserver_post_save
+        return
+
     if not gs_resource:
         gs_resource = gs_catalog.get_resource(
             instance.name,
             store=instance.store,
             workspace=instance.workspace)
 
+    set_resource_metadata(instance, gs_resource)
+    # gs_resource should only be called if
+    # ogc_server_settings.BACKEND_WRITE_ENABLED == True
+    if getattr(ogc_server_settings, "BACKEND_WRITE_ENABLED", True):
+        gs_catalog.save(gs_resource)
+        save_layer_attribution(instance)
+
+    set_layer_bbox(instance, gs_resource)
+
+    # store the resource to avoid another geoserver call in the post_save
+    instance.gs_resource = gs_resource
+
+
+def set_resource_metadata(instance, gs_resource):
+    """Copies the title, abstract, name and metadata links
+       of a layer to its GeoServer resource, without saving it
+    """
     gs_resource.title = instance.title
     gs_resource.abstract = instance.abstract
     gs_resource.name = instance.name
@@ -94,31 +123,27 @@ def geoserver_pre_save(instance, sender, **kwargs):
         metadata_links.append((link.mime, link.name, link.url))
 
     gs_resource.metadata_links = metadata_links
-    # gs_resource should only be called if
-    # ogc_server_settings.BACKEND_WRITE_ENABLED == True
-    if getattr(ogc_server_settings, "BACKEND_WRITE_ENABLED", True):
-        gs_catalog.save(gs_resource)
 
-    gs_layer = gs_catalog.get_layer(instance.name)
 
-    if instance.poc and instance.poc:
+def save_layer_attribution(instance):
+    """Sends the point of contact of a layer to GeoServer as its attribution
+    """
+    if instance.poc:
+        gs_layer = gs_catalog.get_layer(instance.name)
         gs_layer.attribution = str(instance.poc)
         profile = Profile.objects.get(username=instance.poc.username)
         gs_layer.attribution_link = settings.SITEURL[
             :-1] + profile.get_absolute_url()
-        # gs_layer should only be called if
-        # ogc_server_settings.BACKEND_WRITE_ENABLED == True
-        if getattr(ogc_server_settings, "BACKEND_WRITE_ENABLED", True):
-            gs_catalog.save(gs_layer)
+        gs_catalog.save(gs_layer)
+
 
+def set_layer_bbox(instance, gs_resource):
     """Get information from geoserver.
 
        The attributes retrieved include:
 
        * Bounding Box
        * SRID
-       * Download links (WMS, WCS or WFS and KML)
-       * Styles (SLD)
     """
 
     bbox = gs_resource.latlon_bbox
@@ -135,9 +160,6 @@ def geoserver_pre_save(instance, sender, **kwargs):
     instance.bbox_y0 = bbox[2]
     instance.bbox_y1 = bbox[3]
 
-    # store the resource to avoid another geoserver call in the post_save
-    instance.gs_resource = gs_resource
-
 
 def geoserver_post_save(instance, sender, **kwargs):
     """Save keywords to GeoServer
@@ -152,12 +174,20 @@ def geoserver_post_save(instance, sender, **kwargs):
         else:
             return
 
+    # only this save uses the resource stored by the pre_save, the
+    # later saves of the same object must not find it
+    gs_resource = instance.__dict__.pop('gs_resource', None)
+
     if instance.storeType == "remoteStore":
         # Save layer attributes
         set_attributes(instance)
         return
 
-    if not getattr(instance, 'gs_resource', None):
+    if not gs_resource and ogc_server_settings.SYNC_DELAY is not None:
+        queue_layer_sync(instance)
+        return
+
+    if not gs_resource:
         try:
             gs_resource = gs_catalog.get_resource(
                 instance.name,
@@ -169,24 +199,106 @@ def geoserver_post_save(instance, sender, **kwargs):
                 raise serr
             # If the connection is refused, take it easy.
             return
-    else:
-        gs_resource = instance.gs_resource
 
     if gs_resource is None:
         return
 
+    changed = False
     if settings.RESOURCE_PUBLISHING:
         if instance.is_published != gs_resource.advertised:
-            if getattr(ogc_server_settings, "BACKEND_WRITE_ENABLED", True):
-                gs_resource.advertised = instance.is_published
-                gs_catalog.save(gs_resource)
+            gs_resource.advertised = instance.is_published
+            changed = True
+
+    if any(instance.keyword_list()):
+        gs_resource.keywords = instance.keyword_list()
+        changed = True
+
+    # gs_resource should only be called if
+    # ogc_server_settings.BACKEND_WRITE_ENABLED == True
+    if changed and getattr(ogc_server_settings, "BACKEND_WRITE_ENABLED", True):
+        gs_catalog.save(gs_resource)
+
+    update_layer_links(instance, gs_resource)
+
+
+def queue_layer_sync(instance):
+    """Schedules the sync_layer task of a layer, unless it is already
+       scheduled: all the changes of the next SYNC_DELAY seconds are
+       sent to GeoServer at once.
+    """
+    from geonode.tasks.update import sync_layer
+
+    delay = ogc_server_settings.SYNC_DELAY
+    if cache.add(LAYER_SYNC_SCHEDULED % instance.id, True, delay + 60):
+        sync_layer.apply_async(args=(instance.id,), countdown=delay)
+
+
+def sync_layer_to_geoserver(layer_id):
+    """Sends the current title, abstract, metadata links, keywords,
+       publishing state and attribution of a layer to GeoServer, saving
+       its resource once, then refreshes the layer links, attributes,
+       styles, thumbnail and catalogue record.
+    """
+    from geonode.layers.models import Layer
+
+    cache.delete(LAYER_SYNC_SCHEDULED % layer_id)
+    try:
+        instance = Layer.objects.get(id=layer_id)
+    except Layer.DoesNotExist:
+        return
+
+    try:
+        gs_resource = gs_catalog.get_resource(
+            instance.name,
+            store=instance.store,
+            workspace=instance.workspace)
+    except socket_error as serr:
+        if serr.errno != errno.ECONNREFUSED:
+            raise serr
+        logger.warn('Could not connect to GeoServer to sync the layer %s', instance.typename)
+        return
+
+    if gs_resource is None:
+        return
 
+    set_resource_metadata(instance, gs_resource)
     if any(instance.keyword_list()):
         gs_resource.keywords = instance.keyword_list()
-        # gs_resource should only be called if
-        # ogc_server_settings.BACKEND_WRITE_ENABLED == True
-        if getattr(ogc_server_settings, "BACKEND_WRITE_ENABLED", True):
-            gs_catalog.save(gs_resource)
+    if settings.RESOURCE_PUBLISHING:
+        gs_resource.advertised = instance.is_published
+    if getattr(ogc_server_settings, "BACKEND_WRITE_ENABLED", True):
+        gs_catalog.save(gs_resource)
+        save_layer_attribution(instance)
+
+    # saved without the signals, which would schedule another sync
+    set_layer_bbox(instance, gs_resource)
+    Layer.objects.filter(id=instance.id).update(
+        srid_url=instance.srid_url,
+        bbox_x0=instance.bbox_x0,
+        bbox_x1=instance.bbox_x1,
+        bbox_y0=instance.bbox_y0,
+        bbox_y1=instance.bbox_y1)
+
+    update_layer_links(instance, gs_resource)
+    Layer.objects.filter(id=instance.id).update(default_style=instance.default_style)
+
+
+def get_link_hosts():
+    """Returns the hosts the links of the layers can point to,
+       the links to any other host are left over by an old address
+    """
+    return (urlparse(settings.SITEURL).hostname, urlparse(ogc_server_settings.public_url).hostname)
+
+
+def link(url, name, extension, mime, link_type):
+    return dict(url=url, name=name, extension=extension, mime=mime, link_type=link_type)
+
+
+def get_layer_links(instance, gs_resource):
+    """Returns the download and service links of a layer:
+       WMS, WFS or WCS, KML, tiles, legend, GeoGig and html page
+    """
+    links = []
 
     bbox = gs_resource.latlon_bbox
     dx = float(bbox[1]) - float(bbox[0])
@@ -198,39 +310,17 @@ def geoserver_post_save(instance, sender, **kwargs):
     width = int(height * dataAspect)
 
     # Set download links for WMS, WCS or WFS and KML
-    links = wms_links(ogc_server_settings.public_url + 'wms?',
-                      instance.typename.encode('utf-8'), instance.bbox_string,
-                      instance.srid, height, width)
-
-    for ext, name, mime, wms_url in links:
-        Link.objects.get_or_create(resource=instance.resourcebase_ptr,
-                                   name=ugettext(name),
-                                   defaults=dict(
-                                       extension=ext,
-                                       url=wms_url,
-                                       mime=mime,
-                                       link_type='image',
-                                   )
-                                   )
+    for ext, name, mime, wms_url in wms_links(ogc_server_settings.public_url + 'wms?',
+                                              instance.typename.encode('utf-8'), instance.bbox_string,
+                                              instance.srid, height, width):
+        links.append(link(wms_url, ugettext(name), ext, mime, 'image'))
 
     if instance.storeType == "dataStore":
-        links = wfs_links(
-            ogc_server_settings.public_url +
-            'wfs?',
-            instance.typename.encode('utf-8'))
-        for ext, name, mime, wfs_url in links:
+        for ext, name, mime, wfs_url in wfs_links(ogc_server_settings.public_url + 'wfs?',
+                                                  instance.typename.encode('utf-8')):
             if mime == 'SHAPE-ZIP':
                 name = 'Zipped Shapefile'
-            Link.objects.get_or_create(resource=instance.resourcebase_ptr,
-                                       url=wfs_url,
-                                       defaults=dict(
-                                           extension=ext,
-                                           name=name,
-                                           mime=mime,
-                                           url=wfs_url,
-                                           link_type='data',
-                                       )
-                                       )
+            links.append(link(wfs_url, name, ext, mime, 'data'))
 
         if gs_resource.store.type and gs_resource.store.type.lower() == 'geogig' and \
                 gs_resource.store.connection_parameters.get('geogig_repository'):
@@ -244,37 +334,14 @@ def geoserver_post_save(instance, sender, **kwargs):
             if path:
                 path = 'path={path}'.format(path=path[0].text)
 
-            Link.objects.get_or_create(resource=instance.resourcebase_ptr,
-                                       url=repo_url,
-                                       defaults=dict(extension='html',
-                                                     name='Clone in GeoGig',
-                                                     mime='text/xml',
-                                                     link_type='html'
-                                                     )
-                                       )
-
             def command_url(command):
                 return "{repo_url}/{command}.json?{path}".format(repo_url=repo_url,
                                                                  path=path,
                                                                  command=command)
 
-            Link.objects.get_or_create(resource=instance.resourcebase_ptr,
-                                       url=command_url('log'),
-                                       defaults=dict(extension='json',
-                                                     name='GeoGig log',
-                                                     mime='application/json',
-                                                     link_type='html'
-                                                     )
-                                       )
-
-            Link.objects.get_or_create(resource=instance.resourcebase_ptr,
-                                       url=command_url('statistics'),
-                                       defaults=dict(extension='json',
-                                                     name='GeoGig statistics',
-                                                     mime='application/json',
-                                                     link_type='html'
-                                                     )
-                                       )
+            links.append(link(repo_url, 'Clone in GeoGig', 'html', 'text/xml', 'html'))
+            links.append(link(command_url('log'), 'GeoGig log', 'json', 'application/json', 'html'))
+            links.append(link(command_url('statistics'), 'GeoGig statistics', 'json', 'application/json', 'html'))
 
     elif instance.storeType == 'coverageStore':
         # FIXME(Ariel): This works for public layers, does it work for restricted too?
@@ -297,81 +364,66 @@ def geoserver_post_save(instance, sender, **kwargs):
             except:
                 pass
         else:
-
-            links = wcs_links(ogc_server_settings.public_url + 'wcs?',
-                              instance.typename.encode('utf-8'),
-                              bbox=gs_resource.native_bbox[:-1],
-                              crs=gs_resource.native_bbox[-1],
-                              height=str(covHeight),
-                              width=str(covWidth))
-
-            for ext, name, mime, wcs_url in links:
-                Link.objects.get_or_create(resource=instance.resourcebase_ptr,
-                                           url=wcs_url,
-                                           defaults=dict(
-                                               extension=ext,
-                                               name=name,
-                                               mime=mime,
-                                               link_type='data',
-                                           )
-                                           )
+            for ext, name, mime, wcs_url in wcs_links(ogc_server_settings.public_url + 'wcs?',
+                                                      instance.typename.encode('utf-8'),
+                                                      bbox=gs_resource.native_bbox[:-1],
+                                                      crs=gs_resource.native_bbox[-1],
+                                                      height=str(covHeight),
+                                                      width=str(covWidth)):
+                links.append(link(wcs_url, name, ext, mime, 'data'))
 
         instance.set_permissions(permissions)
 
     kml_reflector_link_download = ogc_server_settings.public_url + "wms/kml?" + \
         urllib.urlencode({'layers': instance.typename.encode('utf-8'), 'mode': "download"})
-
-    Link.objects.get_or_create(resource=instance.resourcebase_ptr,
-                               url=kml_reflector_link_download,
-                               defaults=dict(
-                                   extension='kml',
-                                   name="KML",
-                                   mime='text/xml',
-                                   link_type='data',
-                               )
-                               )
+    links.append(link(kml_reflector_link_download, 'KML', 'kml', 'text/xml', 'data'))
 
     kml_reflector_link_view = ogc_server_settings.public_url + "wms/kml?" + \
         urllib.urlencode({'layers': instance.typename.encode('utf-8'), 'mode': "refresh"})
-
-    Link.objects.get_or_create(resource=instance.resourcebase_ptr,
-                               url=kml_reflector_link_view,
-                               defaults=dict(
-                                   extension='kml',
-                                   name="View in Google Earth",
-                                   mime='text/xml',
-                                   link_type='data',
-                               )
-                               )
+    links.append(link(kml_reflector_link_view, 'View in Google Earth', 'kml', 'text/xml', 'data'))
 
     tile_url = ('%sgwc/service/gmaps?' % ogc_server_settings.public_url +
                 'layers=%s' % instance.typename.encode('utf-8') +
                 '&zoom={z}&x={x}&y={y}' +
                 '&format=image/png8'
                 )
-
-    Link.objects.get_or_create(resource=instance.resourcebase_ptr,
-                               url=tile_url,
-                               defaults=dict(
-                                   extension='tiles',
-                                   name="Tiles",
-                                   mime='image/png',
-                                   link_type='image',
-                               )
-                               )
+    links.append(link(tile_url, 'Tiles', 'tiles', 'image/png', 'image'))
 
     html_link_url = '%s%s' % (
         settings.SITEURL[:-1], instance.get_absolute_url())
+    links.append(link(html_link_url, instance.typename, 'html', 'text/html', 'html'))
+
+    legend_url = ogc_server_settings.PUBLIC_LOCATION + \
+        'wms?request=GetLegendGraphic&format=image/png&WIDTH=20&HEIGHT=20&LAYER=' + \
+        instance.typename + '&legend_options=fontAntiAliasing:true;fontSize:12;forceLabels:on'
+    links.append(link(legend_url, 'Legend', 'png', 'image/png', 'image'))
+
+    ogc_wms_path = '%s/wms' % instance.workspace
+    ogc_wms_url = urljoin(ogc_server_settings.public_url, ogc_wms_path)
+    ogc_wms_name = 'OGC WMS: %s Service' % instance.workspace
+    links.append(link(ogc_wms_url, ogc_wms_name, 'html', 'text/html', 'OGC:WMS'))
+
+    if instance.storeType == "dataStore":
+        ogc_wfs_path = '%s/wfs' % instance.workspace
+        ogc_wfs_url = urljoin(ogc_server_settings.public_url, ogc_wfs_path)
+        ogc_wfs_name = 'OGC WFS: %s Service' % instance.workspace
+        links.append(link(ogc_wfs_url, ogc_wfs_name, 'html', 'text/html', 'OGC:WFS'))
+
+    if instance.storeType == "coverageStore":
+        ogc_wcs_path = '%s/wcs' % instance.workspace
+        ogc_wcs_url = urljoin(ogc_server_settings.public_url, ogc_wcs_path)
+        ogc_wcs_name = 'OGC WCS: %s Service' % instance.workspace
+        links.append(link(ogc_wcs_url, ogc_wcs_name, 'html', 'text/html', 'OGC:WCS'))
+
+    return links
 
-    Link.objects.get_or_create(resource=instance.resourcebase_ptr,
-                               url=html_link_url,
-                               defaults=dict(
-                                   extension='html',
-                                   name=instance.typename,
-                                   mime='text/html',
-                                   link_type='html',
-                               )
-                               )
+
+def update_layer_links(instance, gs_resource):
+    """Creates the download and service links of a layer and
+       refreshes its attributes, styles, thumbnail and catalogue record
+    """
+    reconcile_links(instance.resourcebase_ptr, get_layer_links(instance, gs_resource),
+                    keep_hosts=get_link_hosts())
 
     params = {
         'layers': instance.typename.encode('utf-8'),
@@ -393,75 +445,6 @@ def geoserver_post_save(instance, sender, **kwargs):
 
     create_thumbnail(instance, thumbnail_remote_url, thumbnail_create_url, ogc_client=http_client)
 
-    legend_url = ogc_server_settings.PUBLIC_LOCATION + \
-        'wms?request=GetLegendGraphic&format=image/png&WIDTH=20&HEIGHT=20&LAYER=' + \
-        instance.typename + '&legend_options=fontAntiAliasing:true;fontSize:12;forceLabels:on'
-
-    Link.objects.get_or_create(resource=instance.resourcebase_ptr,
-                               url=legend_url,
-                               defaults=dict(
-                                   extension='png',
-                                   name='Legend',
-                                   url=legend_url,
-                                   mime='image/png',
-                                   link_type='image',
-                               )
-                               )
-
-    ogc_wms_path = '%s/wms' % instance.workspace
-    ogc_wms_url = urljoin(ogc_server_settings.public_url, ogc_wms_path)
-    ogc_wms_name = 'OGC WMS: %s Service' % instance.workspace
-    Link.objects.get_or_create(resource=instance.resourcebase_ptr,
-                               url=ogc_wms_url,
-                               defaults=dict(
-                                   extension='html',
-                                   name=ogc_wms_name,
-                                   url=ogc_wms_url,
-                                   mime='text/html',
-                                   link_type='OGC:WMS',
-                               )
-                               )
-
-    if instance.storeType == "dataStore":
-        ogc_wfs_path = '%s/wfs' % instance.workspace
-        ogc_wfs_url = urljoin(ogc_server_settings.public_url, ogc_wfs_path)
-        ogc_wfs_name = 'OGC WFS: %s Service' % instance.workspace
-        Link.objects.get_or_create(resource=instance.resourcebase_ptr,
-                                   url=ogc_wfs_url,
-                                   defaults=dict(
-                                       extension='html',
-                                       name=ogc_wfs_name,
-                                       url=ogc_wfs_url,
-                                       mime='text/html',
-                                       link_type='OGC:WFS',
-                                   )
-                                   )
-
-    if instance.storeType == "coverageStore":
-        ogc_wcs_path = '%s/wcs' % instance.workspace
-        ogc_wcs_url = urljoin(ogc_server_settings.public_url, ogc_wcs_path)
-        ogc_wcs_name = 'OGC WCS: %s Service' % instance.workspace
-        Link.objects.get_or_create(resource=instance.resourcebase_ptr,
-                                   url=ogc_wcs_url,
-                                   defaults=dict(
-                                       extension='html',
-                                       name=ogc_wcs_name,
-                                       url=ogc_wcs_url,
-                                       mime='text/html',
-                                       link_type='OGC:WCS',
-                                   )
-                                   )
-
-    # remove links that belong to and old address
-
-    for link in instance.link_set.all():
-        if not urlparse(
-            settings.SITEURL).hostname == urlparse(
-            link.url).hostname and not urlparse(
-            ogc_server_settings.public_url).hostname == urlparse(
-                link.url).hostname:
-            link.delete()
-
     # Save layer attributes
     set_attributes(instance)
 
@@ -1,4 +1,5 @@
 import base64
+import datetime
 import json
 
 from django.contrib.auth import get_user_model
@@ -11,10 +12,10 @@ from django.test.utils import override_settings
 
 from guardian.shortcuts import assign_perm, get_anonymous_user
 
-from geonode.geoserver.helpers import OGC_Servers_Handler
+from geonode.geoserver.helpers import OGC_Servers_Handler, set_attributes
 from geonode.base.populate_test_data import create_models
 from geonode.layers.populate_layers_data import create_layer_data
-from geonode.layers.models import Layer
+from geonode.layers.models import Layer, Attribute
 
 
 class LayerTests(TestCase):
@@ -174,6 +175,177 @@ class LayerTests(TestCase):
         # TODO Lots more to do here once jj0hns0n understands the ACL system
         # better
 
+    def test_layer_acls_etag(self):
+        """ Verify that layer_acls can be revalidated and is invalidated
+        by permission changes
+        """
+        valid_auth_headers = {
+            'HTTP_AUTHORIZATION': 'basic ' + base64.b64encode('bobby:bob'),
+        }
+
+        response = self.client.get(reverse('layer_acls'), **valid_auth_headers)
+        self.assertEquals(response.status_code, 200)
+        etag = response['ETag']
+        self.assertTrue('geonode:CA' in json.loads(response.content)['ro'])
+
+        # the materialized ACLs are unchanged, GeoServer gets a 304
+        response = self.client.get(reverse('layer_acls'), HTTP_IF_NONE_MATCH=etag, **valid_auth_headers)
+        self.assertEquals(response.status_code, 304)
+
+        # restricting the layer drops the stored ACLs
+        layer_ca = Layer.objects.get(typename='geonode:CA')
+        layer_ca.set_permissions({'users': {'admin': ['view_resourcebase']}})
+
+        response = self.client.get(reverse('layer_acls'), HTTP_IF_NONE_MATCH=etag, **valid_auth_headers)
+        self.assertEquals(response.status_code, 200)
+        self.assertNotEquals(etag, response['ETag'])
+        response_json = json.loads(response.content)
+        self.assertFalse('geonode:CA' in response_json['ro'] + response_json['rw'])
+
+    def test_set_attributes_sync(self):
+        """Verify that set_attributes only writes the attributes that changed
+        """
+        layer = Layer.objects.get(typename='geonode:CA')
+        layer.attribute_set.all().delete()
+        kept = Attribute.objects.create(layer=layer, attribute='name', attribute_type='xsd:string',
+                                        attribute_label='Name', display_order=3)
+        Attribute.objects.create(layer=layer, attribute='code', attribute_type='xsd:string', display_order=4)
+        Attribute.objects.create(layer=layer, attribute='gone', attribute_type='xsd:string', display_order=5)
+
+        set_attributes(layer, attribute_map=[['name', 'xsd:string'],
+                                             ['code', 'xsd:long'],
+                                             ['the_geom', 'gml:MultiPolygonPropertyType']],
+                       statistics={})
+
+        attributes = dict((la.attribute, la) for la in layer.attribute_set.all())
+        self.assertEquals(sorted(attributes.keys()), ['code', 'name', 'the_geom'])
+        # unchanged attributes are left as they are
+        self.assertEquals(attributes['name'].id, kept.id)
+        self.assertEquals(attributes['name'].attribute_label, 'Name')
+        self.assertEquals(attributes['code'].attribute_type, 'xsd:long')
+        # new attributes are appended and geometries are hidden
+        self.assertEquals(attributes['the_geom'].display_order, 5)
+        self.assertFalse(attributes['the_geom'].visible)
+
+    def test_attribute_statistics_freshness(self):
+        """Verify that set_attributes only requests missing or outdated statistics
+        """
+        layer = Layer.objects.get(typename='geonode:CA')
+        layer.storeType = 'dataStore'
+        layer.attribute_set.all().delete()
+        Attribute.objects.create(layer=layer, attribute='fresh', attribute_type='xsd:int',
+                                 last_stats_updated=datetime.datetime.now())
+        Attribute.objects.create(layer=layer, attribute='stale', attribute_type='xsd:int',
+                                 last_stats_updated=datetime.datetime.now() - datetime.timedelta(days=30))
+        statistics = {'new': {'Count': 2, 'Min': '1', 'Max': '3', 'Average': '2', 'Median': '2',
+                              'StandardDeviation': '1', 'Sum': '4', 'unique_values': '1, 3'}}
+
+        pending = set_attributes(layer, overwrite=True,
+                                 attribute_map=[['fresh', 'xsd:int'], ['stale', 'xsd:int'],
+                                                ['new', 'xsd:int'], ['other', 'xsd:int']],
+                                 statistics=statistics)
+
+        self.assertEquals(sorted(pending), ['other', 'stale'])
+        new = layer.attribute_set.get(attribute='new')
+        self.assertEquals(new.count, 2)
+        self.assertEquals(new.unique_values, '1, 3')
+        self.assertIsNotNone(new.last_stats_updated)
+
+    def test_layer_save_sync_deferred(self):
+        """Verify that saving an existing layer doesn't wait for GeoServer,
+        the changes of several saves are sent at once by the sync_layer task
+        """
+        from django.core.cache.backends.locmem import LocMemCache
+        from django.db.models import signals
+        from geonode.geoserver import signals as geoserver_signals
+        from geonode.geoserver.helpers import ogc_server_settings
+        from geonode.tasks.update import sync_layer
+
+        class FakeResource(object):
+            latlon_bbox = ('-10', '10', '-5', '5', 'EPSG:4326')
+            keywords = []
+            advertised = True
+
+        class FakeCatalog(object):
+            def __init__(self):
+                self.resource = FakeResource()
+                self.saved = []
+
+            def get_resource(self, name, store=None, workspace=None):
+                return self.resource
+
+            def get_layer(self, name):
+                return FakeResource()
+
+            def save(self, obj):
+                self.saved.append(obj)
+
+        layer = Layer.objects.get(typename='geonode:CA')
+        layer.store = 'CA'
+        layer.storeType = 'dataStore'
+
+        scheduled = []
+        catalog = FakeCatalog()
+        patched = dict((name, getattr(geoserver_signals, name))
+                       for name in ('cache', 'gs_catalog', 'update_layer_links'))
+        apply_async = sync_layer.apply_async
+        geoserver_signals.cache = LocMemCache('layer_sync', {})
+        geoserver_signals.gs_catalog = catalog
+        geoserver_signals.update_layer_links = lambda instance, gs_resource: None
+        sync_layer.apply_async = lambda *args, **kwargs: scheduled.append(kwargs)
+        signals.pre_save.connect(geoserver_signals.geoserver_pre_save, sender=Layer)
+        signals.post_save.connect(geoserver_signals.geoserver_post_save, sender=Layer)
+        try:
+            layer.title = 'First title'
+            layer.save()
+            layer.title = 'Second title'
+            layer.save()
+
+            # one sync for both saves, GeoServer is not called meanwhile
+            self.assertEquals(scheduled, [{'args': (layer.id,), 'countdown': ogc_server_settings.SYNC_DELAY}])
+            self.assertEquals(catalog.saved, [])
+
+            geoserver_signals.sync_layer_to_geoserver(layer.id)
+        finally:
+            signals.pre_save.disconnect(geoserver_signals.geoserver_pre_save, sender=Layer)
+            signals.post_save.disconnect(geoserver_signals.geoserver_post_save, sender=Layer)
+            sync_layer.apply_async = apply_async
+            for name, value in patched.items():
+                setattr(geoserver_signals, name, value)
+
+        # the resource is saved once with the last changes
+        self.assertEquals(catalog.saved.count(catalog.resource), 1)
+        self.assertEquals(catalog.resource.title, 'Second title')
+
+        # the bbox is stored without the signals, which would schedule another sync
+        self.assertEquals(len(scheduled), 1)
+        layer = Layer.objects.get(id=layer.id)
+        self.assertEquals([float(layer.bbox_x0), float(layer.bbox_x1), float(layer.bbox_y0), float(layer.bbox_y1)],
+                          [-10, 10, -5, 5])
+
+    def test_delete_orphan_layers(self):
+        """Verify that the orphan layers are deleted without calling GeoServer,
+        while the other deletions still remove the layer from GeoServer
+        """
+        from geonode.geoserver import signals as geoserver_signals
+        from geonode.geoserver.helpers import _delete_orphan_layers
+
+        deleted = []
+        cascading_delete = geoserver_signals.cascading_delete
+        geoserver_signals.cascading_delete = lambda catalog, typename: deleted.append(typename)
+        try:
+            orphans = list(Layer.objects.all()[:2])
+            statuses = _delete_orphan_layers(orphans)
+            self.assertEquals(deleted, [])
+            self.assertEquals(sorted(statuses.keys()), sorted(layer.id for layer in orphans))
+            self.assertFalse(Layer.objects.filter(id__in=statuses.keys()).exists())
+
+            layer = Layer.objects.all()[0]
+            layer.delete()
+            self.assertEquals(deleted, [layer.typename])
+        finally:
+            geoserver_signals.cascading_delete = cascading_delete
+
     def test_resolve_user(self):
         """Verify that the resolve_user view is behaving as expected
         """
@@ -234,6 +406,11 @@ class UtilsTests(TestCase):
                 'WPS_ENABLED': False,
                 'DATASTORE': str(),
                 'GEOGIG_DATASTORE_DIR': str(),
+                'ATTRIBUTE_STATISTICS_MAX_AGE': 86400,
+                'ATTRIBUTE_STATISTICS_FROM_DATASTORE': False,
+                'SYNC_DELAY': 10,
+                'POOL_MAXSIZE': 10,
+                'MAX_RETRIES': 1,
             }
         }
 
@@ -1,10 +1,11 @@
+import hashlib
 import json
 import logging
-import httplib2
 import os
 
 from django.contrib.auth import authenticate
-from django.http import HttpResponse, HttpResponseRedirect
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseRedirect, HttpResponseNotModified, StreamingHttpResponse
 from django.views.decorators.http import require_POST
 from django.shortcuts import render_to_response
 from django.conf import settings
@@ -16,21 +17,24 @@ from django.template import RequestContext
 from django.utils.datastructures import MultiValueDictKeyError
 from django.utils.translation import ugettext as _
 
-from guardian.shortcuts import get_objects_for_user
-
-from geonode.base.models import ResourceBase
 from geonode.layers.forms import LayerStyleUploadForm
 from geonode.layers.models import Layer, Style
 from geonode.layers.views import _resolve_layer, _PERMISSION_MSG_MODIFY
 from geonode.geoserver.signals import gs_catalog
+from geonode.security.models import get_layer_acls
 from geonode.tasks.update import geoserver_update_layers
 from geonode.utils import json_response, _get_basic_auth_info
 from geoserver.catalog import FailedRequestError, ConflictingDataError
 from lxml import etree
-from .helpers import get_stores, ogc_server_settings, set_styles, style_update
+from .helpers import get_stores, ogc_server_settings, set_styles, style_update, http_client
 
 logger = logging.getLogger(__name__)
 
+# GeoServer REST responses up to this size are kept by geoserver_rest_proxy
+# and revalidated with conditional requests
+REST_PROXY_CACHE_MAX_SIZE = 1024 * 1024
+REST_PROXY_CACHE_TIME = 24 * 60 * 60
+
 
 def stores(request, store_type=None):
     stores = get_stores(store_type)
@@ -318,8 +322,6 @@ def geoserver_rest_proxy(request, proxy_path, downstream_path):
     path = strip_prefix(request.get_full_path(), proxy_path)
     url = str("".join([ogc_server_settings.LOCATION, downstream_path, path]))
 
-    http = httplib2.Http()
-    http.add_credentials(*(ogc_server_settings.credentials))
     headers = dict()
 
     if request.method in ("POST", "PUT") and "CONTENT_TYPE" in request.META:
@@ -338,15 +340,67 @@ def geoserver_rest_proxy(request, proxy_path, downstream_path):
             if downstream_path == 'rest/styles':
                 style_update(request, url)
 
-    response, content = http.request(
+    # GETs are revalidated against the cached copy, GeoServer only
+    # sends the body again when the resource has changed
+    cache_key = 'geoserver_rest_proxy:%s' % hashlib.md5(url).hexdigest()
+    cached = cache.get(cache_key) if request.method == 'GET' else None
+    if cached is not None:
+        if cached['etag']:
+            headers['If-None-Match'] = cached['etag']
+        if cached['last_modified']:
+            headers['If-Modified-Since'] = cached['last_modified']
+    else:
+        for header, meta in (('If-None-Match', 'HTTP_IF_NONE_MATCH'), ('If-Modified-Since', 'HTTP_IF_MODIFIED_SINCE')):
+            if meta in request.META:
+                headers[header] = request.META[meta]
+
+    result = http_client.urlopen(
         url, request.method,
         body=request.body or None,
-        headers=headers)
+        headers=headers,
+        redirections=5)
 
-    return HttpResponse(
-        content=content,
-        status=response.status,
-        mimetype=response.get("content-type", "text/plain"))
+    if request.method != 'GET' and result.status < 400:
+        cache.delete(cache_key)
+
+    if cached is not None and result.status == 304:
+        result.read()
+        if cached['etag'] and request.META.get('HTTP_IF_NONE_MATCH') == cached['etag']:
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(
+                content=cached['content'],
+                mimetype=cached['content_type'])
+    elif (request.method == 'GET' and result.status == 200 and
+            (result.getheader('ETag') or result.getheader('Last-Modified')) and
+            int(result.getheader('Content-Length') or REST_PROXY_CACHE_MAX_SIZE + 1) <= REST_PROXY_CACHE_MAX_SIZE):
+        cached = {
+            'etag': result.getheader('ETag'),
+            'last_modified': result.getheader('Last-Modified'),
+            'content_type': result.getheader('Content-Type', 'text/plain'),
+            'content': result.read(),
+        }
+        cache.set(cache_key, cached, REST_PROXY_CACHE_TIME)
+        response = HttpResponse(
+            content=cached['content'],
+            mimetype=cached['content_type'])
+    else:
+        response = StreamingHttpResponse(
+            result.stream(),
+            status=result.status,
+            content_type=result.getheader("Content-Type", "text/plain"))
+        for header in ('Content-Length', 'ETag', 'Last-Modified'):
+            if result.getheader(header) is not None:
+                response[header] = result.getheader(header)
+        if cached is not None:
+            cache.delete(cache_key)
+        return response
+
+    if cached['etag']:
+        response['ETag'] = cached['etag']
+    if cached['last_modified']:
+        response['Last-Modified'] = cached['last_modified']
+    return response
 
 
 def layer_batch_download(request):
@@ -440,6 +494,17 @@ def resolve_user(request):
     return HttpResponse(json.dumps(resp), mimetype="application/json")
 
 
+def layer_acls_etag(acl_user, version):
+    """
+    ETag of a layer_acls response, it changes with the ACL version
+    and with the user details included in the response.
+    """
+    identity = [version, acl_user.username, acl_user.is_superuser]
+    if acl_user.is_authenticated():
+        identity.extend([acl_user.get_full_name(), acl_user.email])
+    return '"%s"' % hashlib.md5(json.dumps(identity)).hexdigest()
+
+
 def layer_acls(request):
     """
     returns json-encoded lists of layer identifiers that
@@ -478,18 +543,12 @@ def layer_acls(request):
                                 status=401,
                                 mimetype="text/plain")
 
-    # Include permissions on the anonymous user
-    # use of polymorphic selectors/functions to optimize performances
-    resources_readable = get_objects_for_user(acl_user, 'view_resourcebase',
-                                              ResourceBase.objects.instance_of(Layer)).values_list('id', flat=True)
-    layer_writable = get_objects_for_user(acl_user, 'change_layer_data',
-                                          Layer.objects.all())
-
-    _read = set(Layer.objects.filter(id__in=resources_readable).values_list('typename', flat=True))
-    _write = set(layer_writable.values_list('typename', flat=True))
-
-    read_only = _read ^ _write
-    read_write = _read & _write
+    # Served from the materialized ACLs, GeoServer can revalidate
+    # with If-None-Match instead of downloading the lists again
+    read_write, read_only, version = get_layer_acls(acl_user)
+    etag = layer_acls_etag(acl_user, version)
+    if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+        return HttpResponseNotModified()
 
     result = {
         'rw': list(read_write),
@@ -502,4 +561,6 @@ def layer_acls(request):
         result['fullname'] = acl_user.get_full_name()
         result['email'] = acl_user.email
 
-    return HttpResponse(json.dumps(result), mimetype="application/json")
+    response = HttpResponse(json.dumps(result), mimetype="application/json")
+    response['ETag'] = etag
+    return response
@@ -14,6 +14,8 @@ from django.core.mail import send_mail
 from taggit.managers import TaggableManager
 from guardian.shortcuts import get_objects_for_group
 
+from geonode.base.counts import invalidate_resource_counts
+
 
 class GroupProfile(models.Model):
     GROUP_CHOICES = [
@@ -267,3 +269,5 @@ def group_pre_delete(instance, sender, **kwargs):
          not permitted as will break the geonode permissions system')
 
 signals.pre_delete.connect(group_pre_delete, sender=Group)
+signals.post_save.connect(invalidate_resource_counts, sender=GroupProfile)
+signals.post_delete.connect(invalidate_resource_counts, sender=GroupProfile)
@@ -5,6 +5,7 @@ from django.conf import settings
 from haystack import indexes
 
 from geonode.groups.models import GroupProfile
+from geonode.security.models import PUBLIC_PRINCIPAL
 
 
 class GroupIndex(indexes.SearchIndex, indexes.Indexable):
@@ -16,6 +17,7 @@ class GroupIndex(indexes.SearchIndex, indexes.Indexable):
     id = indexes.IntegerField(model_attr='id')
     type = indexes.CharField(faceted=True)
     json = indexes.CharField(indexed=False)
+    principals = indexes.MultiValueField(stored=False)
 
     def get_model(self):
         return GroupProfile
@@ -29,6 +31,12 @@ class GroupIndex(indexes.SearchIndex, indexes.Indexable):
     def prepare_type(self, obj):
         return "group"
 
+    def prepare_principals(self, obj):
+        # private groups can only be found by their members
+        if obj.access == "private":
+            return ['group:%s' % obj.group_id]
+        return [PUBLIC_PRINCIPAL]
+
     def prepare_json(self, obj):
         data = {
             "_type": self.prepare_type(obj),
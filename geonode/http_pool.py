@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2012 OpenPlans
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+import base64
+import httplib
+import socket
+import time
+from collections import OrderedDict
+from threading import Lock
+from urlparse import urljoin, urlsplit
+
+# methods that can be sent again when the connection fails
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+
+REDIRECT_STATUSES = (301, 302, 303, 307)
+
+CHUNK_SIZE = 64 * 1024
+
+
+class Response(dict):
+
+    """
+    The status and headers of an HTTP response, a dictionary of the
+    lowercased headers with a status attribute, like httplib2.Response
+    """
+
+    def __init__(self, response):
+        super(Response, self).__init__((key.lower(), value) for key, value in response.getheaders())
+        self.status = response.status
+        self.reason = response.reason
+        self['status'] = str(response.status)
+
+
+class PooledResponse(object):
+
+    """
+    An HTTP response whose body has not been read yet. The connection goes
+    back to the pool once the body has been consumed, close() discards it.
+    """
+
+    def __init__(self, client, key, conn, response):
+        self._client = client
+        self._key = key
+        self._conn = conn
+        self._response = response
+        self.status = response.status
+        self.reason = response.reason
+
+    def getheader(self, name, default=None):
+        return self._response.getheader(name, default)
+
+    def getheaders(self):
+        return self._response.getheaders()
+
+    @property
+    def info(self):
+        return Response(self._response)
+
+    def read(self):
+        try:
+            content = self._response.read()
+        except Exception:
+            self.close()
+            raise
+        self._release()
+        return content
+
+    def stream(self, chunk_size=CHUNK_SIZE):
+        """
+        Yields the body in chunks without loading it in memory
+        """
+        completed = False
+        try:
+            while True:
+                chunk = self._response.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+            completed = True
+        finally:
+            # a partially read response leaves the connection unusable
+            if completed:
+                self._release()
+            else:
+                self.close()
+
+    def _release(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            if self._response.will_close:
+                conn.close()
+            else:
+                self._client._put_connection(self._key, conn)
+
+    def close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            conn.close()
+
+
+class PooledHttpClient(object):
+
+    """
+    Thread safe HTTP client keeping a pool of keep-alive connections per host.
+
+    request() has the same signature and return value as httplib2.Http.request,
+    so it can be used wherever an httplib2 client was used. Every request checks
+    out a connection for itself, the pool is shared between threads.
+
+    At most maxsize idle connections are kept per host, for max_idle seconds
+    (the servers close the connections idle for too long), and for the
+    max_hosts hosts used last when max_hosts is given.
+    """
+
+    def __init__(self, maxsize=10, timeout=None, retries=1, max_idle=15, max_hosts=None):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.retries = retries
+        self.max_idle = max_idle
+        self.max_hosts = max_hosts
+        # idle (connection, release time) of each host, the host used last at the end
+        self._pools = OrderedDict()
+        self._credentials = {}
+        self._lock = Lock()
+        self._stats = {
+            'requests': 0,
+            'pool_hits': 0,
+            'connections': 0,
+            'retries': 0,
+            'errors': 0,
+            'latency': 0.0,
+        }
+
+    def add_credentials(self, name, password, domain=''):
+        """
+        Sends basic authentication to every request for the given
+        host (host[:port]), or to all hosts when no domain is given
+        """
+        self._credentials[domain] = 'Basic ' + base64.b64encode('%s:%s' % (name, password))
+
+    def stats(self):
+        """
+        Returns a snapshot of the counters of the client
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['idle'] = sum(len(idle) for idle in self._pools.values())
+        stats['average_latency'] = stats['latency'] / stats['requests'] if stats['requests'] else 0.0
+        return stats
+
+    def _count(self, **counters):
+        with self._lock:
+            for counter, value in counters.items():
+                self._stats[counter] += value
+
+    def _get_connection(self, key, pooled=True):
+        """
+        Returns an idle connection to the host, or a new one when there is
+        none or pooled is false, and whether the connection is reused
+        """
+        conn = None
+        expired = []
+        with self._lock:
+            idle = self._pools.get(key) if pooled else None
+            now = time.time()
+            while idle and conn is None:
+                candidate, released = idle.pop()
+                if now - released < self.max_idle:
+                    conn = candidate
+                else:
+                    expired.append(candidate)
+            self._stats['pool_hits' if conn is not None else 'connections'] += 1
+        for candidate in expired:
+            candidate.close()
+        if conn is not None:
+            return conn, True
+
+        scheme, host, port = key
+        connection_class = httplib.HTTPSConnection if scheme == 'https' else httplib.HTTPConnection
+        return connection_class(host, port, timeout=self.timeout), False
+
+    def _put_connection(self, key, conn):
+        discarded = []
+        with self._lock:
+            now = time.time()
+            for pool_key, idle in self._pools.items():
+                discarded.extend(candidate for candidate, released in idle if now - released >= self.max_idle)
+                idle[:] = [(candidate, released) for candidate, released in idle if now - released < self.max_idle]
+                if not idle:
+                    del self._pools[pool_key]
+
+            idle = self._pools.pop(key, [])
+            if len(idle) < self.maxsize:
+                idle.append((conn, now))
+            else:
+                discarded.append(conn)
+            self._pools[key] = idle
+
+            while self.max_hosts and len(self._pools) > self.max_hosts:
+                discarded.extend(candidate for candidate, released in self._pools.popitem(last=False)[1])
+        for candidate in discarded:
+            candidate.close()
+
+    def clear(self):
+        """
+        Closes all the idle connections
+        """
+        with self._lock:
+            pools, self._pools = self._pools, OrderedDict()
+        for idle in pools.values():
+            for conn, released in idle:
+                conn.close()
+
+    def urlopen(self, uri, method='GET', body=None, headers=None, redirections=0):
+        """
+        Sends a request and returns a PooledResponse as soon as the headers
+        are received, the caller must read, stream or close it.
+
+        The body can be a file-like object, which is sent in blocks and
+        needs a Content-Length header. Such requests, and the requests whose
+        method is not idempotent (POST...), are sent on a new connection and
+        never retried.
+        Up to the given number of redirects of GET and HEAD requests are followed.
+        """
+        while True:
+            pooled = self._urlopen(uri, method, body, headers)
+            location = pooled.getheader('location')
+            if (pooled.status in REDIRECT_STATUSES and location and redirections > 0 and
+                    method in ('GET', 'HEAD')):
+                pooled.read()
+                uri = urljoin(uri, location)
+                redirections -= 1
+                continue
+            return pooled
+
+    def _urlopen(self, uri, method, body, headers):
+        url = urlsplit(uri)
+        key = (url.scheme, url.hostname, url.port)
+        locator = url.path or '/'
+        if url.query:
+            locator += '?' + url.query
+
+        headers = dict(headers or {})
+        authorization = self._credentials.get(url.netloc, self._credentials.get(''))
+        if authorization and 'Authorization' not in headers:
+            headers['Authorization'] = authorization
+
+        # a request that must not be sent twice is not retried, it gets a new
+        # connection instead of an idle one the server may have closed
+        retriable = method in IDEMPOTENT_METHODS and not hasattr(body, 'read')
+
+        start = time.time()
+        attempt = 0
+        while True:
+            conn, _ = self._get_connection(key, pooled=retriable)
+            try:
+                conn.request(method, locator, body, headers)
+                response = conn.getresponse()
+            except (socket.error, httplib.HTTPException):
+                conn.close()
+                # a kept alive connection may have been closed by the server
+                if attempt < self.retries and retriable:
+                    attempt += 1
+                    self._count(retries=1)
+                    continue
+                self._count(requests=1, errors=1, latency=time.time() - start)
+                raise
+            self._count(requests=1, latency=time.time() - start)
+            return PooledResponse(self, key, conn, response)
+
+    def request(self, uri, method='GET', body=None, headers=None, redirections=5):
+        """
+        Sends a request and returns a (Response, content) tuple,
+        redirects of GET and HEAD requests are followed
+        """
+        pooled = self.urlopen(uri, method, body, headers, redirections=redirections)
+        return pooled.info, pooled.read()
+
+
+# shared client for the requests that don't need any credentials,
+# keeping a few connections to the hosts used last
+http_client = PooledHttpClient(maxsize=2, max_hosts=10)
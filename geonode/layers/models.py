@@ -35,6 +35,7 @@ from geonode.people.utils import get_valid_user
 from agon_ratings.models import OverallRating
 from geonode.utils import check_shp_columnnames
 from geonode.security.models import remove_object_permissions
+from geonode.base.counts import invalidate_resource_counts
 
 from icraf_dr.models import Main #^^
 from geonode.base.models import Region #^^
@@ -564,3 +565,5 @@ signals.pre_save.connect(pre_save_layer, sender=Layer)
 signals.post_save.connect(resourcebase_post_save, sender=Layer)
 signals.pre_delete.connect(pre_delete_layer, sender=Layer)
 signals.post_delete.connect(post_delete_layer, sender=Layer)
+signals.post_save.connect(invalidate_resource_counts, sender=Layer)
+signals.post_delete.connect(invalidate_resource_counts, sender=Layer)
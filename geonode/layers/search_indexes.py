@@ -1,12 +1,9 @@
-from agon_ratings.models import OverallRating
-from dialogos.models import Comment
-from django.contrib.contenttypes.models import ContentType
-from django.db.models import Avg
 from haystack import indexes
+from geonode.base.indexing import ResourceIndexMixin
 from geonode.maps.models import Layer
 
 
-class LayerIndex(indexes.SearchIndex, indexes.Indexable):
+class LayerIndex(ResourceIndexMixin, indexes.SearchIndex, indexes.Indexable):
     id = indexes.IntegerField(model_attr='resourcebase_ptr_id')
     abstract = indexes.CharField(model_attr="abstract", boost=1.5)
     category__gn_description = indexes.CharField(model_attr="category__gn_description", null=True)
@@ -52,12 +49,10 @@ class LayerIndex(indexes.SearchIndex, indexes.Indexable):
         null=True,
         stored=False)
     keywords = indexes.MultiValueField(
-        model_attr="keyword_slug_list",
         null=True,
         faceted=True,
         stored=True)
     regions = indexes.MultiValueField(
-        model_attr="region_name_list",
         null=True,
         faceted=True,
         stored=True)
@@ -69,6 +64,8 @@ class LayerIndex(indexes.SearchIndex, indexes.Indexable):
     rating = indexes.IntegerField(null=True)
     num_ratings = indexes.IntegerField(stored=False)
     num_comments = indexes.IntegerField(stored=False)
+    is_published = indexes.BooleanField(model_attr="is_published", stored=False)
+    principals = indexes.MultiValueField(stored=False)
 
     def get_model(self):
         return Layer
@@ -84,35 +81,5 @@ class LayerIndex(indexes.SearchIndex, indexes.Indexable):
         elif obj.storeType == "remoteStore":
             return "remote"
 
-    def prepare_rating(self, obj):
-        ct = ContentType.objects.get_for_model(obj)
-        try:
-            rating = OverallRating.objects.filter(
-                object_id=obj.pk,
-                content_type=ct
-            ).aggregate(r=Avg("rating"))["r"]
-            return float(str(rating or "0"))
-        except OverallRating.DoesNotExist:
-            return 0.0
-
-    def prepare_num_ratings(self, obj):
-        ct = ContentType.objects.get_for_model(obj)
-        try:
-            return OverallRating.objects.filter(
-                object_id=obj.pk,
-                content_type=ct
-            ).all().count()
-        except OverallRating.DoesNotExist:
-            return 0
-
-    def prepare_num_comments(self, obj):
-        try:
-            return Comment.objects.filter(
-                object_id=obj.pk,
-                content_type=ContentType.objects.get_for_model(obj)
-            ).all().count()
-        except:
-            return 0
-
     def prepare_title_sortable(self, obj):
         return obj.title.lower()
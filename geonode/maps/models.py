@@ -32,7 +32,7 @@ from django.core.urlresolvers import reverse
 from django.template.defaultfilters import slugify
 from django.core.cache import cache
 
-from geonode.layers.models import Layer
+from geonode.layers.models import Layer, Attribute
 from geonode.base.models import ResourceBase, resourcebase_post_save
 from geonode.maps.signals import map_changed_signal
 from geonode.utils import GXPMapBase
@@ -40,7 +40,9 @@ from geonode.utils import GXPLayerBase
 from geonode.utils import layer_from_viewer_config
 from geonode.utils import default_map_config
 from geonode.utils import num_encode
+from geonode.utils import get_cache_version, invalidate_cache_version
 from geonode.security.models import remove_object_permissions
+from geonode.base.counts import invalidate_resource_counts
 
 from agon_ratings.models import OverallRating
 
@@ -107,19 +109,18 @@ class Map(ResourceBase, GXPMapBase):
         return Layer.objects.filter(typename__in=layer_names) | \
             Layer.objects.filter(name__in=layer_names)
 
+    def resolve_layers(self, layers, user=None):
+        resolve_map_layers(layers, user=user)
+
     def json(self, layer_filter):
         """
         Get a JSON representation of this map suitable for sending to geoserver
         for creating a download of all layers
         """
-        map_layers = MapLayer.objects.filter(map=self.id)
-        layers = []
-        for map_layer in map_layers:
-            if map_layer.local:
-                layer = Layer.objects.get(typename=map_layer.name)
-                layers.append(layer)
-            else:
-                pass
+        map_layers = list(MapLayer.objects.filter(map=self.id))
+        resolve_map_layers(map_layers)
+        layers = [map_layer.local_layer for map_layer in map_layers
+                  if map_layer.local and map_layer.local_layer is not None]
 
         if layer_filter:
             layers = [l for l in layers if layer_filter(l)]
@@ -443,60 +444,56 @@ class MapLayer(models.Model, GXPLayerBase):
     def layer_config(self, user=None):
         # Try to use existing user-specific cache of layer config
         if self.id:
-            cfg = cache.get("layer_config" +
-                            str(self.id) +
-                            "_" +
-                            str(0 if user is None else user.id))
+            cache_key = "layer_config%s_%s_%s" % (
+                self.id,
+                0 if user is None else user.id,
+                get_cache_version('map_%s' % self.map_id, 'permissions'))
+            cfg = cache.get(cache_key)
             if cfg is not None:
                 return cfg
 
         cfg = GXPLayerBase.layer_config(self, user=user)
         # if this is a local layer, get the attribute configuration that
         # determines display order & attribute labels
-        if Layer.objects.filter(typename=self.name).exists():
-            try:
-                if self.local:
-                    layer = Layer.objects.get(typename=self.name)
-                else:
-                    layer = Layer.objects.get(
-                        typename=self.name,
-                        service__base_url=self.ows_url)
-                attribute_cfg = layer.attribute_config()
-                if "getFeatureInfo" in attribute_cfg:
-                    cfg["getFeatureInfo"] = attribute_cfg["getFeatureInfo"]
-                if not user.has_perm(
-                        'base.view_resourcebase',
-                        obj=layer.resourcebase_ptr):
-                    cfg['disabled'] = True
-                    cfg['visibility'] = False
-            except:
-                # shows maplayer with pink tiles,
-                # and signals that there is problem
-                # TODO: clear orphaned MapLayers
-                layer = None
+        if getattr(self, '_resolved_user', False) is not user:
+            resolve_map_layers([self], user=user)
+        # a missing layer shows the maplayer with pink tiles,
+        # and signals that there is problem
+        # TODO: clear orphaned MapLayers
+        if self._resolved_layer is not None:
+            if self._attribute_config:
+                cfg["getFeatureInfo"] = self._attribute_config
+            if not self._viewable:
+                cfg['disabled'] = True
+                cfg['visibility'] = False
 
         if self.id:
-            # Create temporary cache of maplayer config, should not last too long in case
-            # local layer permissions or configuration values change (default
-            # is 5 minutes)
-            cache.set("layer_config" +
-                      str(self.id) +
-                      "_" +
-                      str(0 if user is None else user.id), cfg)
+            # Create user-specific cache of maplayer config, it is invalidated
+            # when the map, its layers or the permissions change
+            cache.set(cache_key, cfg)
         return cfg
 
+    @property
+    def local_layer(self):
+        """
+        The Layer this map layer refers to, if any
+        """
+        if not hasattr(self, '_resolved_layer'):
+            resolve_map_layers([self])
+        return self._resolved_layer
+
     @property
     def layer_title(self):
-        if self.local:
-            title = Layer.objects.get(typename=self.name).title
+        if self.local and self.local_layer is not None:
+            title = self.local_layer.title
         else:
             title = self.name
         return title
 
     @property
     def local_link(self):
-        if self.local:
-            layer = Layer.objects.get(typename=self.name)
+        if self.local and self.local_layer is not None:
+            layer = self.local_layer
             link = "<a href=\"%s\">%s</a>" % (
                 layer.get_absolute_url(), layer.title)
         else:
@@ -510,6 +507,59 @@ class MapLayer(models.Model, GXPLayerBase):
         return '%s?layers=%s' % (self.ows_url, self.name)
 
 
+def resolve_map_layers(map_layers, user=None):
+    """
+    Loads the Layers referred to by a list of map layers, their visible
+    attributes and whether the user can view them, with a constant number
+    of queries. The results are stored on the map layers and used by
+    layer_config, layer_title and local_link.
+    """
+    from guardian.shortcuts import get_objects_for_user
+
+    names = set(map_layer.name for map_layer in map_layers if map_layer.name)
+    candidates = {}
+    for layer in Layer.objects.filter(typename__in=names).select_related('service'):
+        candidates.setdefault(layer.typename, []).append(layer)
+
+    # local layers are looked up by typename, remote ones by
+    # typename and service, a lookup must match a single layer
+    resolved = {}
+    for map_layer in map_layers:
+        matches = candidates.get(map_layer.name, [])
+        if not map_layer.local:
+            matches = [layer for layer in matches
+                       if layer.service is not None and layer.service.base_url == map_layer.ows_url]
+        resolved[id(map_layer)] = matches[0] if len(matches) == 1 else None
+
+    layer_ids = set(layer.id for layer in resolved.values() if layer is not None)
+    attributes = {}
+    for attribute in Attribute.objects.visible().filter(layer__in=layer_ids):
+        attributes.setdefault(attribute.layer_id, []).append(attribute)
+
+    if user is None:
+        viewable = layer_ids
+    elif not user.is_anonymous() and not user.is_active:
+        viewable = set()
+    else:
+        viewable = set(get_objects_for_user(
+            user,
+            'base.view_resourcebase',
+            ResourceBase.objects.filter(id__in=layer_ids)).values_list('id', flat=True))
+
+    for map_layer in map_layers:
+        layer = resolved[id(map_layer)]
+        map_layer._resolved_user = user
+        map_layer._resolved_layer = layer
+        map_layer._attribute_config = None
+        map_layer._viewable = layer is not None and layer.id in viewable
+        if layer is not None and layer.id in attributes:
+            visible_attributes = attributes[layer.id]
+            map_layer._attribute_config = {
+                "fields": [l.attribute for l in visible_attributes],
+                "propertyNames": dict([(l.attribute, l.attribute_label) for l in visible_attributes])
+            }
+
+
 def pre_delete_map(instance, sender, **kwrargs):
     ct = ContentType.objects.get_for_model(instance)
     OverallRating.objects.filter(
@@ -547,5 +597,30 @@ class MapSnapshot(models.Model):
             "url": num_encode(self.id)
         }
 
+
+def invalidate_map_config(instance, sender, **kwargs):
+    """
+    Drops the cached viewer configurations of a map
+    """
+    map_id = instance.id if isinstance(instance, Map) else instance.map_id
+    invalidate_cache_version('map_%s' % map_id)
+
+
+def invalidate_layer_maps_config(instance, sender, **kwargs):
+    """
+    Drops the cached viewer configurations of the maps using a layer
+    """
+    map_ids = MapLayer.objects.filter(name=instance.typename).values_list('map_id', flat=True).distinct()
+    for map_id in map_ids:
+        invalidate_cache_version('map_%s' % map_id)
+
+
 signals.pre_delete.connect(pre_delete_map, sender=Map)
 signals.post_save.connect(resourcebase_post_save, sender=Map)
+signals.post_save.connect(invalidate_resource_counts, sender=Map)
+signals.post_delete.connect(invalidate_resource_counts, sender=Map)
+signals.post_save.connect(invalidate_map_config, sender=Map)
+signals.post_save.connect(invalidate_map_config, sender=MapLayer)
+signals.post_delete.connect(invalidate_map_config, sender=MapLayer)
+signals.post_save.connect(invalidate_layer_maps_config, sender=Layer)
+signals.post_delete.connect(invalidate_layer_maps_config, sender=Layer)
@@ -1,12 +1,9 @@
-from agon_ratings.models import OverallRating
-from dialogos.models import Comment
-from django.contrib.contenttypes.models import ContentType
-from django.db.models import Avg
 from haystack import indexes
+from geonode.base.indexing import ResourceIndexMixin
 from geonode.maps.models import Map
 
 
-class MapIndex(indexes.SearchIndex, indexes.Indexable):
+class MapIndex(ResourceIndexMixin, indexes.SearchIndex, indexes.Indexable):
     id = indexes.IntegerField(model_attr='id')
     abstract = indexes.CharField(model_attr="abstract", boost=1.5)
     category__gn_description = indexes.CharField(model_attr="category__gn_description", null=True)
@@ -50,12 +47,10 @@ class MapIndex(indexes.SearchIndex, indexes.Indexable):
         null=True,
         stored=False)
     keywords = indexes.MultiValueField(
-        model_attr="keyword_slug_list",
         null=True,
         faceted=True,
         stored=True)
     regions = indexes.MultiValueField(
-        model_attr="region_name_list",
         null=True,
         faceted=True,
         stored=True)
@@ -67,6 +62,8 @@ class MapIndex(indexes.SearchIndex, indexes.Indexable):
     rating = indexes.IntegerField(null=True)
     num_ratings = indexes.IntegerField(stored=False)
     num_comments = indexes.IntegerField(stored=False)
+    is_published = indexes.BooleanField(model_attr="is_published", stored=False)
+    principals = indexes.MultiValueField(stored=False)
 
     def get_model(self):
         return Map
@@ -74,35 +71,5 @@ class MapIndex(indexes.SearchIndex, indexes.Indexable):
     def prepare_type(self, obj):
         return "map"
 
-    def prepare_rating(self, obj):
-        ct = ContentType.objects.get_for_model(obj)
-        try:
-            rating = OverallRating.objects.filter(
-                object_id=obj.pk,
-                content_type=ct
-            ).aggregate(r=Avg("rating"))["r"]
-            return float(str(rating or "0"))
-        except OverallRating.DoesNotExist:
-            return 0.0
-
-    def prepare_num_ratings(self, obj):
-        ct = ContentType.objects.get_for_model(obj)
-        try:
-            return OverallRating.objects.filter(
-                object_id=obj.pk,
-                content_type=ct
-            ).all().count()
-        except OverallRating.DoesNotExist:
-            return 0
-
-    def prepare_num_comments(self, obj):
-        try:
-            return Comment.objects.filter(
-                object_id=obj.pk,
-                content_type=ContentType.objects.get_for_model(obj)
-            ).all().count()
-        except:
-            return 0
-
     def prepare_title_sortable(self, obj):
         return obj.title.lower()
@@ -26,9 +26,10 @@ from django.utils import simplejson as json
 from django.contrib.contenttypes.models import ContentType
 from agon_ratings.models import OverallRating
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
 
 from geonode.layers.models import Layer
-from geonode.maps.models import Map
+from geonode.maps.models import Map, MapLayer, resolve_map_layers
 from geonode.utils import default_map_config
 from geonode.base.populate_test_data import create_models
 from geonode.maps.tests_populate_maplayers import create_maplayers
@@ -220,6 +221,33 @@ community."
                       for x in cfg['map']['layers'] if is_wms_layer(x)]
         self.assertEquals(layernames, ['geonode:CA', ])
 
+    def test_map_sources_dedup(self):
+        """Layers with the same source configuration share one entry of the sources"""
+        map_obj = Map.objects.get(id=1)
+        cfg = map_obj.viewer_json(None)
+        sources = [json.dumps(source, sort_keys=True) for source in cfg['sources'].values()]
+        self.assertEquals(len(sources), len(set(sources)))
+        for layer in cfg['map']['layers']:
+            self.assertTrue(layer['source'] in cfg['sources'])
+
+    def test_map_layers_resolver(self):
+        """The layers, attributes and permissions of the map layers are loaded at once"""
+        map_layer = MapLayer.objects.get(map__id=1, name='geonode:CA')
+        map_layer.local = True
+        map_layer.save()
+        layer = Layer.objects.get(typename='geonode:CA')
+        layer.set_permissions({'users': {'admin': ['view_resourcebase']}})
+
+        anonymous = AnonymousUser()
+        map_layers = Map.objects.get(id=1).layers
+        resolve_map_layers(map_layers, anonymous)
+        map_layer = [ml for ml in map_layers if ml.name == 'geonode:CA'][0]
+        self.assertEquals(map_layer.local_layer, layer)
+        self.assertEquals(map_layer.layer_title, layer.title)
+        cfg = map_layer.layer_config(anonymous)
+        self.assertTrue(cfg['disabled'])
+        self.assertFalse(cfg['visibility'])
+
     def test_map_to_wmc(self):
         """ /maps/1/wmc -> Test map WMC export
             Make some assertions about the data structure produced
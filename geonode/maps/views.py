@@ -36,7 +36,7 @@ from django.db.models import F
 from django.views.decorators.clickjacking import xframe_options_exempt
 
 from geonode.layers.models import Layer
-from geonode.maps.models import Map, MapLayer, MapSnapshot
+from geonode.maps.models import Map, MapLayer, MapSnapshot, resolve_map_layers
 from geonode.layers.views import _resolve_layer
 from geonode.utils import forward_mercator, llbbox_to_mercator
 from geonode.utils import DEFAULT_TITLE
@@ -114,7 +114,8 @@ def map_detail(request, mapid, snapshot=None, template='maps/map_detail.html'):
         config = snapshot_config(snapshot, map_obj, request.user)
 
     config = json.dumps(config)
-    layers = MapLayer.objects.filter(map=map_obj.id)
+    layers = list(MapLayer.objects.filter(map=map_obj.id))
+    resolve_map_layers(layers, request.user)
 
     context_dict = {
         'config': config,
@@ -611,13 +612,15 @@ def map_download(request, mapid, template='maps/map_download.html'):
     remote_layers = []
     downloadable_layers = []
 
-    for lyr in map_obj.layer_set.all():
+    map_layers = list(map_obj.layer_set.all())
+    resolve_map_layers(map_layers, request.user)
+    for lyr in map_layers:
         if lyr.group != "background":
             if not lyr.local:
                 remote_layers.append(lyr)
             else:
-                ownable_layer = Layer.objects.get(typename=lyr.name)
-                if not request.user.has_perm(
+                ownable_layer = lyr.local_layer
+                if ownable_layer is None or not request.user.has_perm(
                         'download_resourcebase',
                         obj=ownable_layer.get_self_resource()):
                     locked_layers.append(lyr)
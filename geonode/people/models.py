@@ -29,6 +29,7 @@ from taggit.managers import TaggableManager
 
 from geonode.base.enumerations import COUNTRIES
 from geonode.groups.models import GroupProfile
+from geonode.base.counts import invalidate_site_counts
 
 from account.models import EmailAddress
 
@@ -169,3 +170,5 @@ def profile_pre_save(instance, sender, **kw):
 signals.pre_save.connect(profile_pre_save, sender=Profile)
 signals.post_save.connect(profile_post_save, sender=Profile)
 signals.post_save.connect(email_post_save, sender=EmailAddress)
+signals.post_save.connect(invalidate_site_counts, sender=Profile)
+signals.post_delete.connect(invalidate_site_counts, sender=Profile)
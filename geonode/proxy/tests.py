@@ -24,10 +24,16 @@ unittest). These will both pass when you run "manage.py test".
 
 Replace these with more appropriate tests for your application.
 """
+import threading
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
 from django.contrib.auth import get_user_model
 from django.test import TestCase
 from django.test.utils import override_settings
 
+from geonode.http_pool import PooledHttpClient
+
 
 TEST_DOMAIN = '.github.com'
 TEST_URL = 'https://help%s/' % TEST_DOMAIN
@@ -61,3 +67,118 @@ class ProxyTest(TestCase):
         """If PROXY_ALLOWED_HOSTS is empty and DEBUG is False requests should return 403."""
         response = self.client.get('/proxy?url=%s' % self.url, follow=True)
         self.assertEqual(response.status_code, 200)
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if self.path == '/drop':
+            # closed without any response, like an expired keep-alive connection
+            self.close_connection = 1
+            return
+        body = 'redirected' if self.path == '/target' else self.headers.get('Authorization', 'anonymous')
+        if self.path == '/redirect':
+            self.send_response(302)
+            self.send_header('Location', '/target')
+            body = ''
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.do_GET()
+
+    def log_message(self, *args):
+        pass
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    # serves several keep-alive connections at once
+    daemon_threads = True
+
+
+class PooledHttpClientTest(TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), KeepAliveHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = 'http://127.0.0.1:%d' % self.server.server_port
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connection_reuse(self):
+        """Connections are kept alive and reused by the following requests"""
+        client = PooledHttpClient()
+        client.add_credentials('admin', 'admin', '127.0.0.1:%d' % self.server.server_port)
+
+        response, content = client.request(self.url + '/')
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response['status'], '200')
+        self.assertEqual(response['content-type'], 'text/plain')
+        self.assertEqual(content, 'Basic YWRtaW46YWRtaW4=')
+
+        response, content = client.request(self.url + '/redirect')
+        self.assertEqual(content, 'redirected')
+
+        stats = client.stats()
+        self.assertEqual(stats['requests'], 3)
+        self.assertEqual(stats['connections'], 1)
+        self.assertEqual(stats['pool_hits'], 2)
+        self.assertEqual(stats['idle'], 1)
+        client.clear()
+
+    def test_retry_idempotent_only(self):
+        """Failed requests are sent again only when their method is idempotent"""
+        client = PooledHttpClient()
+
+        self.assertRaises(Exception, client.request, self.url + '/drop', 'POST', 'body')
+        self.assertEqual(client.stats()['retries'], 0)
+
+        self.assertRaises(Exception, client.request, self.url + '/drop')
+        self.assertEqual(client.stats()['retries'], 1)
+
+    def test_post_new_connection(self):
+        """The requests that are not retried do not use an idle connection"""
+        client = PooledHttpClient()
+        client.request(self.url + '/')
+
+        response, content = client.request(self.url + '/', 'POST', 'body')
+        self.assertEqual(response.status, 200)
+        stats = client.stats()
+        self.assertEqual(stats['connections'], 2)
+        self.assertEqual(stats['pool_hits'], 0)
+        client.clear()
+
+    def test_idle_connections_bounded(self):
+        """The connections idle for too long and the ones to the hosts used least are closed"""
+        client = PooledHttpClient(max_idle=0)
+        client.request(self.url + '/')
+        client.request(self.url + '/')
+        stats = client.stats()
+        self.assertEqual(stats['connections'], 2)
+        self.assertEqual(stats['idle'], 1)
+        client.clear()
+
+        client = PooledHttpClient(max_hosts=1)
+        client.request(self.url + '/')
+        client.request('http://localhost:%d/' % self.server.server_port)
+        self.assertEqual(client.stats()['idle'], 1)
+        client.clear()
+
+    @override_settings(DEBUG=True)
+    def test_proxy_streaming(self):
+        """The proxy streams the upstream body and forwards its length"""
+        response = self.client.get('/proxy/', {'url': self.url + '/target'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Length'], '10')
+        self.assertEqual(''.join(response.streaming_content), 'redirected')
@@ -18,13 +18,29 @@
 #
 #########################################################################
 
-from django.http import HttpResponse
-from httplib import HTTPConnection, HTTPSConnection
+from django.http import HttpResponse, StreamingHttpResponse
 from urlparse import urlsplit
 from django.conf import settings
 from django.utils.http import is_safe_url
 from django.http.request import validate_host
 
+from geonode.http_pool import http_client
+
+# upstream headers passed on to the client along with the streamed body
+FORWARDED_HEADERS = ('Content-Length', 'Content-Encoding', 'Content-Disposition', 'Last-Modified', 'ETag')
+
+
+def _request_body(request):
+    """
+    Returns the request itself when its body has not been read yet,
+    so that large uploads are streamed to the upstream server
+    """
+    if hasattr(request, '_body') or getattr(request, '_read_started', False):
+        return request.body
+    if int(request.META.get('CONTENT_LENGTH') or 0) > 0:
+        return request
+    return request.body
+
 
 def proxy(request):
     PROXY_ALLOWED_HOSTS = getattr(settings, 'PROXY_ALLOWED_HOSTS', ())
@@ -66,13 +82,15 @@ def proxy(request):
     if request.method in ("POST", "PUT") and "CONTENT_TYPE" in request.META:
         headers["Content-Type"] = request.META["CONTENT_TYPE"]
 
-    if url.scheme == 'https':
-        conn = HTTPSConnection(url.hostname, url.port)
-    else:
-        conn = HTTPConnection(url.hostname, url.port)
-    conn.request(request.method, locator, request.body, headers)
+    if "HTTP_ACCEPT_ENCODING" in request.META:
+        headers["Accept-Encoding"] = request.META["HTTP_ACCEPT_ENCODING"]
+
+    body = _request_body(request)
+    if hasattr(body, 'read'):
+        headers["Content-Length"] = request.META["CONTENT_LENGTH"]
 
-    result = conn.getresponse()
+    result = http_client.urlopen('%s://%s%s' % (url.scheme, url.netloc, locator),
+                                 request.method, body, headers)
 
     # If we get a redirect, let's add a useful message.
     if result.status in (301, 302, 303, 307):
@@ -83,10 +101,16 @@ def proxy(request):
                                 )
 
         response['Location'] = result.getheader('Location')
+        result.close()
     else:
-        response = HttpResponse(
-            result.read(),
+        # stream the body in chunks so that the memory used does not depend
+        # on the size of the response
+        response = StreamingHttpResponse(
+            result.stream(),
             status=result.status,
             content_type=result.getheader("Content-Type", "text/plain"))
+        for header in FORWARDED_HEADERS:
+            if result.getheader(header) is not None:
+                response[header] = result.getheader(header)
 
     return response
@@ -18,15 +18,26 @@
 #
 #########################################################################
 
+import hashlib
+import json
+import logging
+import uuid
+
 from django.contrib.auth import get_user_model
 
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.auth import login
 from django.contrib.auth.models import Group, Permission
 from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import models, transaction, IntegrityError
+from django.db.models import Q
 from guardian.utils import get_user_obj_perms_model
-from guardian.shortcuts import assign_perm, get_groups_with_perms
+from guardian.shortcuts import assign_perm, get_groups_with_perms, get_anonymous_user
+
+from geonode.base.counts import invalidate_resource_counts
 
+logger = logging.getLogger(__name__)
 
 ADMIN_PERMISSIONS = [
     'view_resourcebase',
@@ -152,6 +163,10 @@ class PermissionLevelMixin(object):
             assign_perm('change_layer_data', self.owner, self)
             assign_perm('change_layer_style', self.owner, self)
 
+        invalidate_layer_acls(self)
+        update_search_principals(self)
+        invalidate_resource_counts()
+
     def set_permissions(self, perm_spec):
         """
         Sets an object's the permission levels based on the perm_spec JSON.
@@ -172,39 +187,126 @@ class PermissionLevelMixin(object):
                 ]
         }
         """
+        bulk_set_permissions([self], perm_spec)
 
-        remove_object_permissions(self)
 
-        if 'users' in perm_spec and "AnonymousUser" in perm_spec['users']:
-            anonymous_group = Group.objects.get(name='anonymous')
-            for perm in perm_spec['users']['AnonymousUser']:
-                assign_perm(perm, anonymous_group, self.get_self_resource())
+def bulk_set_permissions(resources, perm_spec):
+    """
+    Sets the permissions of many resources to the same perm_spec (see
+    PermissionLevelMixin.set_permissions), in a few queries.
 
-        # TODO refactor code here
-        if 'users' in perm_spec:
-            for user, perms in perm_spec['users'].items():
-                user = get_user_model().objects.get(username=user)
+    The users, groups and permissions of the spec are resolved once,
+    then the object permissions the resources should have are compared
+    with the ones they have, and only the difference is deleted and inserted.
+    """
+    from guardian.models import UserObjectPermission, GroupObjectPermission
+    from geonode.base.models import ResourceBase
+    from geonode.layers.models import Layer
+    from geonode.utils import invalidate_cache_version
+
+    resources = list(resources)
+    if not resources:
+        return
+
+    base_ctype = ContentType.objects.get_for_model(ResourceBase)
+    layer_ctype = ContentType.objects.get_for_model(Layer)
+    permissions = dict(((perm.content_type_id, perm.codename), perm.id) for perm in Permission.objects.filter(
+        content_type__in=[base_ctype, layer_ctype]))
+
+    def get_permission(ctype, codename):
+        try:
+            return permissions[(ctype.id, codename)]
+        except KeyError:
+            raise Permission.DoesNotExist('%s is not a permission of %s' % (codename, ctype))
+
+    users = dict(get_user_model().objects.filter(
+        username__in=perm_spec.get('users', {}).keys()).values_list('username', 'id'))
+    groups = dict(Group.objects.filter(
+        name__in=perm_spec.get('groups', {}).keys()).values_list('name', 'id'))
+    for username in perm_spec.get('users', {}):
+        if username not in users:
+            raise get_user_model().DoesNotExist('User %s does not exist' % username)
+    for name in perm_spec.get('groups', {}):
+        if name not in groups:
+            raise Group.DoesNotExist('Group %s does not exist' % name)
+
+    # the object permissions the spec grants, as
+    # (user or group id, content type, permission) for every resource
+    def spec_permissions(is_layer):
+        granted = set()
+        for principals, kind in ((users, 'user'), (groups, 'group')):
+            for name, perms in perm_spec.get(kind + 's', {}).items():
                 for perm in perms:
-                    if self.polymorphic_ctype.name == 'layer' and perm in (
-                            'change_layer_data', 'change_layer_style',
-                            'add_layer', 'change_layer', 'delete_layer',):
-                        assign_perm(perm, user, self.layer)
+                    if is_layer and perm in ('change_layer_data', 'change_layer_style',
+                                             'add_layer', 'change_layer', 'delete_layer',):
+                        granted.add((kind, principals[name], layer_ctype.id, get_permission(layer_ctype, perm)))
                     else:
-                        assign_perm(perm, user, self.get_self_resource())
+                        granted.add((kind, principals[name], base_ctype.id, get_permission(base_ctype, perm)))
+        if anonymous_group is not None:
+            for perm in perm_spec['users']['AnonymousUser']:
+                granted.add(('group', anonymous_group.id, base_ctype.id, get_permission(base_ctype, perm)))
+        return granted
 
-        if 'groups' in perm_spec:
-            for group, perms in perm_spec['groups'].items():
-                group = Group.objects.get(name=group)
-                for perm in perms:
-                    if self.polymorphic_ctype.name == 'layer' and perm in (
-                            'change_layer_data', 'change_layer_style',
-                            'add_layer', 'change_layer', 'delete_layer',):
-                        assign_perm(perm, group, self.layer)
-                    else:
-                        assign_perm(perm, group, self.get_self_resource())
+    anonymous_group = None
+    if 'AnonymousUser' in perm_spec.get('users', {}):
+        anonymous_group = Group.objects.get(name='anonymous')
 
+    spec = {False: spec_permissions(False), True: spec_permissions(True)}
+
+    desired = set()
+    for resource in resources:
+        is_layer = resource.polymorphic_ctype_id == layer_ctype.id
+        object_pk = str(resource.id)
+        for kind, principal_id, ctype_id, perm_id in spec[is_layer]:
+            desired.add((kind, principal_id, ctype_id, perm_id, object_pk))
         # default permissions for resource owner
-        set_owner_permissions(self)
+        if resource.owner_id is not None:
+            for perm in ADMIN_PERMISSIONS:
+                desired.add(('user', resource.owner_id, base_ctype.id, get_permission(base_ctype, perm), object_pk))
+            if is_layer:
+                for perm in LAYER_ADMIN_PERMISSIONS:
+                    desired.add(('user', resource.owner_id, layer_ctype.id,
+                                 get_permission(layer_ctype, perm), object_pk))
+
+    object_pks = [str(resource.id) for resource in resources]
+    current = {}
+    for kind, model, principal in (('user', UserObjectPermission, 'user_id'),
+                                   ('group', GroupObjectPermission, 'group_id')):
+        rows = model.objects.filter(
+            content_type__in=[base_ctype, layer_ctype],
+            object_pk__in=object_pks).values_list('id', principal, 'content_type_id', 'permission_id', 'object_pk')
+        for row_id, principal_id, ctype_id, perm_id, object_pk in rows:
+            current[(kind, principal_id, ctype_id, perm_id, object_pk)] = row_id
+
+    obsolete = [key for key in current if key not in desired]
+    missing = [key for key in desired if key not in current]
+
+    with transaction.atomic():
+        UserObjectPermission.objects.filter(
+            id__in=[current[key] for key in obsolete if key[0] == 'user']).delete()
+        GroupObjectPermission.objects.filter(
+            id__in=[current[key] for key in obsolete if key[0] == 'group']).delete()
+        UserObjectPermission.objects.bulk_create([
+            UserObjectPermission(user_id=principal_id, content_type_id=ctype_id,
+                                 permission_id=perm_id, object_pk=object_pk)
+            for kind, principal_id, ctype_id, perm_id, object_pk in missing if kind == 'user'])
+        GroupObjectPermission.objects.bulk_create([
+            GroupObjectPermission(group_id=principal_id, content_type_id=ctype_id,
+                                  permission_id=perm_id, object_pk=object_pk)
+            for kind, principal_id, ctype_id, perm_id, object_pk in missing if kind == 'group'])
+
+    # drop the layer ACLs of the users and groups that gained or lost a permission
+    layer_pks = set(str(resource.id) for resource in resources if resource.polymorphic_ctype_id == layer_ctype.id)
+    changed = [key for key in obsolete + missing if key[4] in layer_pks]
+    if changed:
+        invalidate_cache_version('permissions')
+        LayerACL.objects.filter(
+            Q(user__in=set(key[1] for key in changed if key[0] == 'user')) |
+            Q(group__in=set(key[1] for key in changed if key[0] == 'group'))).delete()
+
+    for resource in resources:
+        update_search_principals(resource)
+    invalidate_resource_counts()
 
 
 def set_owner_permissions(resource):
@@ -222,6 +324,8 @@ def remove_object_permissions(instance):
     """
     from guardian.models import UserObjectPermission, GroupObjectPermission
 
+    invalidate_layer_acls(instance)
+
     if hasattr(instance, "layer"):
         UserObjectPermission.objects.filter(content_type=ContentType.objects.get_for_model(instance),
                                             object_pk=instance.id).delete()
@@ -235,6 +339,280 @@ def remove_object_permissions(instance):
                                          object_pk=instance.id).delete()
 
 
+class LayerACL(models.Model):
+    """
+    Materialized layer access control list of a single user or group.
+
+    It stores the typenames of the layers the principal can read and
+    write through its own object permissions, so that the ACL requests
+    GeoServer sends on every OWS call can be answered without running
+    the guardian queries. Rows are dropped whenever the permissions of
+    one of their layers change and are rebuilt on the next request.
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, null=True, blank=True)
+    group = models.OneToOneField(Group, null=True, blank=True)
+    read = models.TextField(default='[]')
+    write = models.TextField(default='[]')
+    version = models.CharField(max_length=32)
+
+    def __unicode__(self):
+        principal = self.user if self.user_id is not None else self.group
+        return 'ACL for %s (%s)' % (principal, self.version)
+
+
+def _build_layer_acl(user=None, group=None):
+    """
+    Computes and stores the ACL row of a user or a group.
+    """
+    from guardian.models import UserObjectPermission, GroupObjectPermission
+    from geonode.base.models import ResourceBase
+    from geonode.layers.models import Layer
+
+    if user is not None:
+        perms = UserObjectPermission.objects.filter(user=user)
+        principal = {'user': user}
+    else:
+        perms = GroupObjectPermission.objects.filter(group=group)
+        principal = {'group': group}
+
+    readable = perms.filter(content_type=ContentType.objects.get_for_model(ResourceBase),
+                            permission__codename='view_resourcebase').values_list('object_pk', flat=True)
+    writable = perms.filter(content_type=ContentType.objects.get_for_model(Layer),
+                            permission__codename='change_layer_data').values_list('object_pk', flat=True)
+
+    read = Layer.objects.filter(id__in=[int(pk) for pk in readable]).values_list('typename', flat=True)
+    write = Layer.objects.filter(id__in=[int(pk) for pk in writable]).values_list('typename', flat=True)
+
+    acl = LayerACL(read=json.dumps(sorted(read)),
+                   write=json.dumps(sorted(write)),
+                   version=uuid.uuid4().hex,
+                   **principal)
+    try:
+        # in a savepoint, so that the transaction of the caller survives the error
+        with transaction.atomic():
+            acl.save()
+    except IntegrityError:
+        # another request built the same row in the meantime
+        return LayerACL.objects.get(**principal)
+    return acl
+
+
+def get_layer_acls(user):
+    """
+    Returns a tuple with the sets of read-write and read-only layer
+    typenames for the given user, and a version string identifying that state.
+
+    The user's own ACL is combined with the ACLs of the groups the user belongs to,
+    so group membership changes are picked up without any invalidation.
+    """
+    from geonode.layers.models import Layer
+
+    if user.is_anonymous():
+        user = get_anonymous_user()
+
+    if user.is_superuser:
+        typenames = sorted(Layer.objects.values_list('typename', flat=True))
+        version = hashlib.md5(json.dumps(typenames)).hexdigest()
+        return set(typenames), set(), version
+
+    group_ids = set(user.groups.values_list('id', flat=True))
+    acls = list(LayerACL.objects.filter(Q(user=user) | Q(group__in=group_ids)))
+
+    if not any(acl.user_id == user.id for acl in acls):
+        acls.append(_build_layer_acl(user=user))
+    for group_id in group_ids - set(acl.group_id for acl in acls):
+        acls.append(_build_layer_acl(group=Group(id=group_id)))
+
+    _read = set()
+    _write = set()
+    versions = []
+    for acl in acls:
+        _read.update(json.loads(acl.read))
+        _write.update(json.loads(acl.write))
+        if acl.user_id is not None:
+            versions.append('u%s:%s' % (acl.user_id, acl.version))
+        else:
+            versions.append('g%s:%s' % (acl.group_id, acl.version))
+
+    version = hashlib.md5(','.join(sorted(versions))).hexdigest()
+    return _read & _write, _read ^ _write, version
+
+
+def invalidate_layer_acls(instance):
+    """
+    Drops the materialized ACLs of the users and groups
+    holding a permission on the given layer.
+    """
+    from guardian.models import UserObjectPermission, GroupObjectPermission
+    from geonode.base.models import ResourceBase
+    from geonode.layers.models import Layer
+    from geonode.utils import invalidate_cache_version
+
+    if instance.polymorphic_ctype.name != 'layer':
+        return
+
+    # the map configurations disable the layers a user can't view
+    invalidate_cache_version('permissions')
+
+    ctypes = [ContentType.objects.get_for_model(ResourceBase),
+              ContentType.objects.get_for_model(Layer)]
+    user_ids = UserObjectPermission.objects.filter(content_type__in=ctypes,
+                                                   object_pk=instance.id).values_list('user_id', flat=True)
+    group_ids = GroupObjectPermission.objects.filter(content_type__in=ctypes,
+                                                     object_pk=instance.id).values_list('group_id', flat=True)
+    LayerACL.objects.filter(Q(user__in=list(user_ids)) | Q(group__in=list(group_ids))).delete()
+
+
+# principal matching every requester, for the documents anyone can find
+PUBLIC_PRINCIPAL = 'public'
+
+
+def get_view_principals(resource):
+    """
+    Returns the users and groups allowed to view a resource,
+    as "user:<id>" and "group:<id>" strings. They are indexed with
+    the resource so that searches can be filtered by permissions.
+    """
+    from guardian.models import UserObjectPermission, GroupObjectPermission
+    from geonode.base.models import ResourceBase
+
+    ctype = ContentType.objects.get_for_model(ResourceBase)
+    user_ids = UserObjectPermission.objects.filter(
+        content_type=ctype,
+        object_pk=resource.id,
+        permission__codename='view_resourcebase').values_list('user_id', flat=True)
+    group_ids = GroupObjectPermission.objects.filter(
+        content_type=ctype,
+        object_pk=resource.id,
+        permission__codename='view_resourcebase').values_list('group_id', flat=True)
+    return ['user:%s' % user_id for user_id in user_ids] + ['group:%s' % group_id for group_id in group_ids]
+
+
+def get_user_principals(user):
+    """
+    Returns the principals of a requester, see get_view_principals
+    """
+    if user.is_anonymous():
+        user = get_anonymous_user()
+    group_ids = user.groups.values_list('id', flat=True)
+    return [PUBLIC_PRINCIPAL, 'user:%s' % user.id] + ['group:%s' % group_id for group_id in group_ids]
+
+
+def update_search_principals(instance):
+    """
+    Updates the search index of a resource after its permissions changed
+    """
+    if not getattr(settings, 'HAYSTACK_SEARCH', False):
+        return
+
+    from geonode.base.indexing import get_search_index, queue_search_update
+
+    resource = instance.get_real_instance()
+    if get_search_index(type(resource)) is not None:
+        queue_search_update(resource)
+
+
+class BulkPermissionsJob(models.Model):
+    """
+    Permissions set on many resources at once by the set_bulk_permissions
+    task, in chunks, so that the progress can be reported while it runs.
+
+    The requested, processed, failed and not permitted resources are kept
+    as JSON lists of ids.
+    """
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('finished', 'Finished'),
+        ('failed', 'Failed'),
+    )
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL)
+    permissions = models.TextField()
+    resources = models.TextField(default='[]')
+    processed = models.TextField(default='[]')
+    failed = models.TextField(default='[]')
+    not_permitted = models.TextField(default='[]')
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default='pending')
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __unicode__(self):
+        return 'Bulk permissions job %s (%s)' % (self.id, self.status)
+
+    def run(self, chunk_size=None):
+        """
+        Sets the permissions of the resources the user can change, chunk_size
+        at a time, saving the progress after every chunk
+        """
+        from guardian.shortcuts import get_objects_for_user
+        from geonode.base.models import ResourceBase
+
+        chunk_size = chunk_size or settings.BULK_PERMISSIONS_CHUNK_SIZE
+        perm_spec = json.loads(self.permissions)
+        resource_ids = json.loads(self.resources)
+
+        existing = set(ResourceBase.objects.filter(id__in=resource_ids).values_list('id', flat=True))
+        permitted = set(get_objects_for_user(
+            self.user, 'base.change_resourcebase_permissions').filter(id__in=resource_ids).values_list('id', flat=True))
+        todo = [resource_id for resource_id in resource_ids if resource_id in permitted]
+        processed = []
+        # the resources removed meanwhile can't be processed
+        failed = [resource_id for resource_id in resource_ids if resource_id not in existing]
+
+        self.status = 'running'
+        self.not_permitted = json.dumps([resource_id for resource_id in resource_ids
+                                         if resource_id in existing and resource_id not in permitted])
+        self.failed = json.dumps(failed)
+        self.save()
+
+        for start in range(0, len(todo), chunk_size):
+            chunk = todo[start:start + chunk_size]
+            try:
+                bulk_set_permissions(ResourceBase.objects.filter(id__in=chunk).non_polymorphic(), perm_spec)
+                processed.extend(chunk)
+            except ObjectDoesNotExist as e:
+                # the spec names an unknown user, group or permission
+                self.status = 'failed'
+                self.error = str(e)
+                failed.extend(todo[start:])
+                break
+            except Exception:
+                logger.exception('Could not set the permissions of the resources %s', chunk)
+                failed.extend(chunk)
+            self.processed = json.dumps(processed)
+            self.failed = json.dumps(failed)
+            self.save()
+
+        if self.status != 'failed':
+            self.status = 'finished'
+        self.processed = json.dumps(processed)
+        self.failed = json.dumps(failed)
+        self.save()
+
+    def as_dict(self):
+        """
+        Returns the status of the job, with the titles
+        of the failed and not permitted resources
+        """
+        from geonode.base.models import ResourceBase
+
+        failed = json.loads(self.failed)
+        not_permitted = json.loads(self.not_permitted)
+        titles = dict(ResourceBase.objects.filter(
+            id__in=failed + not_permitted).values_list('id', 'title'))
+        return {
+            'id': self.id,
+            'status': self.status,
+            'error': self.error,
+            'total': len(json.loads(self.resources)),
+            'processed': json.loads(self.processed),
+            'failed': [{'id': resource_id, 'title': titles.get(resource_id)} for resource_id in failed],
+            'not_permitted': [{'id': resource_id, 'title': titles.get(resource_id)} for resource_id in not_permitted],
+        }
+
+
 # Logic to login a user automatically when it has successfully
 # activated an account:
 def autologin(sender, **kwargs):
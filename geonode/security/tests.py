@@ -4,6 +4,7 @@ from django.core.urlresolvers import reverse
 from django.test import TestCase
 from tastypie.test import ResourceTestCase
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
 from guardian.shortcuts import get_anonymous_user, assign_perm, remove_perm
 
 from geonode.base.populate_test_data import create_models, all_public
@@ -13,6 +14,7 @@ from geonode.layers.models import Layer
 from geonode.maps.models import Map
 from geonode.layers.populate_layers_data import create_layer_data
 from geonode.groups.models import Group
+from geonode.security.models import get_view_principals, get_user_principals, bulk_set_permissions
 
 
 class BulkPermissionsTests(ResourceTestCase):
@@ -56,6 +58,39 @@ class BulkPermissionsTests(ResourceTestCase):
         resp = self.client.get(self.list_url)
         self.assertEquals(len(self.deserialize(resp)['objects']), 6)
 
+    def test_bulk_set_permissions_diff(self):
+        """Test that the bulk writer leaves the same object permissions as
+        assigning them one resource at a time"""
+
+        from guardian.models import UserObjectPermission, GroupObjectPermission
+
+        def object_permissions(layer):
+            return (
+                sorted(UserObjectPermission.objects.filter(object_pk=str(layer.id)).values_list(
+                    'user_id', 'content_type_id', 'permission__codename')),
+                sorted(GroupObjectPermission.objects.filter(object_pk=str(layer.id)).values_list(
+                    'group_id', 'content_type_id', 'permission__codename')))
+
+        perm_spec = {
+            "users": {"AnonymousUser": ["view_resourcebase"], "bobby": ["view_resourcebase", "change_layer_data"]},
+            "groups": {"anonymous": ["download_resourcebase"]}}
+        layers = list(Layer.objects.all()[:3])
+
+        for layer in layers:
+            layer.set_default_permissions()
+            assign_perm('change_resourcebase', Profile.objects.get(username='bobby'), layer.get_self_resource())
+        layers[0].set_permissions(perm_spec)
+        expected = object_permissions(layers[0])
+
+        bulk_set_permissions(layers[1:], perm_spec)
+        for layer in layers[1:]:
+            self.assertEquals(object_permissions(layer), expected)
+
+        # the rows are left untouched when the spec is applied again
+        row_ids = sorted(UserObjectPermission.objects.values_list('id', flat=True))
+        bulk_set_permissions(layers[1:], perm_spec)
+        self.assertEquals(sorted(UserObjectPermission.objects.values_list('id', flat=True)), row_ids)
+
     def test_bobby_cannot_set_all(self):
         """Test that Bobby can set the permissions only only on the ones
         for which he has the right"""
@@ -74,6 +109,41 @@ class BulkPermissionsTests(ResourceTestCase):
         resp = self.client.post(self.bulk_perms_url, data)
         self.assertTrue(layer2.title in json.loads(resp.content)['not_changed'])
 
+    def test_bulk_permissions_job(self):
+        """Test that the bulk permissions job reports the processed,
+        failed and not permitted resources to its user only"""
+
+        layer = Layer.objects.all()[0]
+        layer2 = Layer.objects.all()[1]
+        assign_perm('change_resourcebase_permissions', Profile.objects.get(username='bobby'),
+                    layer.get_self_resource())
+        self.client.login(username='bobby', password='bob')
+        data = {
+            'permissions': json.dumps({"users": {"bobby": ["view_resourcebase"]}, "groups": {}}),
+            'resources': [layer.id, layer2.id, 0]
+        }
+        job = json.loads(self.client.post(self.bulk_perms_url, data).content)
+        self.assertEquals(job['status'], 'finished')
+        self.assertEquals(job['total'], 3)
+
+        resp = self.client.get(job['status_url'])
+        self.assertHttpOK(resp)
+        status = json.loads(resp.content)
+        self.assertEquals(status['processed'], [layer.id])
+        self.assertEquals(status['failed'], [{'id': 0, 'title': None}])
+        self.assertEquals(status['not_permitted'], [{'id': layer2.id, 'title': layer2.title}])
+        self.client.logout()
+
+        self.client.login(username='admin', password='admin')
+        self.assertHttpOK(self.client.get(job['status_url']))
+        self.client.logout()
+
+        norman = Profile.objects.create(username='norman')
+        norman.set_password('norman')
+        norman.save()
+        self.client.login(username='norman', password='norman')
+        self.assertHttpNotFound(self.client.get(job['status_url']))
+
 
 class PermissionsTest(TestCase):
 
@@ -197,6 +267,24 @@ class PermissionsTest(TestCase):
             user = get_user_model().objects.get(username=username)
             self.assertTrue(user.has_perm(perm, layer.get_self_resource()))
 
+    def test_search_principals(self):
+        """Verify that the principals indexed for a resource match the users
+        who can view it
+        """
+        layer = Layer.objects.exclude(owner__username='bobby')[0]
+        layer.set_permissions(self.perm_spec)
+        admin = get_user_model().objects.get(username='admin')
+        bobby = get_user_model().objects.get(username='bobby')
+
+        principals = set(get_view_principals(layer))
+        self.assertTrue(principals & set(get_user_principals(admin)))
+        self.assertTrue(principals & set(get_user_principals(layer.owner)))
+        self.assertFalse(principals & set(get_user_principals(bobby)))
+        self.assertFalse(principals & set(get_user_principals(AnonymousUser())))
+
+        layer.set_default_permissions()
+        self.assertTrue(set(get_view_principals(layer)) & set(get_user_principals(AnonymousUser())))
+
     def test_ajax_layer_permissions(self):
         """Verify that the ajax_layer_permissions view is behaving as expected
         """
@@ -20,13 +20,15 @@
 
 from django.utils import simplejson as json
 from django.core.exceptions import PermissionDenied
-from django.http import HttpResponse
+from django.core.urlresolvers import reverse
+from django.http import HttpResponse, Http404
 from django.views.decorators.http import require_POST
 from django.shortcuts import get_object_or_404
 from django.conf import settings
 
 from geonode.utils import resolve_object
 from geonode.base.models import ResourceBase
+from geonode.security.models import BulkPermissionsJob
 
 if "notification" in settings.INSTALLED_APPS:
     from notification import models as notification
@@ -87,24 +89,37 @@ def resource_permissions(request, resource_id):
 
 @require_POST
 def set_bulk_permissions(request):
+    """
+    Queues a job setting the permissions of the selected resources and
+    returns its status, which can then be followed at status_url
+    """
+    from geonode.tasks.update import set_bulk_permissions as set_bulk_permissions_task
+
+    if not request.user.is_authenticated():
+        return HttpResponse(
+            json.dumps({'error': 'You are not allowed to change permissions for these resources'}),
+            status=401,
+            mimetype='text/plain')
 
     permission_spec = json.loads(request.POST.get('permissions', None))
     resource_ids = request.POST.getlist('resources', [])
     if permission_spec is not None:
-        not_permitted = []
-        for resource_id in resource_ids:
-            try:
-                resource = resolve_object(
-                    request, ResourceBase, {
-                        'id': resource_id
-                    },
-                    'base.change_resourcebase_permissions')
-                resource.set_permissions(permission_spec)
-            except PermissionDenied:
-                not_permitted.append(ResourceBase.objects.get(id=resource_id).title)
+        try:
+            resource_ids = [int(resource_id) for resource_id in resource_ids]
+        except ValueError:
+            return HttpResponse(
+                json.dumps({'error': 'Wrong resources specification'}),
+                status=400,
+                mimetype='text/plain')
+
+        job = BulkPermissionsJob.objects.create(
+            user=request.user,
+            permissions=json.dumps(permission_spec),
+            resources=json.dumps(resource_ids))
+        set_bulk_permissions_task.delay(job.id)
 
         return HttpResponse(
-            json.dumps({'success': 'ok', 'not_changed': not_permitted}),
+            json.dumps(_bulk_permissions_job_info(BulkPermissionsJob.objects.get(id=job.id))),
             status=200,
             mimetype='text/plain'
         )
@@ -115,6 +130,32 @@ def set_bulk_permissions(request):
             mimetype='text/plain')
 
 
+def _bulk_permissions_job_info(job):
+    info = job.as_dict()
+    info['success'] = 'ok'
+    info['status_url'] = reverse('bulk_permissions_job', args=[job.id])
+    # the titles of the resources left unchanged, once the job is over
+    if job.status in ('finished', 'failed'):
+        info['not_changed'] = [resource['title'] for resource in info['not_permitted'] + info['failed']]
+    return info
+
+
+def bulk_permissions_job(request, job_id):
+    """
+    Returns the progress of a bulk permissions job: the resources processed
+    so far, the ones that failed and the ones the user can't change
+    """
+    job = get_object_or_404(BulkPermissionsJob, id=job_id)
+    if job.user != request.user and not request.user.is_superuser:
+        raise Http404
+
+    return HttpResponse(
+        json.dumps(_bulk_permissions_job_info(job)),
+        status=200,
+        mimetype='text/plain'
+    )
+
+
 @require_POST
 def request_permissions(request):
     """ Request permission to download a resource.
@@ -10,6 +10,7 @@ from django.utils.translation import ugettext_lazy as _
 from django.db.models import signals
 from geonode.people.enumerations import ROLE_VALUES
 from geonode.security.models import remove_object_permissions
+from geonode.utils import invalidate_cache_version
 
 STATUS_VALUES = [
     'pending',
@@ -111,6 +112,8 @@ class WebServiceRegistrationJob(models.Model):
 def post_save_service(instance, sender, created, **kwargs):
     if created:
         instance.set_default_permissions()
+    # the services are sources of every map configuration
+    invalidate_cache_version('services')
 
 
 def pre_delete_service(instance, sender, **kwargs):
@@ -133,6 +136,7 @@ def pre_delete_service(instance, sender, **kwargs):
             logger.error(
                 "Could not delete cascading WMS Store for %s - maybe already gone" % instance.name)
     remove_object_permissions(instance.get_self_resource())
+    invalidate_cache_version('services')
 
 
 signals.pre_delete.connect(pre_delete_service, sender=Service)
@@ -503,10 +503,19 @@ OGC_SERVER = {
         'WMST_ENABLED': False,
         'BACKEND_WRITE_ENABLED': True,
         'WPS_ENABLED': False,
+        # number of seconds before the attribute statistics are computed again
+        'ATTRIBUTE_STATISTICS_MAX_AGE': 86400,
+        # compute the attribute statistics of the DATASTORE layers with PostGIS instead of WPS
+        'ATTRIBUTE_STATISTICS_FROM_DATASTORE': False,
+        # number of seconds the changes of a layer wait before being sent to GeoServer at once,
+        # None sends them right away while the layer is saved
+        'SYNC_DELAY': 10,
         'LOG_FILE': '%s/geoserver/data/logs/geoserver.log' % os.path.abspath(os.path.join(PROJECT_ROOT, os.pardir)),
         # Set to name of database in DATABASES dictionary to enable
         'DATASTORE': '',  # 'datastore',
-        'TIMEOUT': 10  # number of seconds to allow for HTTP requests
+        'TIMEOUT': 10,  # number of seconds to allow for HTTP requests
+        'POOL_MAXSIZE': 10,  # number of idle keep-alive connections kept per host
+        'MAX_RETRIES': 1  # number of times a failed request is sent again on a new connection
     }
 }
 
@@ -543,6 +552,10 @@ CATALOGUE = {
     }
 }
 
+# Seconds the changes of a resource wait before its catalogue record is updated,
+# None updates it right away while the resource is saved
+CATALOGUE_SYNC_DELAY = 10
+
 # pycsw settings
 PYCSW = {
     # pycsw configuration
@@ -724,6 +737,14 @@ HAYSTACK_SEARCH = False
 SKIP_PERMS_FILTER = False
 # Update facet counts from Haystack
 HAYSTACK_FACET_COUNTS = False
+# Seconds the search results are cached for, 0 disables the cache
+SEARCH_RESULTS_CACHE_TIME = 0
+# Seconds the resource counts of the facets are cached for, 0 disables the cache
+RESOURCE_COUNTS_CACHE_TIME = 3600
+# Seconds after which the typeahead index of a process is rebuilt
+TYPEAHEAD_INDEX_MAX_AGE = 300
+# Number of resources whose permissions are set at once by a bulk permissions job
+BULK_PERMISSIONS_CHUNK_SIZE = 100
 # HAYSTACK_CONNECTIONS = {
 #    'default': {
 #        'ENGINE': 'haystack.backends.elasticsearch_backend.ElasticsearchSearchEngine',
@@ -732,7 +753,13 @@ HAYSTACK_FACET_COUNTS = False
 #        },
 #    }
 # HAYSTACK_SIGNAL_PROCESSOR = 'haystack.signals.RealtimeSignalProcessor'
+# or, to index the saved objects in batches with the update_search_index task
+# HAYSTACK_SIGNAL_PROCESSOR = 'geonode.base.search_signals.QueuedSignalProcessor'
 # HAYSTACK_SEARCH_RESULTS_PER_PAGE = 20
+# Number of objects indexed at once by the update_search_index task
+SEARCH_INDEX_BATCH_SIZE = 500
+# Seconds the queued objects wait for the next update of the search index
+SEARCH_INDEX_FLUSH_DELAY = 10
 
 # Available download formats
 DOWNLOAD_FORMATS_METADATA = [
@@ -1,6 +1,15 @@
+import datetime
+
 from celery.task import task
-from geonode.geoserver.helpers import gs_slurp
+from django.core.cache import cache
+from django.db.models import Q
+
+from geonode.geoserver.helpers import gs_slurp, ogc_server_settings
+from geonode.geoserver.helpers import update_attributes_statistics as update_statistics
+from geonode.base.indexing import flush_search_updates
 from geonode.documents.models import Document
+from geonode.layers.models import Layer, Attribute
+from geonode.layers.enumerations import LAYER_ATTRIBUTE_NUMERIC_DATA_TYPES
 
 
 @task(name='geonode.tasks.update.geoserver_update_layers', queue='update')
@@ -26,3 +35,90 @@ def create_document_thumbnail(object_id):
     image = document._render_thumbnail()
     filename = 'doc-%s-thumb.png' % document.id
     document.save_thumbnail(filename, image)
+
+
+@task(name='geonode.tasks.update.update_attributes_statistics', queue='update')
+def update_attributes_statistics(layer_id, fields=None):
+    """
+    Computes the statistics of the attributes of a layer,
+    all the outdated ones when no fields are given.
+    """
+
+    try:
+        layer = Layer.objects.get(id=layer_id)
+
+    except Layer.DoesNotExist:
+        return
+
+    update_statistics(layer, fields=fields)
+
+
+@task(name='geonode.tasks.update.update_outdated_attributes_statistics', queue='update')
+def update_outdated_attributes_statistics():
+    """
+    Queues the layers whose attribute statistics are missing or
+    outdated, meant to be run periodically.
+    """
+
+    expired = datetime.datetime.now() - datetime.timedelta(
+        seconds=ogc_server_settings.ATTRIBUTE_STATISTICS_MAX_AGE)
+    layer_ids = Attribute.objects.filter(
+        layer__storeType='dataStore',
+        attribute_type__in=LAYER_ATTRIBUTE_NUMERIC_DATA_TYPES
+    ).filter(
+        Q(last_stats_updated__isnull=True) | Q(last_stats_updated__lt=expired)
+    ).values_list('layer', flat=True).distinct()
+
+    for layer_id in layer_ids:
+        update_attributes_statistics.delay(layer_id)
+
+
+@task(name='geonode.tasks.update.update_search_index', queue='update')
+def update_search_index():
+    """
+    Indexes the objects queued for the search index, in batches.
+    """
+    flush_search_updates()
+
+
+@task(name='geonode.tasks.update.set_bulk_permissions', queue='update')
+def set_bulk_permissions(job_id):
+    """
+    Sets the permissions of the resources of a bulk permissions job.
+    """
+    from geonode.security.models import BulkPermissionsJob
+
+    try:
+        job = BulkPermissionsJob.objects.get(id=job_id)
+    except BulkPermissionsJob.DoesNotExist:
+        return
+
+    job.run()
+
+
+@task(name='geonode.tasks.update.sync_layer', queue='update')
+def sync_layer(layer_id):
+    """
+    Sends the changes of a layer to GeoServer.
+    """
+    from geonode.geoserver.signals import sync_layer_to_geoserver
+
+    sync_layer_to_geoserver(layer_id)
+
+
+@task(name='geonode.tasks.update.sync_catalogue_record', queue='update')
+def sync_catalogue_record(resource_id):
+    """
+    Updates the catalogue record of a layer or document.
+    """
+    from geonode.base.models import ResourceBase
+    from geonode.catalogue.models import CATALOGUE_SYNC_SCHEDULED
+    from geonode.catalogue.models import sync_catalogue_record as update_record
+
+    cache.delete(CATALOGUE_SYNC_SCHEDULED % resource_id)
+    try:
+        resource = ResourceBase.objects.get(id=resource_id)
+    except ResourceBase.DoesNotExist:
+        return
+
+    update_record(resource)
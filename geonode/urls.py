@@ -82,6 +82,9 @@ urlpatterns = patterns('',
                        url(r'^account/ajax_login$', 'geonode.views.ajax_login', name='account_ajax_login'),
                        url(r'^account/ajax_lookup$', 'geonode.views.ajax_lookup', name='account_ajax_lookup'),
 
+                       # Typeahead
+                       url(r'^typeahead/$', 'geonode.views.typeahead', name='typeahead'),
+
                        # Meta
                        url(r'^lang\.js$', TemplateView.as_view(template_name='lang.js', content_type='text/javascript'),
                            name='lang'),
@@ -19,13 +19,13 @@
 #########################################################################
 
 import os
-import httplib2
 import base64
 import math
-import copy
 import string
 import datetime
 import re
+import hashlib
+import uuid
 from osgeo import ogr
 from slugify import Slugify
 
@@ -38,6 +38,8 @@ from django.http import HttpResponse
 from django.core.cache import cache
 from django.http import Http404
 
+from geonode.http_pool import http_client  # noqa
+
 DEFAULT_TITLE = ""
 DEFAULT_ABSTRACT = ""
 
@@ -49,8 +51,6 @@ ALPHABET_REVERSE = dict((c, i) for (i, c) in enumerate(ALPHABET))
 BASE = len(ALPHABET)
 SIGN_CHARACTER = '$'
 
-http_client = httplib2.Http()
-
 custom_slugify = Slugify(separator='_')
 
 
@@ -109,6 +109,24 @@ def bbox_to_wkt(x0, x1, y0, y1, srid="4326"):
     return wkt
 
 
+def bbox_intervals(x0, x1):
+    """
+    Splits the longitudes of a bounding box in intervals within [-180, 180]:
+    two when the box crosses the antimeridian (x0 > x1 or x1 > 180), none
+    when it spans all the longitudes
+    """
+    width = x1 - x0
+    if width < 0:
+        width += 360
+    if width >= 360:
+        return []
+    x0 = (x0 + 180) % 360 - 180
+    x1 = x0 + width
+    if x1 <= 180:
+        return [(x0, x1)]
+    return [(x0, 180), (-180, x1 - 360)]
+
+
 def llbbox_to_mercator(llbbox):
     minlonlat = forward_mercator([llbbox[0], llbbox[1]])
     maxlonlat = forward_mercator([llbbox[2], llbbox[3]])
@@ -190,8 +208,37 @@ def layer_from_viewer_config(model, layer, source, ordering):
     )
 
 
+def get_cache_version(*names):
+    """
+    Returns the current version of one or more groups of cache entries,
+    meant to be part of the keys of the entries.
+    """
+    keys = ['cache_version_%s' % name for name in names]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            versions[key] = uuid.uuid4().hex
+            cache.add(key, versions[key])
+    return hashlib.md5(':'.join(versions[key] for key in keys)).hexdigest()
+
+
+def invalidate_cache_version(name):
+    """
+    Changes the version of a group of cache entries, so that
+    the entries cached with the previous version are not used anymore.
+    """
+    cache.set('cache_version_%s' % name, uuid.uuid4().hex)
+
+
 class GXPMapBase(object):
 
+    def resolve_layers(self, layers, user=None):
+        """
+        Hook to load what the layers need for their configuration at once,
+        before layer_config is called for each of them.
+        """
+        pass
+
     def viewer_json(self, user, *added_layers):
         """
         Convert this map to a nested dictionary structure matching the JSON
@@ -203,59 +250,41 @@ class GXPMapBase(object):
         should use ``.layer_set.create()``.
         """
 
+        # the key changes with the map, the permissions and the services,
+        # see invalidate_cache_version
+        cache_key = None
         if self.id and len(added_layers) == 0:
-            cfg = cache.get("viewer_json_" +
-                            str(self.id) +
-                            "_" +
-                            str(0 if user is None else user.id))
+            cache_key = "viewer_json_%s_%s_%s" % (
+                self.id,
+                0 if user is None else user.id,
+                get_cache_version('map_%s' % self.id, 'permissions', 'services'))
+            cfg = cache.get(cache_key)
             if cfg is not None:
                 return cfg
 
         layers = list(self.layers)
         layers.extend(added_layers)
+        self.resolve_layers(layers, user=user)
 
-        server_lookup = {}
+        # sources are deduplicated by their serialization
         sources = {}
-
-        def uniqify(seq):
-            """
-            get a list of unique items from the input sequence.
-
-            This relies only on equality tests, so you can use it on most
-            things.  If you have a sequence of hashables, list(set(seq)) is
-            better.
-            """
-            results = []
-            for x in seq:
-                if x not in results:
-                    results.append(x)
-            return results
-
-        configs = [l.source_config() for l in layers]
-
-        i = 0
-        for source in uniqify(configs):
-            while str(i) in sources:
-                i = i + 1
-            sources[str(i)] = source
-            server_lookup[json.dumps(source)] = str(i)
-
-        def source_lookup(source):
-            for k, v in sources.iteritems():
-                if v == source:
-                    return k
-            return None
-
-        def layer_config(l, user=None):
+        source_keys = {}
+        layer_sources = []
+        for l in layers:
+            source = l.source_config()
+            source_key = json.dumps(source, sort_keys=True)
+            if source_key not in source_keys:
+                source_keys[source_key] = str(len(sources))
+                sources[source_keys[source_key]] = source
+            layer_sources.append(source_keys[source_key])
+
+        def layer_config(l, source, user=None):
             cfg = l.layer_config(user=user)
-            src_cfg = l.source_config()
-            source = source_lookup(src_cfg)
-            if source:
-                cfg["source"] = source
+            cfg["source"] = source
             return cfg
 
-        source_urls = [source['url']
-                       for source in sources.values() if 'url' in source]
+        source_urls = set(source['url']
+                          for source in sources.values() if 'url' in source)
 
         if 'geonode.geoserver' in settings.INSTALLED_APPS:
             if not settings.MAP_BASELAYERS[0]['source']['url'] in source_urls:
@@ -266,29 +295,28 @@ class GXPMapBase(object):
                     str(int(keys[-1]) + 1)] = settings.MAP_BASELAYERS[0]['source']
 
         def _base_source(source):
-            base_source = copy.deepcopy(source)
+            base_source = dict(source)
             for key in ["id", "baseParams", "title"]:
                 if key in base_source:
                     del base_source[key]
-            return base_source
+            return json.dumps(base_source, sort_keys=True)
 
+        base_sources = set(_base_source(source) for source in sources.values())
         for idx, lyr in enumerate(settings.MAP_BASELAYERS):
-            if _base_source(
-                    lyr["source"]) not in map(
-                    _base_source,
-                    sources.values()):
+            if _base_source(lyr["source"]) not in base_sources:
+                base_sources.add(_base_source(lyr["source"]))
                 sources[
                     str(int(max(sources.keys(), key=int)) + 1)] = lyr["source"]
 
         # adding remote services sources
         from geonode.services.models import Service
         index = int(max(sources.keys()))
-        for service in Service.objects.all():
+        for base_url, name in Service.objects.values_list('base_url', 'name'):
             remote_source = {
-                'url': service.base_url,
+                'url': base_url,
                 'remote': True,
                 'ptype': 'gxp_wmscsource',
-                'name': service.name
+                'name': name
             }
             index += 1
             sources[index] = remote_source
@@ -302,7 +330,8 @@ class GXPMapBase(object):
             'defaultSourceType': "gxp_wmscsource",
             'sources': sources,
             'map': {
-                'layers': [layer_config(l, user=user) for l in layers],
+                'layers': [layer_config(l, layer_source, user=user)
+                           for l, layer_source in zip(layers, layer_sources)],
                 'center': [self.center_x, self.center_y],
                 'projection': self.projection,
                 'zoom': self.zoom
@@ -316,11 +345,8 @@ class GXPMapBase(object):
         config["map"].update(_get_viewer_projection_info(self.projection))
 
         # Create user-specific cache of maplayer config
-        if self is not None:
-            cache.set("viewer_json_" +
-                      str(self.id) +
-                      "_" +
-                      str(0 if user is None else user.id), config)
+        if cache_key is not None:
+            cache.set(cache_key, config)
 
         return config
 
@@ -25,6 +25,7 @@ from django.utils import simplejson as json
 from django.db.models import Q
 from django.template.response import TemplateResponse
 
+from geonode.base.typeahead import search_typeahead
 from geonode.groups.models import GroupProfile
 
 
@@ -96,6 +97,26 @@ def ajax_lookup(request):
     )
 
 
+def typeahead(request):
+    """
+    Returns the resources, keywords, regions and users matching
+    the prefix given in the q parameter, the best first
+    """
+    query = request.GET.get('q', '')
+    try:
+        limit = max(1, min(int(request.GET.get('limit', 10)), 100))
+    except ValueError:
+        limit = 10
+    json_dict = {
+        'query': query,
+        'objects': search_typeahead(request.user, query, limit),
+    }
+    return HttpResponse(
+        content=json.dumps(json_dict),
+        mimetype='application/json'
+    )
+
+
 def err403(request):
     if not request.user.is_authenticated():
         return HttpResponseRedirect(